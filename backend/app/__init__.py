@@ -9,9 +9,10 @@ from .config import Config, TestingConfig
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from . import routing
 import os
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': routing.RoutingSession})
 
 """
     Create and configure an instance of the Flask application.
@@ -38,21 +39,52 @@ def create_app():
     
     CORS(app) 
 
+    routing.configure(app)
     db.init_app(app)
     Migrate(app, db)
+    from .seed import seed_command
+    app.cli.add_command(seed_command)
+    from .accounts import provision_command
+    app.cli.add_command(provision_command)
     
     jwt=JWTManager(app)
 
     # Import routes and models
     from .models import User  
+    from . import (compression, deletion, ics, identity, jsonprovider, likes, messaging, metrics,
+                   notifications, passwords, ratelimit, sharing, slowlog)
+    jsonprovider.init_app(app)
+    compression.init_app(app)
+    identity.init_app(app, jwt)
+    routing.init_app(app)
+    passwords.init_app(app)
+    ratelimit.init_app(app)
+    likes.init_app(app)
+    messaging.init_app(app)
+    metrics.init_app(app)
+    slowlog.init_app(app)
+    ics.init_app(app)
+    sharing.init_app(app)
+    deletion.init_app(app)
+    notifications.init_app(app)
     from .auth import auth  
     from .itineraryRoutes import itinerary
     from .socialRoutes import social
+    from .messageRoutes import messages
+    from .eventRoutes import events
+    from .calendarRoutes import calendar
+    from .shareRoutes import shared
+    from .adminRoutes import admin
 
     # Register the api Blueprint with the app
     app.register_blueprint(auth)
     app.register_blueprint(itinerary)
     app.register_blueprint(social)
+    app.register_blueprint(messages)
+    app.register_blueprint(events)
+    app.register_blueprint(calendar)
+    app.register_blueprint(shared)
+    app.register_blueprint(admin)
     
     return app
 
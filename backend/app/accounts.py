@@ -0,0 +1,164 @@
+"""
+This module creates user accounts, one at a time or in bulk.
+
+Uniqueness of usernames and email addresses is left to the database's unique
+constraints rather than checked with a query first, which would cost a round
+trip per field and still race with a concurrent signup. `conflicting_field`
+reads back which constraint a failed insert violated.
+
+Bulk provisioning, used by `flask provision-users` and the admin endpoint,
+hashes each batch's passwords in parallel in the hashing pool and writes the
+batch with one multi-row `INSERT ... ON CONFLICT DO NOTHING RETURNING`. Rows
+that clash with an existing account (or an earlier row) are skipped and
+reported instead of failing the whole batch.
+
+    flask provision-users users.csv --batch-size 500
+"""
+
+import csv
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_, select
+
+from . import db
+from .bulk import upsert_insert
+from .models import User
+from .passwords import pool
+
+DUPLICATE_MESSAGES = {
+    'email_address': "Email address already has a user",
+    'username': "Username already exists",
+}
+MAX_LENGTHS = {'username': 80, 'email_address': 120}
+
+
+def conflicting_field(error):
+    """
+    Return 'username' or 'email_address' for an `IntegrityError` raised by a
+    unique constraint on that column of `user`, or None for any other error.
+    """
+    # PostgreSQL names the constraint (user_email_address_key); SQLite names the column (user.email_address)
+    diagnostics = getattr(error.orig, 'diag', None)
+    text = getattr(diagnostics, 'constraint_name', None) or str(error.orig)
+    for field in ('email_address', 'username'):
+        if field in text:
+            return field
+    return None
+
+
+def validate_user(row):
+    """
+    Return the errors of one account to provision, as `{field: message}`.
+    """
+    errors = {}
+    for field in ('username', 'email_address', 'password'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value:
+            errors[field] = 'Missing'
+        elif len(value) > MAX_LENGTHS.get(field, len(value)):
+            errors[field] = f'Longer than {MAX_LENGTHS[field]} characters'
+    if 'email_address' not in errors and '@' not in row['email_address']:
+        errors['email_address'] = 'Not an email address'
+    return errors
+
+
+def _duplicate_reasons(rows):
+    """Tell, for rows whose insert was skipped, whether their username or their email address is taken."""
+    usernames = {row['username'] for row in rows}
+    emails = {row['email_address'] for row in rows}
+    taken = db.session.execute(select(User.username, User.email_address)
+                               .where(or_(User.username.in_(usernames), User.email_address.in_(emails)))).all()
+    taken_usernames = {username for username, _ in taken}
+    return [DUPLICATE_MESSAGES['username'] if row['username'] in taken_usernames
+            else DUPLICATE_MESSAGES['email_address'] for row in rows]
+
+
+def provision_batch(rows):
+    """
+    Create one batch of accounts in the current transaction.
+
+    Args:
+        rows (list): Dicts with `username`, `email_address` and `password`, already validated.
+
+    Returns:
+        tuple: `(created, skipped)`, the `{'id', 'username'}` of each new account and
+        the `{'username', 'error'}` of each row that clashed with an existing one.
+    """
+    hashes = pool.hash_many([row['password'] for row in rows])
+    values = [{'username': row['username'], 'email_address': row['email_address'], 'password_hash': password_hash}
+              for row, password_hash in zip(rows, hashes)]
+    statement = (upsert_insert(User)
+                 .on_conflict_do_nothing()
+                 .returning(User.id, User.username, User.email_address))
+    inserted = {(username, email_address): user_id
+                for user_id, username, email_address in db.session.execute(statement, values)}
+
+    # Rows are matched on both fields, since a row is also skipped when an earlier row of the batch took either
+    created, skipped = [], []
+    for row in rows:
+        user_id = inserted.pop((row['username'], row['email_address']), None)
+        if user_id is None:
+            skipped.append(row)
+        else:
+            created.append({'id': user_id, 'username': row['username']})
+    reasons = _duplicate_reasons(skipped) if skipped else []
+    return created, [{'username': row['username'], 'error': reason} for row, reason in zip(skipped, reasons)]
+
+
+def provision_users(rows, batch_size=None):
+    """
+    Create accounts in batches, committing after each one.
+
+    Yields:
+        tuple: `(created, skipped)` of each batch, see `provision_batch`.
+    """
+    batch_size = batch_size or current_app.config.get('BULK_PROVISION_BATCH_SIZE', 500)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield _commit_batch(batch)
+            batch = []
+    if batch:
+        yield _commit_batch(batch)
+
+
+def _commit_batch(rows):
+    try:
+        result = provision_batch(rows)
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+@click.command('provision-users')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', default=500, show_default=True, help='Accounts per INSERT statement.')
+@with_appcontext
+def provision_command(source, batch_size):
+    """Create the accounts listed in a CSV file with username, email_address and password columns."""
+    invalid = 0
+
+    def valid_rows():
+        nonlocal invalid
+        for line, row in enumerate(csv.DictReader(source), start=2):
+            errors = validate_user(row)
+            if errors:
+                invalid += 1
+                click.echo(f'line {line}: skipped, ' + ', '.join(f'{field}: {error}'
+                                                                for field, error in errors.items()), err=True)
+            else:
+                yield row
+
+    created = skipped = 0
+    for batch_created, batch_skipped in provision_users(valid_rows(), batch_size):
+        created += len(batch_created)
+        skipped += len(batch_skipped)
+        for row in batch_skipped:
+            click.echo(f"{row['username']}: skipped, {row['error']}", err=True)
+        click.echo(f'{created} accounts created')
+    click.echo(f'Done: {created} created, {skipped} already existed, {invalid} invalid')
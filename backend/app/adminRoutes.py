@@ -0,0 +1,61 @@
+import functools
+
+from flask import Blueprint, current_app, g, jsonify, request
+from app.accounts import provision_users, validate_user
+from flask_cors import CORS
+from flask_jwt_extended import jwt_required
+from sqlalchemy.exc import SQLAlchemyError
+
+admin = Blueprint('admin', __name__)
+CORS(admin)
+
+
+def admin_required(view):
+    """Allow only the users named in `ADMIN_USERNAMES`; must be applied after `jwt_required`."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if g.current_user.username not in current_app.config.get('ADMIN_USERNAMES', ()):
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+"""
+ROUTE FOR PROVISIONING USERS IN BULK
+"""
+@admin.route('/admin/users', methods=['POST'])
+@jwt_required()
+@admin_required
+def provision_user_accounts():
+    """
+    Endpoint creating many accounts at once, e.g. to onboard an organisation.
+    Takes `{"users": [{"username", "email_address", "password"}, ...]}`. Valid accounts are
+    inserted in batches; invalid ones and ones clashing with existing accounts are reported
+    per row and do not stop the others.
+    """
+    body = request.get_json(silent=True)
+    users = body.get('users') if isinstance(body, dict) else None
+    if not isinstance(users, list) or not users:
+        return jsonify({'error': 'Expected a non-empty list of users'}), 400
+    max_users = current_app.config.get('BULK_PROVISION_MAX_USERS', 1000)
+    if len(users) > max_users:
+        return jsonify({'error': f'At most {max_users} users per request'}), 413
+
+    valid, skipped = [], []
+    for index, row in enumerate(users):
+        errors = validate_user(row) if isinstance(row, dict) else {'user': 'Expected an object'}
+        if errors:
+            skipped.append({'index': index, 'errors': errors})
+        else:
+            valid.append(row)
+
+    created = []
+    try:
+        for batch_created, batch_skipped in provision_users(valid):
+            created.extend(batch_created)
+            skipped.extend(batch_skipped)
+    except SQLAlchemyError:
+        current_app.logger.exception('Bulk provisioning failed after %d accounts', len(created))
+        return jsonify({'error': 'Database error', 'created': created}), 500
+
+    return jsonify({'created': created, 'skipped': skipped}), 201 if created else 200
@@ -0,0 +1,170 @@
+"""
+This module serves the app over ASGI, for example with
+
+    uvicorn --factory app.asgi:create_asgi_app --workers 4
+
+In this mode `GET /itineraries` and `GET /get_profile`, the most frequent
+requests, run as coroutines on async SQLAlchemy sessions (see `app.asyncdb`),
+so one worker keeps many of them waiting on the database without a thread
+each. They build the same statements as their WSGI routes and run inside a
+normal Flask request context, so token checks, the identity cache, replica
+routing, conditional requests and after-request hooks (CORS, compression)
+behave the same.
+
+Every other request, including streamed listings, is handed to the unchanged
+Flask app on a thread pool. The WSGI entry point is unaffected: `flask run` and
+WSGI servers keep serving every blueprint synchronously.
+
+This mode needs the optional asgiref package (3.3.2 or later, for
+`ThreadSensitiveContext`), an ASGI server and the async driver of the database
+(asyncpg or aiosqlite).
+"""
+
+import io
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import g, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from . import create_app
+from .asyncdb import async_db
+from .conditional import is_fresh, not_modified, user_etag
+from .identity import forget_user
+from .itineraryRoutes import PAGE_KEY_COLUMNS, listing_statement, page_keys, with_page_headers
+from .models import Itinerary, User
+
+
+async def _run_wsgi(flask_app, scope, receive, send):
+    """
+    Hand a request to the Flask app. asgiref runs every WSGI call on one shared
+    thread; a `ThreadSensitiveContext` per request gives each call a thread of
+    its own, so a slow request does not hold up the others.
+    """
+    async with ThreadSensitiveContext():
+        await WsgiToAsgiInstance(flask_app)(scope, receive, send)
+
+
+async def get_user_profile(session, user, identity):
+    version = await session.scalar(select(User.version).where(User.id == user.id))
+    etag = user_etag(user.id, version)
+    if is_fresh(etag):
+        return not_modified(etag)
+
+    if version != user.version:
+        user = await session.get(User, user.id, populate_existing=True)
+        forget_user(identity)
+
+    response = jsonify({'user': user.serialize()})
+    response.set_etag(etag)
+    return response, 200
+
+
+async def get_or_list_itineraries(session, user, identity):
+    try:
+        statement, limit, ranked = listing_statement(user.id, request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    keys = (await session.execute(statement.with_only_columns(*PAGE_KEY_COLUMNS).limit(limit + 1))).all()
+    keys, next_cursor, etag = page_keys(keys, limit, ranked, False, False,
+                                        single=bool(request.args.get('id')))
+
+    if not keys and not request.args.get('cursor'):
+        return jsonify({'error': 'No itineraries found'}), 404
+
+    if is_fresh(etag):
+        return not_modified(etag)
+
+    itineraries = await session.scalars(statement.options(selectinload(Itinerary.events)).limit(limit))
+    response = jsonify([itinerary.serialize() for itinerary in itineraries])
+    return with_page_headers(response, etag, next_cursor), 200
+
+
+# Endpoints served natively, keyed by the endpoint name of their WSGI route
+ASYNC_VIEWS = {
+    'auth.get_user_profile': get_user_profile,
+    'itinerary.get_or_list_itineraries': get_or_list_itineraries,
+}
+
+
+def _async_view():
+    """Return the async view for the current request, or None to hand it to Flask."""
+    if request.endpoint == 'itinerary.get_or_list_itineraries' and (
+            request.args.get('format') == 'ndjson' or request.args.get('stream') == 'true'):
+        return None
+    return ASYNC_VIEWS.get(request.endpoint)
+
+
+class AsyncApp:
+    """ASGI application serving `ASYNC_VIEWS` natively and everything else through Flask."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await _run_wsgi(self.flask_app, scope, receive, send)
+
+        # Only bodyless requests are served natively, so the environ can be built without reading one
+        adapter = WsgiToAsgiInstance(self.flask_app)
+        adapter.scope = scope
+        environ = adapter.build_environ(scope, io.BytesIO())
+        with self.flask_app.request_context(environ):
+            view = _async_view()
+            response = await self._dispatch(view) if view is not None else None
+
+        if response is None:
+            return await _run_wsgi(self.flask_app, scope, receive, send)
+
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body',
+                    'body': b'' if scope['method'] == 'HEAD' else response.get_data()})
+
+    async def _dispatch(self, view):
+        """Run an async view the way Flask runs a sync one, error handlers and hooks included."""
+        app = self.flask_app
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is not None:
+                    return app.process_response(app.make_response(rv))
+                # The same checks as @jwt_required(), including the identity cache's user loader. A cache
+                # miss queries the sync session, so it runs on a thread instead of blocking the event loop.
+                await sync_to_async(verify_jwt_in_request, thread_sensitive=False)()
+                async with async_db.session() as session:
+                    rv = await view(session, g.current_user, g.jwt_identity)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            return app.process_response(app.make_response(rv))
+        except Exception as e:
+            return app.handle_exception(e)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app():
+    """
+    Create the Flask app and wrap it for an ASGI server.
+
+    Returns:
+        AsyncApp: The ASGI application.
+    """
+    flask_app = create_app()
+    async_db.init_app(flask_app)
+    return AsyncApp(flask_app)
@@ -0,0 +1,69 @@
+"""
+This module provides async SQLAlchemy sessions for the ASGI entry point.
+
+The async engines are built from the same config as the sync ones: the database
+URL is switched to its async driver (asyncpg for PostgreSQL, aiosqlite for
+SQLite), the pool is sized by the same `DB_*` settings, and when a replica is
+configured reads are routed to it under the same rules as `RoutingSession`.
+The drivers are only imported when `init_app` runs, so they stay optional for
+WSGI deployments.
+"""
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from .routing import REPLICA, engine_options, reads_from_replica
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+
+def async_url(url):
+    """Return `url` with its driver replaced by the dialect's async driver."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(url, config):
+    options = engine_options(url, config)
+    if 'connect_args' in options:
+        # asyncpg takes server settings instead of libpq's `options` string
+        timeout = int(config['DB_STATEMENT_TIMEOUT_MS'])
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    return options
+
+
+class AsyncDatabase:
+    """Async engines for the primary and, optionally, the replica."""
+
+    def __init__(self):
+        self.engines = {}
+
+    def init_app(self, app):
+        config = app.config
+        url = config['SQLALCHEMY_DATABASE_URI']
+        self.engines[None] = create_async_engine(async_url(url), **async_engine_options(url, config))
+
+        replica_url = config.get('SQLALCHEMY_REPLICA_URI')
+        if replica_url:
+            self.engines[REPLICA] = create_async_engine(async_url(replica_url),
+                                                        **async_engine_options(replica_url, config))
+
+    def session(self):
+        """
+        Open a session on the engine that should serve the current request:
+        the replica for reads that allow it, the primary otherwise.
+        """
+        engine = self.engines[None]
+        if REPLICA in self.engines and reads_from_replica():
+            engine = self.engines[REPLICA]
+        return AsyncSession(engine, expire_on_commit=False)
+
+    async def dispose(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+
+
+async_db = AsyncDatabase()
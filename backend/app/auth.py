@@ -1,7 +1,17 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, g, jsonify, request
 from app.models import db, User
+from app import follows
+from app.accounts import DUPLICATE_MESSAGES, conflicting_field
+from app.identity import forget_user
+from app.routing import mark_written
+from app.passwords import HashingBusy
+from app.ratelimit import rate_limited
+from app.deletion import tombstone_user, worker
+from app.conditional import is_fresh, not_modified, user_etag
 from flask_cors import CORS
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 import traceback
 
 
@@ -12,33 +22,38 @@ CORS(auth)
 
 # ROUTE REGISTERING A NEW USER
 @auth.route('/register', methods=['POST'])
+@rate_limited('register')
 def register_new_user():
     try:
         username = request.json.get('username')
         email_address = request.json.get('email_address')
         password = request.json.get('password')
 
-        print(username, email_address, password)
-        
         if not username or not password or not email_address:
             return jsonify({'error': "Missing username or password or email address"}), 400
         
-        if User.query.filter_by(email_address=email_address).first():
-            return jsonify({'error': "Email address already has a user"}), 409
-        
-        if User.query.filter_by(username=username).first():
-            return jsonify({'error': "Username already exists"}), 409
-        
+        # One INSERT; the unique constraints on username and email address catch duplicates, even concurrent ones
         user = User(username=username, email_address=email_address)
         user.set_password(password)
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            field = conflicting_field(e)
+            if field is None:
+                raise
+            return jsonify({'error': DUPLICATE_MESSAGES[field]}), 409
+        mark_written(username)
         
         return jsonify({'message': "User created successfully"}), 201
     
     except KeyError:
         return jsonify({'error': "Missing username, password, or email address"}), 400
     
+    except HashingBusy:
+        raise
+    
     except Exception as e:
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
@@ -46,6 +61,7 @@ def register_new_user():
         
 # ROUTE FOR LOGGING IN A USER
 @auth.route('/login', methods=['POST'])
+@rate_limited('login')
 def login_user():
     try:
         username = request.json.get('username')
@@ -62,6 +78,15 @@ def login_user():
         if not user.check_password(password):
             return jsonify({'error': "Incorrect password"}), 401
         
+        # Upgrade legacy or outdated hashes now that we know the plaintext
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+            forget_user(username)
+        
+        # A new session's first reads go to the primary, in case the account is too new for the replica
+        mark_written(username)
+        
         # Assuming you are using JWT for token generation
         access_token = create_access_token(identity=username)
         return jsonify({'message': "Login successful", 'access_token': access_token}), 200
@@ -69,6 +94,9 @@ def login_user():
     except KeyError:
         return jsonify({'error': "Missing username or password"}), 400
     
+    except HashingBusy:
+        raise
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -83,18 +111,23 @@ def logout_user():
 @auth.route('/get_profile', methods=['GET'])
 @jwt_required()
 def get_user_profile():
-    try:
-        current_user = get_jwt_identity()
-        user = User.query.filter_by(username=current_user).first()
-        
-        if not user:
-            return jsonify({'error': "User does not exist"}), 404
-    
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    
+    user = g.current_user
+
+    # Only the version is read to answer If-None-Match
+    version = db.session.scalar(select(User.version).where(User.id == user.id))
+    etag = user_etag(user.id, version)
+    if is_fresh(etag):
+        return not_modified(etag)
+
+    if version != user.version:
+        # The cached user is behind the database, e.g. it was changed through another worker
+        db.session.refresh(user)
+        forget_user(get_jwt_identity())
+
     user_data = user.serialize()
-    return jsonify({'user': user_data}), 200
+    response = jsonify({'user': user_data})
+    response.set_etag(etag)
+    return response, 200
     
 
 # ROUTE FOR UPDATING A USER'S PROFILE
@@ -102,18 +135,27 @@ def get_user_profile():
 @jwt_required()
 def update_profile():
     current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    print("Current User:", current_user)
-    
-    if not user:
-        return jsonify({"error" : "User does not exist"}), 404
-    
+    user = g.current_user
+
     data = request.get_json()
-    print("Data:", data)
+    is_private = data.get('is_private', user.is_private)
+    if not isinstance(is_private, bool):
+        return jsonify({'error': 'is_private must be true or false'}), 400
+
     user.email_address = data.get('email_address', user.email_address)
     user.username = data.get('username', user.username)
+    # Requests waiting on a private account would otherwise never be answered once it goes public
+    accepted = follows.accept_all(user.id) if user.is_private and not is_private else []
+    user.is_private = is_private
     
     db.session.commit()
+    forget_user(current_user)
+    forget_user(user.username)
+    if accepted:
+        # Their cached profiles carry following counts
+        for username in db.session.scalars(select(User.username).where(User.id.in_(accepted))):
+            forget_user(username)
+    mark_written(user.username)
     return jsonify({"message": "User updated successfully"}), 200
 
 
@@ -122,12 +164,7 @@ def update_profile():
 @jwt_required()
 def change_password():
     current_user = get_jwt_identity()
-    print("Current User:", current_user)
-
-    user = User.query.filter_by(username=current_user).first()
-
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    user = g.current_user
 
     data = request.get_json()
     current_password = data.get('current_password')
@@ -147,6 +184,7 @@ def change_password():
 
     user.set_password(new_password)
     db.session.commit()
+    forget_user(current_user)
 
     return jsonify({'message': 'Password updated successfully'}), 200
 
@@ -156,13 +194,16 @@ def change_password():
 @jwt_required()
 def delete_account():
     current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
 
-    db.session.delete(user)
-    db.session.commit()
+    # The account is hidden now and its rows are removed in the background
+    try:
+        job = tombstone_user(g.current_user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    forget_user(current_user)
+    worker.notify()
 
-    return jsonify({'message': 'Account deleted successfully'}), 200
+    return jsonify({'message': 'Account scheduled for deletion', 'job': job.serialize()}), 202
 
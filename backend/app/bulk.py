@@ -0,0 +1,86 @@
+"""
+This module writes many rows with one statement per batch.
+
+PostgreSQL gets COPY (through psycopg 3 or psycopg2); other databases get a
+DBAPI `executemany` of a plain INSERT. Rows are tuples in the order of
+`columns` and are passed to the driver as they are, so callers validate and
+convert values first. Writes go through the given SQLAlchemy connection and
+so take part in its transaction.
+
+`upsert_insert` builds the dialect-specific INSERT that supports
+`ON CONFLICT`, for the callers that skip or merge duplicate rows.
+"""
+
+import csv
+import io
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import db
+
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert_insert(table, dialect=None):
+    """
+    Return an INSERT into `table` (a model or Table) that supports `on_conflict_do_nothing`
+    and `on_conflict_do_update`.
+
+    Args:
+        dialect (str): Dialect name; defaults to that of the primary engine.
+
+    Raises:
+        NotImplementedError: On databases without `ON CONFLICT`.
+    """
+    dialect = dialect or db.engine.dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        raise NotImplementedError(f'ON CONFLICT inserts are not implemented for {dialect}')
+    return UPSERT_DIALECTS[dialect](table)
+
+
+def copy_rows(connection, table_name, columns, rows):
+    """Write rows with PostgreSQL COPY on the connection's DBAPI connection."""
+    quote = connection.dialect.identifier_preparer.quote
+    statement = 'COPY {} ({}) FROM STDIN'.format(quote(table_name), ', '.join(quote(column) for column in columns))
+    dbapi_connection = connection.connection.driver_connection
+
+    with dbapi_connection.cursor() as cursor:
+        if hasattr(cursor, 'copy'):
+            # psycopg 3
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            # psycopg2
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(statement + ' WITH (FORMAT csv)', buffer)
+
+
+def insert_rows(connection, table_name, columns, rows):
+    """Write rows with one `executemany` of a plain INSERT."""
+    dialect = connection.dialect
+    quote = dialect.identifier_preparer.quote
+    placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+    statement = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(table_name), ', '.join(quote(column) for column in columns), ', '.join([placeholder] * len(columns)))
+    connection.exec_driver_sql(statement, list(rows))
+
+
+def write_rows(connection, table_name, columns, rows):
+    """
+    Write a batch of rows through the fastest bulk path of the connection's database.
+
+    Args:
+        connection: A SQLAlchemy `Connection`, e.g. `db.session.connection()`.
+        table_name (str): Target table.
+        columns (tuple): Column names, in the order of each row's values.
+        rows (list): Tuples of values.
+    """
+    if not rows:
+        return
+    if connection.dialect.name == 'postgresql':
+        copy_rows(connection, table_name, columns, rows)
+    else:
+        insert_rows(connection, table_name, columns, rows)
@@ -0,0 +1,57 @@
+"""
+This module contains the in-process caches shared by the rest of the app.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries also expire `ttl` seconds after
+    they were stored.
+
+    Args:
+        maxsize (int): Maximum number of entries kept; the least recently used is evicted first.
+        ttl (float): Seconds an entry stays valid.
+        timer (callable): Clock returning seconds, overridable for tests.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, self.timer() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,124 @@
+from flask import Blueprint, current_app, g, jsonify, url_for
+from app.models import db, DeletionJob, Event, Itinerary, User
+from app.conditional import collection_etag, is_fresh, itinerary_etag, not_modified
+from app.identity import forget_user
+from app.ics import calendar_response, feed_claims, feed_token, render_calendar
+from flask_cors import CORS
+from flask_jwt_extended import jwt_required
+from sqlalchemy import func, select, update
+
+calendar = Blueprint('calendar', __name__)
+CORS(calendar)
+
+EVENT_COLUMNS = (Event.id, Event.time_of_event, Event.ends_at, Event.event_name, Event.event_description,
+                 Event.event_location, Event.event_address, Event.event_city, Event.event_state,
+                 Event.latitude, Event.longitude)
+
+
+def _rows(statement):
+    return db.session.execute(statement.order_by(Event.time_of_event, Event.id)
+                              .execution_options(yield_per=current_app.config.get('ICS_BATCH_SIZE', 500)))
+
+
+def _subscription(user_id, version):
+    url = url_for('calendar.get_calendar_feed', token=feed_token(user_id, version), _external=True)
+    return jsonify({'url': url, 'webcal_url': 'webcal://' + url.split('://', 1)[1]}), 200
+
+
+"""
+ROUTE FOR EXPORTING AN ITINERARY AS ICALENDAR
+"""
+@calendar.route('/itineraries/<int:itinerary_id>.ics', methods=['GET'])
+@jwt_required()
+def export_itinerary(itinerary_id):
+    """
+    Endpoint returning one of the user's itineraries as an iCalendar file with a VEVENT per event.
+    Answers `If-None-Match`/`If-Modified-Since` with 304 after reading only the itinerary's version.
+    """
+    itinerary = db.session.execute(
+        select(Itinerary.id, Itinerary.itinerary_name, Itinerary.version,
+               func.coalesce(Itinerary.updated_at, Itinerary.created_at).label('modified'))
+        .where(Itinerary.id == itinerary_id, Itinerary.user_id == g.current_user_id)).first()
+    if itinerary is None:
+        return jsonify({'error': 'Itinerary not found'}), 404
+
+    etag = itinerary_etag(itinerary.id, itinerary.version) + '-ics'
+    if is_fresh(etag, itinerary.modified):
+        return not_modified(etag, itinerary.modified)
+
+    def render():
+        rows = _rows(select(*EVENT_COLUMNS).where(Event.itinerary_id == itinerary.id))
+        return render_calendar(itinerary.itinerary_name, rows, itinerary.modified)
+
+    return calendar_response(etag, render, etag, itinerary.modified, f'itinerary-{itinerary.id}.ics')
+
+
+"""
+ROUTE FOR GETTING THE URL OF THE USER'S CALENDAR SUBSCRIPTION
+"""
+@calendar.route('/calendar/subscription', methods=['GET'])
+@jwt_required()
+def get_calendar_subscription():
+    """
+    Endpoint returning the secret URL of a calendar feed with the events of all of the user's
+    itineraries, for calendar apps to subscribe to. Anyone with the URL can read the feed.
+    """
+    # Read from the database, not the identity cache, so a rotated URL is never handed out again
+    version = db.session.scalar(select(User.calendar_token_version).where(User.id == g.current_user_id))
+    return _subscription(g.current_user_id, version)
+
+
+"""
+ROUTE FOR REVOKING THE URL OF THE USER'S CALENDAR SUBSCRIPTION
+"""
+@calendar.route('/calendar/subscription/rotate', methods=['POST'])
+@jwt_required()
+def rotate_calendar_subscription():
+    """
+    Endpoint revoking the user's calendar feed URL, e.g. after it leaked, and returning a new one.
+    """
+    version = db.session.scalar(update(User).where(User.id == g.current_user_id)
+                                .values(calendar_token_version=User.calendar_token_version + 1)
+                                .returning(User.calendar_token_version))
+    db.session.commit()
+    forget_user(g.jwt_identity)
+    return _subscription(g.current_user_id, version)
+
+
+"""
+ROUTE FOR THE CALENDAR SUBSCRIPTION FEED
+"""
+@calendar.route('/calendar/<token>.ics', methods=['GET'])
+def get_calendar_feed(token):
+    """
+    Endpoint serving a user's subscription feed, authenticated by the signed token in its URL.
+    Its ETag covers the id and version of every itinerary of the user, so polls are answered
+    with 304 from the itinerary index while nothing changed.
+    """
+    claims = feed_claims(token)
+    user = db.session.get(User, claims[0]) if claims is not None else None
+    if user is None or user.calendar_token_version != claims[1]:
+        return jsonify({'error': 'Calendar not found'}), 404
+
+    itineraries = db.session.execute(
+        select(Itinerary.id, Itinerary.version, func.coalesce(Itinerary.updated_at, Itinerary.created_at))
+        .where(Itinerary.user_id == user.id).order_by(Itinerary.id)).all()
+    etag = collection_etag(((row[0], row[1]) for row in itineraries), 'ics', user.username)
+    # A deleted itinerary leaves no row behind to date the change, but its deletion job does
+    deleted = db.session.scalar(select(func.max(DeletionJob.created_at))
+                                .where(DeletionJob.requested_by == user.id,
+                                       DeletionJob.target_type == DeletionJob.ITINERARY))
+    modified = max((row[2] for row in itineraries if row[2] is not None), default=user.created_at)
+    if deleted is not None:
+        modified = max(modified, deleted)
+    if is_fresh(etag, modified):
+        return not_modified(etag, modified)
+
+    def render():
+        rows = _rows(select(*EVENT_COLUMNS, Itinerary.itinerary_name)
+                     .join(Itinerary, Itinerary.id == Event.itinerary_id)
+                     .where(Itinerary.user_id == user.id))
+        return render_calendar(f"{user.username}'s itineraries", rows, modified,
+                               current_app.config.get('ICS_REFRESH_INTERVAL', 3600))
+
+    return calendar_response(('feed', etag), render, etag, modified, 'nomad.ics')
@@ -0,0 +1,69 @@
+"""
+This module compresses large responses.
+
+Responses whose body is at least `COMPRESS_MIN_SIZE` bytes and whose content
+type is listed in `COMPRESS_MIMETYPES` are encoded with Brotli when the client
+accepts it and the `brotli` package is installed, and with gzip otherwise.
+Small bodies are left alone since compressing them costs more CPU than it
+saves on the wire. Streamed responses are never buffered for compression.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+DEFAULT_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/calendar')
+
+
+def choose_encoding(accept_encodings):
+    """Return the best encoding the client accepts, or None."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        # Brotli's quality runs 0-11 rather than gzip's 1-9
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def init_app(app):
+    """
+    Register the compression hook. It is disabled when `COMPRESS_MIN_SIZE` is 0.
+    """
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    mimetypes = set(app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES))
+
+    if not min_size:
+        return
+
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None or response.content_length is None or response.content_length < min_size:
+            return response
+
+        response.set_data(compress(response.get_data(), encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity representation, so the ETag can only be weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,89 @@
+"""
+This module contains helpers for conditional requests.
+
+Users and itineraries carry a `version` column that is bumped on every write.
+ETags are derived from it, so a GET can answer `If-None-Match` with a 304 after
+a version-only query, without loading or serializing the full rows, and a
+write can check `If-Match` before applying changes.
+"""
+
+import datetime
+import hashlib
+
+from flask import current_app, request
+
+# Appended to ETags by servers and proxies that compress responses, e.g. Apache's "-gzip"
+ENCODING_SUFFIXES = ('-gzip', '-br', '-deflate')
+
+
+def user_etag(user_id, version):
+    return f'user-{user_id}-{version}'
+
+
+def itinerary_etag(itinerary_id, version):
+    return f'itinerary-{itinerary_id}-{version}'
+
+
+def collection_etag(versions, *extra):
+    """
+    Build the ETag of a list from the `(id, version)` pairs of its rows and
+    anything else in the response, such as the next page cursor.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for row_id, version in versions:
+        digest.update(f'{row_id}:{version};'.encode())
+    for value in extra:
+        digest.update(f'|{value}'.encode())
+    return digest.hexdigest()
+
+
+def is_fresh(etag, last_modified=None):
+    """
+    Return True if the client's `If-None-Match` already covers `etag`. Weak
+    comparison is used, so ETags weakened by compression still match.
+
+    Without `If-None-Match`, an `If-Modified-Since` no older than `last_modified`
+    (a naive UTC datetime) also counts, as calendar clients often only send that.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return request.if_modified_since >= _http_date(last_modified)
+    return False
+
+
+def _http_date(value):
+    # HTTP dates have one-second resolution
+    return value.replace(microsecond=0, tzinfo=datetime.timezone.utc)
+
+
+def not_modified(etag, last_modified=None):
+    """Build an empty 304 response for `etag`."""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_date(last_modified)
+    return response
+
+
+def _without_encoding(tag):
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def precondition_failed(etag):
+    """
+    Return True if the request carries an `If-Match` header that does not
+    match `etag`, meaning the client's copy is out of date.
+
+    Clients send back the ETag they were given, which may have been weakened by
+    compression (see app.compression) or suffixed with the encoding by a proxy.
+    Only the version in the tag matters here, so those forms match too.
+    """
+    if not request.if_match:
+        return False
+    if request.if_match.star_tag:
+        return False
+    return not any(_without_encoding(tag) == etag for tag in request.if_match.as_set(include_weak=True))
@@ -0,0 +1,321 @@
+"""
+This module deletes accounts and itineraries in the background.
+
+Deleting an account in one transaction would remove thousands of itineraries
+and events while holding their locks, and could time out the request. Instead a
+deletion has two phases:
+
+1. Tombstone, inside the request: the row (and, for an account, each of its
+   itineraries) gets a `deleted_at` time and a `DeletionJob` is recorded in the
+   same transaction. The request returns 202 right away.
+2. Purge, in a worker thread: the job's dependent rows are deleted table by
+   table in batches of `DELETION_BATCH_SIZE`, committing after each batch
+   together with the job's progress, and finally the row itself.
+
+Every ORM select skips tombstoned users and itineraries, including those
+joined into a query, so the deleted data disappears from every read as soon as
+the first phase commits. Statements that must see them pass the
+`include_deleted` execution option.
+
+Jobs are claimed with a lease, so any number of processes can run workers: a
+job whose worker died is picked up again once its lease runs out, and resumes
+at the step it had reached. Each batch deletes whatever rows still match, so
+repeating one is harmless. Denormalized counts of other rows (like counts,
+follower counts) are adjusted as the edges behind them are deleted.
+"""
+
+import datetime
+import os
+import threading
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import and_, delete, event, or_, select, tuple_, update
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from . import db
+from .likes import counters
+from .models import (Comments, DeletionJob, DirectMessages, Event, FeedEntry, Followers, Itinerary, ItineraryShare,
+                     LikeCounter, Likes, Locations, Notification, User)
+from .sharing import invalidate
+
+MAX_ATTEMPTS = 5
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _skip_tombstoned(state):
+    if (state.is_select and not state.is_column_load and not state.is_relationship_load
+            and not state.execution_options.get('include_deleted', False)):
+        state.statement = state.statement.options(
+            with_loader_criteria(User, User.deleted_at.is_(None), include_aliases=True),
+            with_loader_criteria(Itinerary, Itinerary.deleted_at.is_(None), include_aliases=True),
+        )
+
+
+def tombstone_itinerary(itinerary, requested_by):
+    """
+    Hide an itinerary and schedule its removal. Runs inside the caller's transaction.
+
+    Returns:
+        DeletionJob: The job that will remove it.
+    """
+    itinerary.deleted_at = datetime.datetime.utcnow()
+    job = DeletionJob(target_type=DeletionJob.ITINERARY, target_id=itinerary.id, requested_by=requested_by)
+    db.session.add(job)
+    return job
+
+
+def tombstone_user(user_id):
+    """
+    Hide an account and all of its itineraries and schedule their removal.
+    Runs inside the caller's transaction.
+
+    Returns:
+        DeletionJob: The job that will remove them.
+    """
+    now = datetime.datetime.utcnow()
+    db.session.execute(update(User).where(User.id == user_id).values(deleted_at=now))
+    # One UPDATE of the itinerary rows, so other users' feeds, searches and links stop showing them now
+    hidden = db.session.execute(update(Itinerary)
+                                .where(Itinerary.user_id == user_id, Itinerary.deleted_at.is_(None))
+                                .values(deleted_at=now, version=Itinerary.version + 1)
+                                .returning(Itinerary.id)
+                                .execution_options(synchronize_session=False)).scalars().all()
+    for itinerary_id in hidden:
+        invalidate(itinerary_id)
+    job = DeletionJob(target_type=DeletionJob.USER, target_id=user_id, requested_by=user_id)
+    db.session.add(job)
+    return job
+
+
+def _delete_batch(model, condition, limit, returning=()):
+    """
+    Delete up to `limit` rows of `model` matching `condition`.
+
+    Returns:
+        The number of rows deleted, or the `returning` columns of each.
+    """
+    table = model.__table__
+    key = tuple_(*table.primary_key.columns) if len(table.primary_key.columns) > 1 else table.primary_key.columns[0]
+    batch = select(*table.primary_key.columns).where(condition).limit(limit)
+    statement = delete(table).where(key.in_(batch))
+    if returning:
+        return db.session.execute(statement.returning(*returning)).all()
+    return db.session.execute(statement).rowcount
+
+
+def _delete_likes_by(user_id, limit):
+    """
+    Delete a batch of the likes a user gave, taking them off the targets' counts. The
+    counts change only once the batch commits (see `CounterBuffer.add`), so a batch that
+    fails and is retried adjusts them once.
+    """
+    rows = _delete_batch(Likes, Likes.user_id == user_id, limit, (Likes.target_type, Likes.target_id))
+    for (target_type, target_id), removed in Counter(map(tuple, rows)).items():
+        counters.add(target_type, target_id, -removed)
+    return len(rows)
+
+
+def _delete_follows(user_id, limit, side):
+    """Delete a batch of a user's follow edges on one side, updating the other users' counts."""
+    if side == 'follower':
+        own, other, count = Followers.follower_id, Followers.followee_id, User.followers_count
+    else:
+        own, other, count = Followers.followee_id, Followers.follower_id, User.following_count
+    rows = _delete_batch(Followers, own == user_id, limit, (other, Followers.status))
+    removed = Counter(other_id for other_id, status in rows if status == Followers.ACCEPTED)
+    if removed:
+        db.session.execute(update(User.__table__)
+                           .where(User.__table__.c.id == db.bindparam('other_id'))
+                           .values({count.key: count - db.bindparam('removed')}),
+                           [{'other_id': other_id, 'removed': n} for other_id, n in removed.items()])
+    return len(rows)
+
+
+def _own_itineraries(user_id):
+    return select(Itinerary.__table__.c.id).where(Itinerary.__table__.c.user_id == user_id)
+
+
+def _own_comments(user_id):
+    return select(Comments.__table__.c.id).where(Comments.__table__.c.user_id == user_id)
+
+
+def _targets(model, target_type, ids):
+    return and_(model.target_type == target_type, model.target_id.in_(ids))
+
+
+# The tables emptied for each kind of job, in order: dependents before the rows they point at.
+# Jobs record the name of the step they are at, so steps may be added or reordered between releases.
+STEPS = {
+    DeletionJob.ITINERARY: {
+        'feed_entries': lambda target, limit: _delete_batch(FeedEntry, FeedEntry.itinerary_id == target, limit),
+        'likes': lambda target, limit: _delete_batch(Likes, _targets(Likes, Likes.ITINERARY, [target]), limit),
+        'like_counters': lambda target, limit: _delete_batch(
+            LikeCounter, _targets(LikeCounter, Likes.ITINERARY, [target]), limit),
+        'shares': lambda target, limit: _delete_batch(ItineraryShare, ItineraryShare.itinerary_id == target, limit),
+        'events': lambda target, limit: _delete_batch(Event, Event.itinerary_id == target, limit),
+        'itinerary': lambda target, limit: _delete_batch(Itinerary, Itinerary.id == target, limit),
+    },
+    DeletionJob.USER: {
+        'feed_entries': lambda target, limit: _delete_batch(FeedEntry, FeedEntry.owner_id == target, limit),
+        'feed_entries_authored': lambda target, limit: _delete_batch(FeedEntry, FeedEntry.author_id == target, limit),
+        'likes_given': _delete_likes_by,
+        'itinerary_likes': lambda target, limit: _delete_batch(
+            Likes, _targets(Likes, Likes.ITINERARY, _own_itineraries(target)), limit),
+        'comment_likes': lambda target, limit: _delete_batch(
+            Likes, _targets(Likes, Likes.COMMENT, _own_comments(target)), limit),
+        'itinerary_like_counters': lambda target, limit: _delete_batch(
+            LikeCounter, _targets(LikeCounter, Likes.ITINERARY, _own_itineraries(target)), limit),
+        'comment_like_counters': lambda target, limit: _delete_batch(
+            LikeCounter, _targets(LikeCounter, Likes.COMMENT, _own_comments(target)), limit),
+        'shares': lambda target, limit: _delete_batch(ItineraryShare, or_(
+            ItineraryShare.itinerary_id.in_(_own_itineraries(target)), ItineraryShare.user_id == target,
+            ItineraryShare.shared_by == target), limit),
+        'events': lambda target, limit: _delete_batch(Event, Event.itinerary_id.in_(_own_itineraries(target)), limit),
+        'itineraries': lambda target, limit: _delete_batch(Itinerary, Itinerary.user_id == target, limit),
+        'following': lambda target, limit: _delete_follows(target, limit, 'follower'),
+        'followers': lambda target, limit: _delete_follows(target, limit, 'followee'),
+        'direct_messages': lambda target, limit: _delete_batch(
+            DirectMessages, or_(DirectMessages.sender_id == target, DirectMessages.recipient_id == target), limit),
+        'locations': lambda target, limit: _delete_batch(Locations, Locations.user_id == target, limit),
+        'notifications': lambda target, limit: _delete_batch(Notification, Notification.user_id == target, limit),
+        'comments': lambda target, limit: _delete_batch(Comments, Comments.user_id == target, limit),
+        'user': lambda target, limit: _delete_batch(User, User.id == target, limit),
+    },
+}
+
+
+class DeletionWorker:
+    """
+    Runs deletion jobs on a background thread of each process, waking up when a
+    job is scheduled in this process and every `interval` seconds to pick up
+    jobs from other processes or left behind by dead ones.
+
+    With `interval` set to 0 there is no thread and jobs run right after the
+    request that scheduled them, which keeps tests deterministic.
+    """
+
+    def __init__(self):
+        self.interval = 5.0
+        self.batch_size = 500
+        self.lease = datetime.timedelta(seconds=60)
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def configure(self, app):
+        self._app = app
+        self.interval = app.config.get('DELETION_POLL_INTERVAL', self.interval)
+        self.batch_size = app.config.get('DELETION_BATCH_SIZE', self.batch_size)
+        self.lease = datetime.timedelta(seconds=app.config.get('DELETION_LEASE_SECONDS', 60))
+
+    def notify(self):
+        """Tell the worker a job was committed. Call after the tombstoning transaction commits."""
+        if self.interval <= 0:
+            self.run_pending()
+            return
+        self._ensure_thread()
+        self._wake.set()
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='deletion-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with self._app.app_context():
+                    self.run_pending()
+            except Exception:
+                self._app.logger.exception('Deletion worker failed')
+
+    def _claimable(self, now):
+        return or_(DeletionJob.status == DeletionJob.PENDING,
+                   and_(DeletionJob.status == DeletionJob.RUNNING, DeletionJob.lease_until < now))
+
+    def claim(self):
+        """
+        Take the oldest job that is pending or whose worker's lease expired.
+
+        Returns:
+            DeletionJob: The claimed job, or None if there is nothing to do.
+        """
+        while True:
+            now = datetime.datetime.utcnow()
+            job_id = db.session.scalar(select(DeletionJob.id).where(self._claimable(now))
+                                       .order_by(DeletionJob.id).limit(1))
+            if job_id is None:
+                db.session.rollback()
+                return None
+            # Conditional on the job still being claimable, so two workers never both take it
+            claimed = db.session.execute(
+                update(DeletionJob)
+                .where(DeletionJob.id == job_id, self._claimable(now))
+                .values(status=DeletionJob.RUNNING, lease_until=now + self.lease, attempts=DeletionJob.attempts + 1)
+                .execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(DeletionJob, job_id, populate_existing=True)
+
+    def process(self, job):
+        """Run a claimed job to completion, committing after every batch."""
+        steps = STEPS[job.target_type]
+        names = list(steps)
+        try:
+            # A job resumed after its worker died repeats the step it was at, which is harmless
+            start = names.index(job.step) if job.step is not None else 0
+            for name in names[start:]:
+                job.step = name
+                while True:
+                    deleted = steps[name](job.target_id, self.batch_size)
+                    job.rows_deleted += deleted
+                    job.lease_until = datetime.datetime.utcnow() + self.lease
+                    db.session.commit()
+                    if deleted < self.batch_size:
+                        break
+        except Exception as e:
+            db.session.rollback()
+            job.last_error = str(e)[:1000]
+            # Otherwise the job stays running and is retried once its lease expires
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = DeletionJob.FAILED
+            db.session.commit()
+            raise
+
+        job.status = DeletionJob.DONE
+        job.finished_at = datetime.datetime.utcnow()
+        job.lease_until = None
+        db.session.commit()
+
+    def run_pending(self, max_jobs=None):
+        """Claim and run jobs until there are none left (or `max_jobs` ran). Returns the number run."""
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            job = self.claim()
+            if job is None:
+                break
+            try:
+                self.process(job)
+            except Exception:
+                current_app.logger.exception('Deletion job %s failed', job.id)
+            done += 1
+        return done
+
+
+worker = DeletionWorker()
+
+
+def init_app(app):
+    """Configure the deletion worker from the app config."""
+    worker.configure(app)
@@ -0,0 +1,175 @@
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+from app.models import db, Event, Itinerary
+from app.geo import nearest_events, validate_coordinates
+from app.ingest import REQUIRED_FIELDS, TIME_FORMAT, touch_itinerary, validate_event
+from app.pagination import parse_limit
+from app.schedule import overlapping_events, sweep_conflicts
+from flask_cors import CORS
+from flask_jwt_extended import jwt_required
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+
+events = Blueprint('events', __name__)
+CORS(events)
+
+DEFAULT_RADIUS_KM = 5.0
+MAX_RADIUS_KM = 500.0
+
+"""
+ROUTE FOR FINDING EVENTS NEAR A POINT
+"""
+@events.route('/events/nearby', methods=['GET'])
+@jwt_required()
+def get_nearby_events():
+    """
+    Endpoint returning the events within `radius` kilometres (default 5) of `lat`/`lon`, nearest
+    first, each with its `distance_km`. Only events of the current user's itineraries and of
+    public accounts are included. `limit` caps the number of results.
+    """
+    try:
+        latitude, longitude = validate_coordinates(request.args.get('lat'), request.args.get('lon'))
+        radius = float(request.args.get('radius', DEFAULT_RADIUS_KM))
+        limit = parse_limit(request.args.get('limit'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'lat and lon are required and must be valid coordinates'}), 400
+
+    if not 0 < radius <= MAX_RADIUS_KM:
+        return jsonify({'error': f'radius must be between 0 and {MAX_RADIUS_KM:g} km'}), 400
+
+    nearest = nearest_events(latitude, longitude, radius, g.current_user_id, limit)
+    found = {event.id: event for event in db.session.scalars(
+        select(Event).where(Event.id.in_([event_id for _, event_id in nearest])))}
+
+    return jsonify([{**found[event_id].serialize(), 'distance_km': round(float(distance), 3)}
+                    for distance, event_id in nearest if event_id in found]), 200
+
+
+def _conflict_response(conflicts):
+    return jsonify({
+        'error': 'Event overlaps other events in your schedule',
+        'conflicts': [event.serialize() for event in conflicts],
+    }), 409
+
+
+def _allow_conflicts(data):
+    return data.get('allow_conflicts') in (True, 'true', '1')
+
+
+"""
+ROUTE FOR ADDING AN EVENT TO AN ITINERARY
+"""
+@events.route('/itineraries/<int:itinerary_id>/events', methods=['POST'])
+@jwt_required()
+def create_event(itinerary_id):
+    """
+    Endpoint to add one event to an itinerary. Takes the same fields as the bulk upload, plus an
+    optional `ends_at`. An event overlapping another of the user's events, in any itinerary, is
+    rejected with 409 and the conflicting events unless `allow_conflicts` is true.
+    """
+    itinerary = Itinerary.query.filter_by(id=itinerary_id, user_id=g.current_user_id).first()
+    if itinerary is None:
+        return jsonify({'error': 'Itinerary not found'}), 404
+
+    data = request.json or {}
+    try:
+        values = validate_event(data, itinerary.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not _allow_conflicts(data):
+        conflicts = overlapping_events(g.current_user_id, values['time_of_event'], values['ends_at'])
+        if conflicts:
+            return _conflict_response(conflicts)
+
+    try:
+        event = Event(**values)
+        db.session.add(event)
+        db.session.flush()
+        touch_itinerary(itinerary.id)
+        db.session.commit()
+        return jsonify({'message': 'Event created successfully', 'event': event.serialize()}), 201
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+
+"""
+ROUTE FOR UPDATING AN EVENT
+"""
+@events.route('/events/<int:event_id>', methods=['PUT'])
+@jwt_required()
+def update_event(event_id):
+    """
+    Endpoint to change some fields of one of the user's events. Changes that make it overlap
+    another event are rejected with 409 unless `allow_conflicts` is true.
+    """
+    event = db.session.scalar(select(Event).join(Itinerary, Itinerary.id == Event.itinerary_id)
+                              .where(Event.id == event_id, Itinerary.user_id == g.current_user_id))
+    if event is None:
+        return jsonify({'error': 'Event not found'}), 404
+
+    data = request.json or {}
+    current = {field: getattr(event, field) for field in REQUIRED_FIELDS + ('latitude', 'longitude')}
+    current['time_of_event'] = event.time_of_event.strftime(TIME_FORMAT) if event.time_of_event else None
+    current['ends_at'] = event.ends_at.strftime(TIME_FORMAT) if event.ends_at else None
+    try:
+        values = validate_event({**current, **data}, event.itinerary_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not _allow_conflicts(data):
+        conflicts = overlapping_events(g.current_user_id, values['time_of_event'], values['ends_at'],
+                                       exclude_id=event.id)
+        if conflicts:
+            return _conflict_response(conflicts)
+
+    try:
+        for field, value in values.items():
+            setattr(event, field, value)
+        touch_itinerary(event.itinerary_id)
+        db.session.commit()
+        return jsonify({'message': 'Event updated successfully', 'event': event.serialize()}), 200
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+
+"""
+ROUTE FOR LISTING OVERLAPPING EVENTS ACROSS THE USER'S ITINERARIES
+"""
+@events.route('/schedule/conflicts', methods=['GET'])
+@jwt_required()
+def get_schedule_conflicts():
+    """
+    Endpoint streaming every pair of the user's events that overlap, in time order, as a JSON
+    array (or NDJSON with `format=ndjson`) of `{first, second}` objects. `since` and `until`
+    (`YYYY-MM-DD HH:MM:SS`) restrict the time range. Events are read in start order in batches,
+    so the response can cover any number of events.
+    """
+    try:
+        since = request.args.get('since')
+        since = datetime.strptime(since, TIME_FORMAT) if since else None
+        until = request.args.get('until')
+        until = datetime.strptime(until, TIME_FORMAT) if until else None
+    except ValueError:
+        return jsonify({'error': 'Invalid since or until format'}), 400
+
+    ndjson = request.args.get('format') == 'ndjson'
+    pairs = sweep_conflicts(g.current_user_id, since, until)
+    return Response(stream_with_context(_stream_pairs(pairs, ndjson)),
+                    mimetype='application/x-ndjson' if ndjson else 'application/json')
+
+
+def _stream_pairs(pairs, ndjson):
+    dumps = current_app.json.dumps
+    if not ndjson:
+        yield '['
+    for index, (first, second) in enumerate(pairs):
+        item = dumps({'first': first, 'second': second})
+        if ndjson:
+            yield item + '\n'
+        else:
+            yield (',' if index else '') + item
+    if not ndjson:
+        yield ']'
@@ -0,0 +1,118 @@
+"""
+This module maintains the home feed: the itineraries created or updated by the
+users someone follows.
+
+Feeds are materialized with fan-out on write. When an itinerary is created or
+updated, one `FeedEntry` row per follower is written with a single
+`INSERT ... SELECT`, so a read is just a keyset scan of the reader's own rows.
+
+Fanning out is proportional to the author's follower count. Once an author has
+more than `FEED_FANOUT_LIMIT` followers they are switched to fan-out on read:
+their itineraries are no longer copied into timelines but are merged in when a
+follower reads the feed. Entries copied before the switch are left in place;
+the pulled side skips any itinerary the reader already has an entry for.
+"""
+
+import datetime
+import heapq
+
+from flask import current_app
+from sqlalchemy import delete, insert, literal, select
+from sqlalchemy.orm import selectinload
+
+from . import db
+from .models import FeedEntry, Followers, Itinerary, User
+from .pagination import encode_cursor, keyset_filter
+
+DEFAULT_FANOUT_LIMIT = 10000
+
+
+def fan_out(itinerary):
+    """
+    Publish a new or updated itinerary to its author's followers.
+
+    Runs inside the caller's transaction. Previous entries for the itinerary
+    are replaced, so an update moves it back to the top of each timeline.
+    """
+    author = db.session.get(User, itinerary.user_id)
+    if author is None or author.fanout_on_read:
+        return
+
+    if author.followers_count > current_app.config.get('FEED_FANOUT_LIMIT', DEFAULT_FANOUT_LIMIT):
+        # Too many followers to copy into every timeline; readers pull this author's itineraries instead
+        author.fanout_on_read = True
+        return
+
+    retract(itinerary.id)
+    followers = (select(Followers.follower_id,
+                        literal(itinerary.id),
+                        literal(author.id),
+                        literal(datetime.datetime.utcnow()))
+                 .where(Followers.followee_id == author.id, Followers.status == Followers.ACCEPTED))
+    db.session.execute(insert(FeedEntry).from_select(
+        ['owner_id', 'itinerary_id', 'author_id', 'created_at'], followers))
+
+
+def retract(itinerary_id):
+    """Remove an itinerary from every timeline, e.g. before it is deleted."""
+    db.session.execute(delete(FeedEntry).where(FeedEntry.itinerary_id == itinerary_id))
+
+
+def unsubscribe(owner_id, author_id):
+    """Remove an author's itineraries from one user's timeline after an unfollow."""
+    db.session.execute(delete(FeedEntry).where(FeedEntry.owner_id == owner_id, FeedEntry.author_id == author_id))
+
+
+def read_feed(user_id, cursor=None, limit=50):
+    """
+    Read one page of a user's home feed, newest first.
+
+    Merges the user's materialized entries with the recent itineraries of any
+    followed authors that use fan-out on read, then loads the page's
+    itineraries and their events with two queries.
+
+    Args:
+        user_id (int): The reader.
+        cursor (tuple): Decoded `(created_at, itinerary_id)` of the last item already seen.
+        limit (int): Page size.
+
+    Returns:
+        tuple: The list of `Itinerary` rows and the cursor for the next page (or None).
+    """
+    materialized = select(FeedEntry.created_at, FeedEntry.itinerary_id).where(FeedEntry.owner_id == user_id)
+    if cursor:
+        materialized = materialized.where(keyset_filter(FeedEntry.created_at, FeedEntry.itinerary_id, cursor))
+    materialized = materialized.order_by(FeedEntry.created_at.desc(), FeedEntry.itinerary_id.desc()).limit(limit + 1)
+    sources = [db.session.execute(materialized).all()]
+
+    pulled_authors = (select(Followers.followee_id)
+                      .join(User, User.id == Followers.followee_id)
+                      .where(Followers.follower_id == user_id,
+                             Followers.status == Followers.ACCEPTED,
+                             User.fanout_on_read.is_(True)))
+    # Entries fanned out before the author switched are read from the materialized side
+    already_materialized = select(FeedEntry.itinerary_id).where(FeedEntry.owner_id == user_id)
+    pulled = select(Itinerary.created_at, Itinerary.id).where(Itinerary.user_id.in_(pulled_authors),
+                                                              Itinerary.id.not_in(already_materialized))
+    if cursor:
+        pulled = pulled.where(keyset_filter(Itinerary.created_at, Itinerary.id, cursor))
+    pulled = pulled.order_by(Itinerary.created_at.desc(), Itinerary.id.desc()).limit(limit + 1)
+    sources.append(db.session.execute(pulled).all())
+
+    keys = []
+    seen = set()
+    for created_at, itinerary_id in heapq.merge(*sources, reverse=True):
+        if itinerary_id in seen:
+            continue
+        seen.add(itinerary_id)
+        keys.append((created_at, itinerary_id))
+        if len(keys) > limit:
+            break
+
+    next_cursor = encode_cursor(*keys[limit - 1]) if len(keys) > limit else None
+    keys = keys[:limit]
+
+    ids = [itinerary_id for _, itinerary_id in keys]
+    rows = Itinerary.query.options(selectinload(Itinerary.events)).filter(Itinerary.id.in_(ids)).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[itinerary_id] for itinerary_id in ids if itinerary_id in by_id], next_cursor
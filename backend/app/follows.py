@@ -0,0 +1,193 @@
+"""
+This module maintains the follow graph.
+
+Edges live in the `followers` table keyed `(follower_id, followee_id)`, with a
+reverse index for "who follows X". Follows of private accounts are stored as
+pending until accepted. Every change to an accepted edge also adjusts
+`User.followers_count` / `User.following_count` in the same transaction with an
+atomic `count = count + n` update, so profiles never need a `COUNT(*)`.
+
+All functions run inside the caller's transaction; the caller commits.
+"""
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .feed import unsubscribe
+from .models import Followers, User
+from .pagination import encode_cursor, keyset_filter
+
+MAX_CHECK_IDS = 1000
+
+
+class AlreadyFollowing(Exception):
+    """Raised when an edge between the two users already exists."""
+
+
+def _adjust_counts(follower_id, followee_id, delta):
+    db.session.execute(update(User).where(User.id == followee_id)
+                       .values(followers_count=User.followers_count + delta))
+    db.session.execute(update(User).where(User.id == follower_id)
+                       .values(following_count=User.following_count + delta))
+
+
+def follow(follower, followee):
+    """
+    Create an edge from `follower` to `followee`: accepted for public accounts,
+    pending for private ones.
+
+    Returns:
+        str: The new edge's status.
+
+    Raises:
+        AlreadyFollowing: If an edge (pending or accepted) already exists.
+    """
+    status = Followers.PENDING if followee.is_private else Followers.ACCEPTED
+    try:
+        # Relying on the primary key keeps concurrent duplicate follows from double counting
+        with db.session.begin_nested():
+            db.session.execute(insert(Followers).values(
+                follower_id=follower.id, followee_id=followee.id, status=status))
+    except IntegrityError:
+        raise AlreadyFollowing()
+
+    if status == Followers.ACCEPTED:
+        _adjust_counts(follower.id, followee.id, 1)
+    return status
+
+
+def unfollow(follower_id, followee_id):
+    """
+    Remove the edge from `follower_id` to `followee_id`, whatever its status.
+
+    Returns:
+        bool: False if there was no edge.
+    """
+    removed = db.session.execute(
+        delete(Followers)
+        .where(Followers.follower_id == follower_id, Followers.followee_id == followee_id)
+        .returning(Followers.status)
+    ).scalar()
+
+    if removed is None:
+        return False
+    if removed == Followers.ACCEPTED:
+        _adjust_counts(follower_id, followee_id, -1)
+        unsubscribe(follower_id, followee_id)
+    return True
+
+
+def accept(followee_id, follower_id):
+    """
+    Accept a pending follow request.
+
+    Returns:
+        bool: False if there was no pending request.
+    """
+    accepted = db.session.execute(
+        update(Followers)
+        .where(Followers.follower_id == follower_id,
+               Followers.followee_id == followee_id,
+               Followers.status == Followers.PENDING)
+        .values(status=Followers.ACCEPTED)
+    ).rowcount
+
+    if accepted:
+        _adjust_counts(follower_id, followee_id, 1)
+    return bool(accepted)
+
+
+def accept_all(followee_id):
+    """
+    Accept every pending follow request of `followee_id`, e.g. when the account goes public.
+
+    Returns:
+        list: The ids of the users whose requests were accepted.
+    """
+    accepted = db.session.scalars(
+        update(Followers)
+        .where(Followers.followee_id == followee_id, Followers.status == Followers.PENDING)
+        .values(status=Followers.ACCEPTED)
+        .returning(Followers.follower_id)
+    ).all()
+
+    if accepted:
+        db.session.execute(update(User).where(User.id == followee_id)
+                           .values(followers_count=User.followers_count + len(accepted)))
+        db.session.execute(update(User).where(User.id.in_(accepted))
+                           .values(following_count=User.following_count + 1))
+    return accepted
+
+
+def deny(followee_id, follower_id):
+    """
+    Deny a pending follow request.
+
+    Returns:
+        bool: False if there was no pending request.
+    """
+    return bool(db.session.execute(
+        delete(Followers)
+        .where(Followers.follower_id == follower_id,
+               Followers.followee_id == followee_id,
+               Followers.status == Followers.PENDING)
+    ).rowcount)
+
+
+def following_among(follower_id, user_ids):
+    """
+    Batch check which of `user_ids` are followed by `follower_id`, with one
+    primary key lookup per id in a single query.
+
+    Returns:
+        set: The ids `follower_id` has an accepted edge to.
+    """
+    return set(db.session.scalars(
+        select(Followers.followee_id)
+        .where(Followers.follower_id == follower_id,
+               Followers.followee_id.in_(user_ids),
+               Followers.status == Followers.ACCEPTED)
+    ))
+
+
+def can_view(viewer_id, owner_id):
+    """
+    Return True if `viewer_id` may see what `owner_id` posts: their own posts,
+    a public account's, or a private account's they have an accepted edge to.
+    """
+    if viewer_id == owner_id:
+        return True
+    owner = db.session.get(User, owner_id) if owner_id is not None else None
+    if owner is None:
+        return False
+    return not owner.is_private or owner_id in following_among(viewer_id, [owner_id])
+
+
+def list_edges(user_id, direction, status=Followers.ACCEPTED, cursor=None, limit=50):
+    """
+    Page through a user's followers (`direction='followers'`) or the users they
+    follow (`direction='following'`), newest edge first.
+
+    Returns:
+        tuple: A list of `(User, followed_at)` pairs and the next cursor (or None).
+    """
+    if direction == 'followers':
+        own_column, other_column = Followers.followee_id, Followers.follower_id
+    else:
+        own_column, other_column = Followers.follower_id, Followers.followee_id
+
+    query = (select(User, Followers.created_at)
+             .join(User, User.id == other_column)
+             .where(own_column == user_id, Followers.status == status))
+    if cursor:
+        query = query.where(keyset_filter(Followers.created_at, other_column, cursor))
+    query = query.order_by(Followers.created_at.desc(), other_column.desc()).limit(limit + 1)
+
+    rows = db.session.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        user, followed_at = rows[-1]
+        next_cursor = encode_cursor(followed_at, user.id)
+    return rows, next_cursor
@@ -0,0 +1,254 @@
+"""
+This module implements the spatial index and "near me" queries for events.
+
+Events and locations store `latitude`/`longitude` plus a `geohash` of them.
+Geohashes that share a prefix lie in the same cell, so the B-tree index on
+`geohash` turns a bounding box into a few range scans on any backend. On
+SQLite an R*Tree virtual table (`event_rtree`), kept in sync with `event` by
+triggers, answers the bounding box directly instead.
+
+A nearby query takes the candidates inside the box around the point and ranks
+them by exact haversine distance. Candidates are read in batches and each
+batch's distances are computed at once (vectorized with numpy when it is
+installed), so only the best `limit` rows are kept in memory.
+"""
+
+import heapq
+import math
+
+from sqlalchemy import DDL, Float, Integer, and_, column, event, or_, select, table
+
+from . import db
+from .models import Event, Itinerary, Locations, User
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - depends on the environment
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+# About 5 m x 5 m, finer than the coordinates people type in
+GEOHASH_PRECISION = 9
+# Most geohash cells a bounding box is split into before a coarser precision is used
+MAX_COVER_CELLS = 16
+CANDIDATE_BATCH_SIZE = 1000
+
+event_rtree = table(
+    'event_rtree',
+    column('id', Integer),
+    column('min_lat', Float),
+    column('max_lat', Float),
+    column('min_lon', Float),
+    column('max_lon', Float),
+)
+
+SQLITE_DDL = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS event_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)',
+    """CREATE TRIGGER IF NOT EXISTS event_rtree_ai AFTER INSERT ON event
+        WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO event_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_rtree_ad AFTER DELETE ON event BEGIN
+        DELETE FROM event_rtree WHERE id = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_rtree_au AFTER UPDATE OF latitude, longitude ON event BEGIN
+        DELETE FROM event_rtree WHERE id = old.id;
+        INSERT INTO event_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+]
+
+# Backfills the R*Tree from rows that existed before it
+SQLITE_BACKFILL = """INSERT INTO event_rtree
+    SELECT id, latitude, latitude, longitude, longitude FROM event
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL"""
+
+for statement in SQLITE_DDL:
+    event.listen(Event.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Event.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS event_rtree').execute_if(dialect='sqlite'))
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Return the geohash of a point."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the `(height, width)` in degrees of a geohash cell."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def validate_coordinates(latitude, longitude):
+    """
+    Parse a latitude/longitude pair.
+
+    Raises:
+        ValueError: If either value is not a number or out of range.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates out of range')
+    return latitude, longitude
+
+
+def set_geohash(target):
+    target.geohash = (encode(target.latitude, target.longitude)
+                      if target.latitude is not None and target.longitude is not None else None)
+
+
+for model in (Event, Locations):
+    event.listen(model, 'before_insert', lambda mapper, connection, target: set_geohash(target))
+    event.listen(model, 'before_update', lambda mapper, connection, target: set_geohash(target))
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """
+    Return the boxes `(min_lat, max_lat, min_lon, max_lon)` containing every
+    point within `radius_km`; two of them when the circle crosses the antimeridian.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle contains a pole, so it spans every longitude
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM)
+                                            / math.cos(math.radians(latitude)))))
+    min_lon, max_lon = longitude - delta_lon, longitude + delta_lon
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+def covering_cells(box):
+    """Return geohash prefixes whose cells together cover `box`, as few and as fine as `MAX_COVER_CELLS` allows."""
+    min_lat, max_lat, min_lon, max_lon = box
+    cells = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        columns = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * columns > MAX_COVER_CELLS:
+            break
+        # Sample the centre of every cell overlapping the box
+        first_lat = (math.floor(min_lat / height) + 0.5) * height
+        first_lon = (math.floor(min_lon / width) + 0.5) * width
+        cells = {encode(min(first_lat + row * height, 90.0), min(first_lon + col * width, 180.0), precision)
+                 for row in range(rows) for col in range(columns)}
+    return cells
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances in km from one point to many, as a list (or numpy array)."""
+    if numpy is not None:
+        lat1, lon1 = numpy.radians(latitude), numpy.radians(longitude)
+        lat2, lon2 = numpy.radians(numpy.asarray(latitudes)), numpy.radians(numpy.asarray(longitudes))
+        a = (numpy.sin((lat2 - lat1) / 2) ** 2
+             + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2, lon2 = math.radians(lat2), math.radians(lon2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+def cell_range(cell):
+    """
+    Return `(lower, upper)` such that a geohash starts with `cell` exactly when
+    `lower <= geohash < upper`, or None for `upper` if the cell is the last one.
+
+    The upper bound is the next cell of the same length, made of geohash
+    characters only, so the range holds under any collation that orders
+    letters and digits as usual, not just bytewise ones.
+    """
+    stripped = cell.rstrip(GEOHASH_ALPHABET[-1])
+    if not stripped:
+        return cell, None
+    successor = GEOHASH_ALPHABET[GEOHASH_ALPHABET.index(stripped[-1]) + 1]
+    return cell, stripped[:-1] + successor
+
+
+def _cell_filter(cell):
+    lower, upper = cell_range(cell)
+    return Event.geohash >= lower if upper is None else and_(Event.geohash >= lower, Event.geohash < upper)
+
+
+def _box_filter(boxes, dialect):
+    if dialect == 'sqlite':
+        return or_(*(and_(event_rtree.c.max_lat >= min_lat, event_rtree.c.min_lat <= max_lat,
+                          event_rtree.c.max_lon >= min_lon, event_rtree.c.min_lon <= max_lon)
+                     for min_lat, max_lat, min_lon, max_lon in boxes))
+
+    # Each cell is a range of the geohash index
+    cells = set().union(*(covering_cells(box) for box in boxes))
+    return and_(
+        or_(*(_cell_filter(cell) for cell in sorted(cells))),
+        or_(*(and_(Event.latitude.between(min_lat, max_lat), Event.longitude.between(min_lon, max_lon))
+              for min_lat, max_lat, min_lon, max_lon in boxes)),
+    )
+
+
+def candidate_statement(latitude, longitude, radius_km, user_id, dialect=None):
+    """
+    Select `(id, latitude, longitude)` of the events visible to `user_id`
+    inside the bounding box of the search circle.
+
+    Events are visible when their itinerary belongs to the user or to a public account.
+    """
+    dialect = dialect or db.engine.dialect.name
+    statement = (select(Event.id, Event.latitude, Event.longitude)
+                 .join(Itinerary, Itinerary.id == Event.itinerary_id)
+                 .join(User, User.id == Itinerary.user_id)
+                 .where(or_(Itinerary.user_id == user_id, User.is_private.is_(False))))
+    if dialect == 'sqlite':
+        statement = statement.join(event_rtree, event_rtree.c.id == Event.id)
+    return statement.where(_box_filter(bounding_boxes(latitude, longitude, radius_km), dialect))
+
+
+def nearest_events(latitude, longitude, radius_km, user_id, limit):
+    """
+    Return up to `limit` `(distance_km, event_id)` pairs within `radius_km`, nearest first.
+    """
+    statement = candidate_statement(latitude, longitude, radius_km, user_id)
+    result = db.session.execute(statement.execution_options(yield_per=CANDIDATE_BATCH_SIZE))
+
+    # Max-heap of the best `limit` so far, stored negated
+    best = []
+    for batch in result.partitions():
+        ids, latitudes, longitudes = zip(*batch)
+        for event_id, distance in zip(ids, haversine_km(latitude, longitude, latitudes, longitudes)):
+            if distance > radius_km:
+                continue
+            if len(best) < limit:
+                heapq.heappush(best, (-distance, -event_id))
+            elif -distance > best[0][0]:
+                heapq.heapreplace(best, (-distance, -event_id))
+    return sorted((-distance, -event_id) for distance, event_id in best)
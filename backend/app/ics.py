@@ -0,0 +1,172 @@
+"""
+This module renders itineraries as iCalendar (RFC 5545) documents.
+
+Calendars are streamed: VEVENTs are generated from `Event` rows read in
+batches, so a feed of any size is never built in memory. Calendar clients poll
+subscriptions often, so each rendered document is also kept in a size-bounded
+cache keyed on the versions of the itineraries it contains. Callers check
+`ETag`/`Last-Modified` from the `itinerary` table alone first, so most polls end
+in a 304 without reading events at all, and most of the rest are served from
+the cache.
+"""
+
+from flask import current_app, stream_with_context
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from .cache import TTLCache
+
+BATCH_SIZE = 500
+PRODUCT_ID = '-//Nomad//Itineraries//EN'
+# Lines longer than this many octets are folded
+MAX_LINE_OCTETS = 75
+
+rendered = TTLCache(maxsize=1000, ttl=3600.0)
+
+
+def escape(text):
+    """Escape a TEXT value."""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Fold a content line at 75 octets and terminate it with CRLF."""
+    if len(line.encode()) <= MAX_LINE_OCTETS:
+        return line + '\r\n'
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode())
+        # Continuation lines start with a space, which counts towards their length
+        if size + width > (MAX_LINE_OCTETS if not parts else MAX_LINE_OCTETS - 1):
+            parts.append(''.join(current))
+            current, size = [], 0
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_time(value):
+    """Format a naive UTC datetime as a UTC DATE-TIME."""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_event(row, stamp):
+    """Render one event row (with the `event` columns, plus `itinerary_name` if selected) as a VEVENT."""
+    location = ', '.join(part for part in (row.event_location, row.event_address, row.event_city, row.event_state)
+                         if part)
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{row.id}@nomad',
+        f'DTSTAMP:{format_time(stamp)}',
+        f'DTSTART:{format_time(row.time_of_event)}',
+    ]
+    if row.ends_at is not None:
+        lines.append(f'DTEND:{format_time(row.ends_at)}')
+    lines.append(f'SUMMARY:{escape(row.event_name)}')
+    lines.append(f'DESCRIPTION:{escape(row.event_description)}')
+    if location:
+        lines.append(f'LOCATION:{escape(location)}')
+    if row.latitude is not None and row.longitude is not None:
+        lines.append(f'GEO:{row.latitude:.6f};{row.longitude:.6f}')
+    itinerary_name = getattr(row, 'itinerary_name', None)
+    if itinerary_name:
+        lines.append(f'CATEGORIES:{escape(itinerary_name)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def render_calendar(name, rows, stamp, refresh_interval=None):
+    """
+    Yield an iCalendar document one VEVENT at a time.
+
+    Args:
+        name (str): Calendar name shown by clients.
+        rows: Iterable of event rows, see `render_event`.
+        stamp (datetime): DTSTAMP of every event; the time the calendar last changed,
+            so a document depends only on the data in it.
+        refresh_interval (int): Seconds clients are asked to wait between polls.
+    """
+    header = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODUCT_ID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+              f'X-WR-CALNAME:{escape(name)}']
+    if refresh_interval:
+        duration = f'PT{max(1, refresh_interval // 60)}M'
+        header += [f'REFRESH-INTERVAL;VALUE=DURATION:{duration}', f'X-PUBLISHED-TTL:{duration}']
+    yield ''.join(fold(line) for line in header)
+    for row in rows:
+        yield render_event(row, stamp)
+    yield 'END:VCALENDAR\r\n'
+
+
+def _caching(key, chunks, max_bytes):
+    """Pass `chunks` through as bytes and cache the whole document once it is complete, unless it is too big."""
+    kept, size = [], 0
+    for chunk in chunks:
+        data = chunk.encode()
+        if kept is not None:
+            size += len(data)
+            if size <= max_bytes:
+                kept.append(data)
+            else:
+                kept = None
+        yield data
+    if kept is not None:
+        rendered.set(key, b''.join(kept))
+
+
+def calendar_response(key, render, etag, last_modified, filename):
+    """
+    Build the response for a calendar, from the cache when possible.
+
+    Args:
+        key: Cache key; must change whenever the document would.
+        render (callable): Returns the chunk generator of `render_calendar`; only called on a cache miss.
+        etag (str): ETag of the document.
+        last_modified (datetime): When the document last changed, as naive UTC.
+        filename (str): Suggested download name.
+    """
+    config = current_app.config
+    cached = rendered.get(key)
+    if cached is not None:
+        response = current_app.response_class(cached, mimetype='text/calendar')
+    else:
+        chunks = _caching(key, render(), config.get('ICS_CACHE_MAX_BYTES', 2 ** 20))
+        response = current_app.response_class(stream_with_context(chunks), mimetype='text/calendar')
+
+    response.set_etag(etag)
+    response.last_modified = last_modified.replace(microsecond=0)
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    response.cache_control.private = True
+    response.cache_control.max_age = config.get('ICS_REFRESH_INTERVAL', 3600)
+    return response
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['JWT_SECRET_KEY'], salt='calendar-feed')
+
+
+def feed_token(user_id, version):
+    """Return the signed token that identifies a user's subscription feed, for their current `version`."""
+    return _serializer().dumps([user_id, version])
+
+
+def feed_claims(token):
+    """
+    Return the `(user_id, version)` a subscription token was issued for, or None if the token is not valid.
+    Tokens issued before feeds were versioned hold only the user id and count as version 1.
+    """
+    try:
+        claims = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if isinstance(claims, int):
+        return claims, 1
+    if isinstance(claims, list) and len(claims) == 2 and all(isinstance(claim, int) for claim in claims):
+        return tuple(claims)
+    return None
+
+
+def init_app(app):
+    """Size the rendered calendar cache from the app config."""
+    rendered.maxsize = app.config.get('ICS_CACHE_SIZE', rendered.maxsize)
+    rendered.clear()
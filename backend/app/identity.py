@@ -0,0 +1,105 @@
+"""
+This module resolves the JWT identity of a request to the current user.
+
+Access tokens carry the username as their identity. Instead of every route
+running its own `User.query.filter_by(username=...)`, the lookup is registered
+as flask_jwt_extended's user loader and backed by a bounded LRU cache whose
+entries also expire after a TTL. After `@jwt_required()` has run:
+
+* `g.jwt_identity` holds the token's identity.
+* `g.current_user_id` holds the user's primary key.
+* `g.current_user` holds the `User` row, attached to the request's session.
+
+The cache stores a snapshot of the user's columns, not the ORM object, so no
+instance is ever shared between threads or sessions. A cache hit rebuilds an
+attached `User` from the snapshot without touching the database. The password
+hash is left out of the snapshot: on a rebuilt user it is loaded from the
+database the first time it is read, which only login and password changes do.
+
+Routes that change or delete a user must call `forget_user` so the next request
+does not see stale data. Invalidation is per process, so the TTL is kept short
+(`IDENTITY_CACHE_TTL`, 5 seconds by default): it bounds how long another worker
+can keep serving an old snapshot, while still absorbing bursts of requests.
+"""
+
+from flask import current_app, g, jsonify
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .cache import TTLCache
+from .models import User
+
+
+# Column snapshots of recently seen users, keyed by JWT identity (the username)
+user_cache = TTLCache()
+
+# Columns never copied into `user_cache`
+UNCACHED_COLUMNS = frozenset({'password_hash'})
+
+
+def snapshot_user(user):
+    """Copy a user's columns, except `UNCACHED_COLUMNS`, into the plain dict stored in `user_cache`."""
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs
+            if attr.key not in UNCACHED_COLUMNS}
+
+
+def _from_snapshot(snapshot):
+    """Attach a `User` rebuilt from a cached snapshot to the session without querying."""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def load_user(jwt_header, jwt_data):
+    """
+    flask_jwt_extended user loader. Resolves the token's identity to a `User`,
+    serving repeat requests from `user_cache`, and stores the result on `g`.
+
+    Returns:
+        User: The current user, or None if the identity no longer exists.
+    """
+    identity = jwt_data[current_app.config['JWT_IDENTITY_CLAIM']]
+    # Set first so the lookup below can already be routed by identity
+    g.jwt_identity = identity
+    snapshot = user_cache.get(identity)
+
+    if snapshot is None:
+        user = User.query.filter_by(username=identity).first()
+        if user is None:
+            return None
+        user_cache.set(identity, snapshot_user(user))
+    else:
+        user = _from_snapshot(snapshot)
+
+    g.current_user = user
+    g.current_user_id = user.id
+    return user
+
+
+def user_not_found(jwt_header, jwt_data):
+    return jsonify({'error': "User does not exist"}), 404
+
+
+def forget_user(identity):
+    """
+    Drop a cached user so the next request reloads it. Call this whenever a
+    user's row changes or is deleted.
+
+    Args:
+        identity (str): The JWT identity (username) the user was cached under.
+    """
+    user_cache.pop(identity)
+
+
+def init_app(app, jwt):
+    """
+    Size the identity cache from the app config and register the user loader
+    with the app's JWTManager.
+    """
+    user_cache.maxsize = app.config.get('IDENTITY_CACHE_SIZE', user_cache.maxsize)
+    user_cache.ttl = app.config.get('IDENTITY_CACHE_TTL', user_cache.ttl)
+    # Entries of another app may come from another database
+    user_cache.clear()
+    jwt.user_lookup_loader(load_user)
+    jwt.user_lookup_error_loader(user_not_found)
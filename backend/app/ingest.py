@@ -0,0 +1,201 @@
+"""
+This module implements streaming bulk ingestion of itinerary events.
+
+Uploads are read incrementally from the request stream as NDJSON (one JSON
+object per line) or CSV (with a header row). Each row is validated on its own
+and valid rows are buffered into fixed-size batches that are written with a
+single multi-row statement: COPY on PostgreSQL, `executemany` elsewhere. Only
+one batch and a bounded number of error reports are held in memory at any time,
+so memory use does not grow with the size of the upload.
+"""
+
+import codecs
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy import update
+
+from . import db
+from .bulk import write_rows
+from .geo import encode, validate_coordinates
+from .schedule import validate_interval
+from .sharing import invalidate
+from .models import Itinerary
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+CSV_TYPES = {'text/csv', 'application/csv'}
+
+REQUIRED_FIELDS = ('event_name', 'event_description', 'event_location',
+                   'event_address', 'event_city', 'event_state')
+COLUMNS = ('itinerary_id', 'time_of_event', 'ends_at') + REQUIRED_FIELDS + ('latitude', 'longitude', 'geohash')
+MAX_FIELD_LENGTH = 80
+
+
+class UnsupportedFormat(ValueError):
+    """Raised when the upload's content type is neither NDJSON nor CSV."""
+
+
+def _ndjson_rows(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def _csv_rows(stream):
+    text = codecs.getreader('utf-8')(stream, errors='replace')
+    reader = csv.DictReader(text)
+    for row in reader:
+        # The header is line 1, so data rows start at line 2
+        yield reader.line_num, row, None
+
+
+def iter_rows(stream, mimetype):
+    """
+    Iterate over the rows of an upload without reading it all into memory.
+
+    Args:
+        stream: A binary file-like object, normally `request.stream`.
+        mimetype (str): The upload's content type.
+
+    Yields:
+        tuple: `(line_number, row, error)` where `row` is a dict, or None if the
+        line could not be parsed.
+
+    Raises:
+        UnsupportedFormat: If `mimetype` is not NDJSON or CSV.
+    """
+    if mimetype in NDJSON_TYPES:
+        return _ndjson_rows(stream)
+    if mimetype in CSV_TYPES:
+        return _csv_rows(stream)
+    raise UnsupportedFormat(f'Unsupported content type: {mimetype}')
+
+
+def validate_event(row, itinerary_id):
+    """
+    Validate one uploaded row and convert it into `event` column values.
+
+    Returns:
+        dict: Column values ready to insert.
+
+    Raises:
+        ValueError: Describing the first problem found with the row.
+    """
+    values = {'itinerary_id': itinerary_id}
+
+    for field in REQUIRED_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            raise ValueError(f'{field} is required')
+        value = str(value)
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ValueError(f'{field} must be at most {MAX_FIELD_LENGTH} characters')
+        values[field] = value
+
+    time_of_event = row.get('time_of_event')
+    if time_of_event:
+        try:
+            values['time_of_event'] = datetime.strptime(time_of_event, TIME_FORMAT)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid time of event format')
+    else:
+        values['time_of_event'] = datetime.utcnow()
+
+    ends_at = row.get('ends_at')
+    if ends_at:
+        try:
+            ends_at = datetime.strptime(ends_at, TIME_FORMAT)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid ends_at format')
+    values['ends_at'] = ends_at or None
+    validate_interval(values['time_of_event'], values['ends_at'])
+
+    latitude, longitude = row.get('latitude'), row.get('longitude')
+    if latitude in (None, '') and longitude in (None, ''):
+        values['latitude'] = values['longitude'] = values['geohash'] = None
+    else:
+        try:
+            latitude, longitude = validate_coordinates(latitude, longitude)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid latitude or longitude')
+        values.update(latitude=latitude, longitude=longitude, geohash=encode(latitude, longitude))
+
+    return values
+
+
+def touch_itinerary(itinerary_id):
+    """
+    Bump an itinerary's version after its events changed. Events are part of the
+    itinerary's representation, so its version (and ETag) must change.
+    """
+    db.session.execute(update(Itinerary).where(Itinerary.id == itinerary_id)
+                       .values(version=Itinerary.version + 1, updated_at=datetime.utcnow()))
+    invalidate(itinerary_id)
+
+
+def write_batch(batch):
+    """Insert a batch of validated rows with one multi-row statement."""
+    write_rows(db.session.connection(), 'event', COLUMNS,
+               [tuple(values[column] for column in COLUMNS) for values in batch])
+
+
+def ingest_events(stream, mimetype, itinerary_id, batch_size=BATCH_SIZE):
+    """
+    Validate and insert every row of an upload into `itinerary_id`.
+
+    Valid rows are written in batches inside the session's transaction; the
+    caller commits or rolls back. Invalid rows are skipped and reported.
+
+    Returns:
+        dict: `inserted` and `failed` row counts, plus up to
+        `MAX_REPORTED_ERRORS` `{line, error}` reports in `errors`.
+    """
+    inserted = failed = 0
+    errors = []
+    batch = []
+
+    for line_number, row, error in iter_rows(stream, mimetype):
+        if error is None:
+            try:
+                batch.append(validate_event(row, itinerary_id))
+            except ValueError as e:
+                error = str(e)
+
+        if error is not None:
+            failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': error})
+            continue
+
+        if len(batch) >= batch_size:
+            write_batch(batch)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        write_batch(batch)
+        inserted += len(batch)
+
+    if inserted:
+        touch_itinerary(itinerary_id)
+
+    return {
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors),
+    }
@@ -1,13 +1,28 @@
-from flask import Blueprint, jsonify, request
-from app.models import db, User, Itinerary
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context, url_for
+from app.models import db, DeletionJob, ItineraryShare, Notification, User, Itinerary
+from app.search import search_itineraries
+from app.ingest import UnsupportedFormat, ingest_events
+from app.feed import fan_out
+from app.deletion import tombstone_itinerary, worker
+from app.conditional import collection_etag, is_fresh, itinerary_etag, not_modified, precondition_failed
+from app.pagination import MAX_PAGE_SIZE, decode_cursor, encode_cursor, keyset_filter, parse_limit
+from app.sharing import link_expiry, share_token, share_with_users
+from app.notifications import queue as notifications
 from flask_cors import CORS
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from datetime import datetime
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import StaleDataError
 
 itinerary = Blueprint('itinerary', __name__)
 CORS(itinerary)
 
+# Streamed responses never hold more than one batch in memory, so they may ask for bigger pages
+MAX_STREAM_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 100
+MAX_SHARE_LINK_DAYS = 365
+
 """
 ROUTE FOR CREATING AN ITINERARY
 """
@@ -21,29 +36,22 @@ def create_itinerary():
     Validations include checking required fields and ensuring correct data formats.
     In case of database errors, the transaction is rolled back to maintain integrity.
     """
-    current_user_id = get_jwt_identity()
+    current_user_id = g.current_user_id
     data = request.json
 
     itinerary_name = data.get('itinerary_name')
     if not itinerary_name:
         return jsonify({'error': 'Itinerary name is required'}), 400
 
-    time_of_event = data.get('time_of_event')
-    if time_of_event:
-        try:
-            time_of_event = datetime.strptime(time_of_event, '%Y-%m-%d %H:%M:%S')
-        except ValueError:
-            return jsonify({'error': 'Invalid time of event format'}), 400
-
-
     try:
         new_itinerary = Itinerary(
             user_id=current_user_id,
             itinerary_name=itinerary_name,
-            time_of_event=time_of_event,
             # Other fields omitted for brevity
         )
         db.session.add(new_itinerary)
+        db.session.flush()
+        fan_out(new_itinerary)
         db.session.commit()
         return jsonify({"message": "Itinerary created successfully", "itinerary": new_itinerary.id}), 201
 
@@ -70,26 +78,134 @@ def get_or_list_itineraries():
     """
     Endpoint for retrieving an itinerary. Supports fetching by ID or name or listing all itineraries.
     The query adjusts based on the provided parameter. If no itinerary is found, it will list all of them.
+
+    Responses carry an ETag, and a matching If-None-Match gets a 304 after a version-only query.
+    `name` runs an indexed substring search and returns the best `limit` matches by relevance.
+    Listings are keyset paginated on (created_at, id), newest first. Pass `limit` and the `cursor`
+    from the previous response's `X-Next-Cursor` header to fetch the next page. The events of a
+    whole page are loaded with one extra query. With `format=ndjson` (or `stream=true` for a JSON
+    array) the body is streamed one itinerary at a time instead of being built in memory.
     """
     
-    current_user = get_jwt_identity()
-    itinerary_id = request.args.get('id')
-    itinerary_name = request.args.get('name')
+    current_user_id = g.current_user_id
+    ndjson = request.args.get('format') == 'ndjson'
+    stream = ndjson or request.args.get('stream') == 'true'
+
+    try:
+        statement, limit, ranked = listing_statement(current_user_id, request.args, stream)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    # Read only the sort keys and versions of the page, plus one row to see if another page
+    # follows. That is enough for the 404, the next cursor and the ETag without loading full rows.
+    keys = db.session.execute(statement.with_only_columns(*PAGE_KEY_COLUMNS).limit(limit + 1)).all()
+    keys, next_cursor, etag = page_keys(keys, limit, ranked, ndjson, stream,
+                                        single=bool(request.args.get('id')))
+
+    if not keys and not request.args.get('cursor'):
+        return jsonify({'error': 'No itineraries found'}), 404
+
+    if is_fresh(etag):
+        return not_modified(etag)
 
-    query = Itinerary.query.filter_by(user_id=current_user)
+    page = statement.options(selectinload(Itinerary.events)).limit(limit)
+
+    if stream:
+        response = Response(
+            stream_with_context(_stream_itineraries(page, ndjson)),
+            mimetype='application/x-ndjson' if ndjson else 'application/json',
+        )
+    else:
+        response = jsonify([itinerary.serialize() for itinerary in db.session.scalars(page)])
+
+    return with_page_headers(response, etag, next_cursor), 200
+
+
+def listing_statement(user_id, args, stream=False):
+    """
+    Parse the query string of `GET /itineraries` and build its ordered statement.
+    Shared by the route above and its async counterpart in `app.asgi`.
+
+    Returns:
+        tuple: `(statement, limit, ranked)`. `ranked` is True for name searches, which are
+        ordered by relevance rather than cursor paginated.
+
+    Raises:
+        ValueError: If the limit or cursor is invalid.
+    """
+    itinerary_id = args.get('id')
+    itinerary_name = args.get('name')
+    limit = parse_limit(args.get('limit'), maximum=MAX_STREAM_PAGE_SIZE if stream else MAX_PAGE_SIZE)
+    cursor = args.get('cursor')
+    cursor = decode_cursor(cursor) if cursor else None
+
+    statement = select(Itinerary).where(Itinerary.user_id == user_id)
 
     # Apply filters if provided
+    ranked = False
     if itinerary_id:
-        query = query.filter_by(id=itinerary_id)
+        statement = statement.where(Itinerary.id == itinerary_id)
     elif itinerary_name:
-        query = query.filter(Itinerary.itinerary_name.ilike(f'%{itinerary_name}%'))
+        # Name searches are ranked by relevance, so they return the best `limit` matches
+        # rather than a cursor paginated listing
+        statement = search_itineraries(statement, user_id, itinerary_name)
+        ranked = True
+        cursor = None
 
-    itineraries = query.all()
+    if cursor:
+        statement = statement.where(keyset_filter(Itinerary.created_at, Itinerary.id, cursor))
+    statement = statement.order_by(Itinerary.created_at.desc(), Itinerary.id.desc())
+    return statement, limit, ranked
 
-    if not itineraries:
-        return jsonify({'error': 'No itineraries found'}), 404
 
-    return jsonify([itinerary.serialize() for itinerary in itineraries]), 200
+PAGE_KEY_COLUMNS = (Itinerary.created_at, Itinerary.id, Itinerary.version)
+
+
+def page_keys(keys, limit, ranked, *variant, single=False):
+    """
+    Trim the look-ahead row off a page's `PAGE_KEY_COLUMNS` rows.
+
+    Returns:
+        tuple: `(keys, next_cursor, etag)`. `variant` holds anything else that changes the
+        response body, such as its format, and is folded into the ETag. When `single` (the
+        listing was filtered on an id) and the body is plain JSON, the ETag is the itinerary's
+        own, so clients can send it back in `If-Match` when they update it.
+    """
+    next_cursor = None
+    if len(keys) > limit and not ranked:
+        next_cursor = encode_cursor(keys[limit - 1].created_at, keys[limit - 1].id)
+    keys = keys[:limit]
+    if single and len(keys) == 1 and not any(variant):
+        return keys, next_cursor, itinerary_etag(keys[0].id, keys[0].version)
+    etag = collection_etag(((key.id, key.version) for key in keys), next_cursor, *variant)
+    return keys, next_cursor, etag
+
+
+def with_page_headers(response, etag, next_cursor):
+    response.set_etag(etag)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = '<{}>; rel="next"'.format(
+            url_for(request.endpoint, _external=False, **{**request.args, 'cursor': next_cursor}))
+    return response
+
+
+def _stream_itineraries(page, ndjson):
+    """
+    Yield a page of itineraries as NDJSON lines or as the chunks of a JSON array.
+    Rows are fetched in batches so only one batch (and its events) is held at a time.
+    """
+    dumps = current_app.json.dumps
+    if not ndjson:
+        yield '['
+    rows = db.session.scalars(page.execution_options(yield_per=STREAM_BATCH_SIZE))
+    for index, itinerary in enumerate(rows):
+        if ndjson:
+            yield dumps(itinerary.serialize()) + '\n'
+        else:
+            yield (',' if index else '') + dumps(itinerary.serialize())
+    if not ndjson:
+        yield ']'
 
 
 """
@@ -98,44 +214,38 @@ ENDPOINT FOR UPDATING AN ITINERARY
 @itinerary.route('/itineraries/update', methods=['PUT'])
 @jwt_required()
 def update_itinerary():
-    current_user = get_jwt_identity()
+    current_user_id = g.current_user_id
     data = request.json
     itinerary_id = data.get('id')
     itinerary_name = data.get('name')
 
-    query = Itinerary.query.filter_by(user_id=current_user)
+    query = Itinerary.query.filter_by(user_id=current_user_id)
     if itinerary_id:
         query = query.filter_by(id=itinerary_id)
     elif itinerary_name:
-        query = query.filter(Itinerary.itinerary_name.ilike(f'%{itinerary_name}%'))
+        query = search_itineraries(query, current_user_id, itinerary_name)
 
     itinerary = query.first()
 
     if not itinerary:
         return jsonify({'error': 'Itinerary not found'}), 404
 
-    # Updating fields
-    itinerary.itinerary_name = data.get('itinerary_name', itinerary.itinerary_name)
+    # Optimistic concurrency: refuse to overwrite changes the client has not seen
+    if precondition_failed(itinerary_etag(itinerary.id, itinerary.version)):
+        return jsonify({'error': 'Itinerary has been modified since it was fetched'}), 412
 
-    # Update time of event
-    time_of_event = data.get('time_of_event')
-    if time_of_event:
-        try:
-            itinerary.time_of_event = datetime.strptime(time_of_event, '%Y-%m-%d %H:%M:%S')
-        except ValueError:
-            return jsonify({'error': 'Invalid time of event format'}), 400
-
-    # Update event details
-    itinerary.event_name = data.get('event_name', itinerary.event_name)
-    itinerary.event_description = data.get('event_description', itinerary.event_description)
-    itinerary.event_location = data.get('event_location', itinerary.event_location)
-    itinerary.event_address = data.get('event_address', itinerary.event_address)
-    itinerary.event_city = data.get('event_city', itinerary.event_city)
-    itinerary.event_state = data.get('event_state', itinerary.event_state)
+    # Updating fields. Event details live on the itinerary's Event rows.
+    itinerary.itinerary_name = data.get('itinerary_name', itinerary.itinerary_name)
 
     try:
+        fan_out(itinerary)
         db.session.commit()
-        return jsonify({'message': 'Itinerary updated successfully'}), 200
+        response = jsonify({'message': 'Itinerary updated successfully'})
+        response.set_etag(itinerary_etag(itinerary.id, itinerary.version))
+        return response, 200
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Itinerary has been modified since it was fetched'}), 412
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -148,52 +258,164 @@ ENDPOINT FOR DELETING AN ITINERARY
 @itinerary.route('/itineraries/delete', methods=['DELETE'])
 @jwt_required()
 def delete_itinerary():
-    current_user = get_jwt_identity()
+    current_user_id = g.current_user_id
     data = request.json
     itinerary_id = data.get('id')
     itinerary_name = data.get('name')
 
-    query = Itinerary.query.filter_by(user_id=current_user)
+    query = Itinerary.query.filter_by(user_id=current_user_id)
     if itinerary_id:
         query = query.filter_by(id=itinerary_id)
     elif itinerary_name:
-        query = query.filter(Itinerary.itinerary_name.ilike(f'%{itinerary_name}%'))
+        query = search_itineraries(query, current_user_id, itinerary_name)
 
     itinerary = query.first()
 
     if not itinerary:
         return jsonify({'error': 'Itinerary not found'}), 404
 
-    db.session.delete(itinerary)
-
+    # The itinerary is hidden now; its events, feed entries and likes are removed in the background
     try:
+        job = tombstone_itinerary(itinerary, current_user_id)
         db.session.commit()
-        return jsonify({'message': 'Itinerary deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
+    worker.notify()
+    response = jsonify({'message': 'Itinerary scheduled for deletion', 'job': job.serialize()})
+    response.headers['Location'] = url_for('itinerary.get_deletion_job', job_id=job.id)
+    return response, 202
+
+
+"""
+ENDPOINT FOR CHECKING ON A DELETION
+"""
+@itinerary.route('/deletions/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_deletion_job(job_id):
+    """
+    Endpoint reporting the progress of a deletion the user requested.
+    """
+    job = db.session.scalar(select(DeletionJob).where(DeletionJob.id == job_id,
+                                                      DeletionJob.requested_by == g.current_user_id))
+    if job is None:
+        return jsonify({'error': 'Deletion not found'}), 404
+    return jsonify({'job': job.serialize()}), 200
+
+
+"""
+ENDPOINT FOR BULK UPLOADING EVENTS TO AN ITINERARY
+"""
+@itinerary.route('/itineraries/<int:itinerary_id>/events:bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_events(itinerary_id):
+    """
+    Endpoint to import many events into an itinerary at once. The body is streamed as NDJSON
+    (`application/x-ndjson`) or CSV with a header row (`text/csv`) and is never read fully into memory.
+
+    Rows are validated one at a time and valid rows are inserted in batches within a single
+    transaction. Invalid rows are skipped and reported by line number.
+    """
+    current_user_id = g.current_user_id
+    itinerary = Itinerary.query.filter_by(id=itinerary_id, user_id=current_user_id).first()
+
+    if itinerary is None:
+        return jsonify({'error': 'Itinerary not found'}), 404
+
+    try:
+        report = ingest_events(request.stream, request.mimetype, itinerary.id)
+        db.session.commit()
+    except UnsupportedFormat:
+        db.session.rollback()
+        return jsonify({'error': 'Content type must be application/x-ndjson or text/csv'}), 415
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    return jsonify(report), 201 if not report['failed'] else 207
+
+
+def _share_on_platform(itinerary, data):
+    """
+    Shared implementation of sharing an itinerary with other users. Takes `recipients`, a list of
+    usernames, or a single `recipient_username`. Recipients are notified once the grants are committed.
+    """
+    recipients = data.get('recipients')
+    if recipients is None and data.get('recipient_username') is not None:
+        recipients = [data.get('recipient_username')]
+    if (not isinstance(recipients, list) or not recipients
+            or not all(isinstance(username, str) and username for username in recipients)):
+        return jsonify({'error': 'Expected a non-empty list of recipient usernames'}), 400
+    max_recipients = current_app.config.get('SHARE_MAX_RECIPIENTS', 1000)
+    if len(recipients) > max_recipients:
+        return jsonify({'error': f'At most {max_recipients} recipients per request'}), 413
+
+    try:
+        result = share_with_users(itinerary.id, g.current_user_id, recipients)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    shared = result['shared']
+    if shared:
+        notifications.add(Notification.ITINERARY_SHARED, shared.values(), {
+            'itinerary_id': itinerary.id,
+            'itinerary_name': itinerary.itinerary_name,
+            'shared_by': g.current_user.username,
+        })
+    if not shared and not result['already_shared']:
+        return jsonify({'error': 'Recipient user not found', 'not_found': result['not_found']}), 404
+
+    return jsonify({'message': 'Itinerary shared successfully', 'shared': list(shared),
+                    'already_shared': result['already_shared'], 'not_found': result['not_found']}), 200
 
 
 # ROUTE FOR SHARE ITINERARY WITHIN THE PLATFORM
 @itinerary.route('/itineraries/<int:itinerary_id>/share/platform', methods=['POST'])
 @jwt_required()
 def share_itinerary_within_platform(itinerary_id):
-    current_user = get_jwt_identity()
-    data = request.json()
-    recipient_username = data.get('recipient_username')
-    
-    itinerary = Itinerary.query.filter_by(id=itinerary_id)
-    if not itinerary or itinerary_id != current_user:
-        return jsonify({'error': 'Itinerary not found or access denied'}), 404   
-    
-    recipient_username = User.query.filter_by(username=recipient_username).first()
-    if not recipient_username:
-        return jsonify({'error': 'Recipient user not found'}), 404
-    
-    itinerary.shared_with.append(recipient_username)
-    db.session.commit()
-    
-    
+    """
+    Endpoint to share an itinerary with other users, e.g. `{"recipients": ["ana", "ben"]}`.
+    Takes the same number of queries however many recipients there are.
+    """
+    itinerary = Itinerary.query.filter_by(id=itinerary_id, user_id=g.current_user_id).first()
+    if itinerary is None:
+        return jsonify({'error': 'Itinerary not found or access denied'}), 404
+
+    return _share_on_platform(itinerary, request.get_json(silent=True) or {})
+
+
+"""
+ENDPOINT FOR LISTING THE ITINERARIES SHARED WITH THE USER
+"""
+@itinerary.route('/itineraries/shared', methods=['GET'])
+@jwt_required()
+def get_shared_with_me():
+    """
+    Endpoint listing the itineraries other users shared with the current user, most recently shared first.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    rows = db.session.execute(
+        select(Itinerary, User.username, ItineraryShare.created_at)
+        .join(ItineraryShare, ItineraryShare.itinerary_id == Itinerary.id)
+        .join(User, User.id == Itinerary.user_id)
+        .where(ItineraryShare.user_id == g.current_user_id)
+        .order_by(ItineraryShare.created_at.desc(), Itinerary.id.desc())
+        .limit(limit)).all()
+
+    shared = []
+    for itinerary, owner, shared_at in rows:
+        data = itinerary.serialize(include_events=False)
+        data.update(owner=owner, shared_at=shared_at)
+        shared.append(data)
+    return jsonify({'itineraries': shared}), 200
+
+
 # ROUTE FOR GENERATING A SHAREABLE LINK FOR AN ITINERARY
 @itinerary.route('/itineraries/<int:itinerary_id>/share/link', methods=['POST'])
 @jwt_required()
@@ -201,8 +423,8 @@ def generate_shareable_link(itinerary_id):
     """
     Endpoint to share an itinerary. Supports sharing within the platform and generating a shareable link.
     """
-    current_user = get_jwt_identity()
-    itinerary = Itinerary.query.filter_by(id=itinerary_id, user_id=current_user).first()
+    current_user_id = g.current_user_id
+    itinerary = Itinerary.query.filter_by(id=itinerary_id, user_id=current_user_id).first()
 
     if itinerary is None:
         return jsonify({'error': 'Itinerary not found'}), 404
@@ -214,13 +436,21 @@ def generate_shareable_link(itinerary_id):
         return jsonify({'error': 'Invalid share type'}), 400
 
     if share_type == 'platform':
-        # Logic for sharing within the platform
-        # This could involve adding the itinerary to a shared feed, notifying other users, etc.
-        pass
+        return _share_on_platform(itinerary, data)
     elif share_type == 'link':
-        # Generate a shareable link
-        shareable_link = f"http://nomad.com/itineraries/{itinerary_id}"
-        return jsonify({'message': 'Itinerary share link generated successfully', 'link': shareable_link}), 200
+        # Generate a signed link that anyone can open until it expires
+        try:
+            days = int(data.get('expires_in_days', current_app.config.get('SHARE_LINK_TTL_DAYS', 30)))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'expires_in_days must be a number of days'}), 400
+        if not 1 <= days <= MAX_SHARE_LINK_DAYS:
+            return jsonify({'error': f'expires_in_days must be between 1 and {MAX_SHARE_LINK_DAYS}'}), 400
+
+        expires_at = link_expiry(days)
+        shareable_link = url_for('shared.get_shared_itinerary', token=share_token(itinerary_id, expires_at),
+                                 _external=True)
+        return jsonify({'message': 'Itinerary share link generated successfully', 'link': shareable_link,
+                        'expires_at': expires_at}), 200
 
     return jsonify({'message': 'Itinerary shared successfully'}), 200
 
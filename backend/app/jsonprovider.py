@@ -0,0 +1,104 @@
+"""
+This module contains the application's JSON provider.
+
+Every `jsonify` call and `current_app.json` goes through `FastJSONProvider`. It
+encodes with orjson when it is installed and falls back to the stdlib `json`
+module otherwise, so orjson stays an optional dependency. Both encoders produce
+the same output: compact, with dates and datetimes as ISO-8601 strings rather
+than Flask's default HTTP dates.
+
+`JSON_ENCODER` selects the encoder: 'auto' (orjson if available), 'orjson' or
+'stdlib'.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(o):
+    """Encode the types neither encoder handles on its own."""
+    if isinstance(o, (datetime.date, datetime.time)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSON provider that serializes with orjson when available.
+
+    Attributes:
+        sort_keys (bool): Sort object keys, as Flask's default provider does.
+        mimetype (str): Content type of `response()`.
+    """
+
+    sort_keys = True
+    mimetype = 'application/json'
+
+    def __init__(self, app, encoder='auto'):
+        super().__init__(app)
+        if encoder == 'auto':
+            encoder = 'orjson' if orjson is not None else 'stdlib'
+        if encoder == 'orjson' and orjson is None:
+            raise RuntimeError("JSON_ENCODER is 'orjson' but orjson is not installed")
+        if encoder not in ('orjson', 'stdlib'):
+            raise ValueError(f'Unknown JSON encoder: {encoder}')
+        self.encoder = encoder
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serialize `obj` to UTF-8 encoded JSON."""
+        if self.encoder == 'orjson':
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=_default, option=option)
+
+        if indent:
+            text = json.dumps(obj, default=_default, sort_keys=self.sort_keys, indent=2, ensure_ascii=False)
+        else:
+            text = json.dumps(obj, default=_default, sort_keys=self.sort_keys,
+                              separators=(',', ':'), ensure_ascii=False)
+        return text.encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for specific options get exactly what the stdlib produces
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if self.encoder == 'orjson' and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Build the body as bytes directly, skipping the str round trip
+        body = self.dumps_bytes(obj, indent=self._app.debug) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """
+    Install `FastJSONProvider` as the app's JSON provider.
+    """
+    app.json = FastJSONProvider(app, app.config.get('JSON_ENCODER', 'auto'))
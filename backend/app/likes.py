@@ -0,0 +1,231 @@
+"""
+This module stores likes on itineraries and comments and maintains their counts.
+
+Like edges are written idempotently: the primary key `(user_id, target_type,
+target_id)` makes a repeated like a no-op. Counts are not bumped with an
+`UPDATE ... SET count = count + 1` per like, which would serialize every like
+of a viral itinerary on one row lock. Instead each worker process:
+
+1. adds +1/-1 to an in-memory `CounterBuffer` once the transaction that wrote
+   the edge commits, coalescing every like of the same target since the last
+   flush into one delta, and
+2. flushes the buffer on a timer with one upsert per target into the
+   `LikeCounter` shard row picked by its pid (`pid % LIKE_COUNTER_SHARDS`), so
+   workers flushing the same target at once mostly update different rows.
+
+Deltas wait for the commit so that a rolled back like or unlike is never
+counted.
+
+A count is the sum of a target's shard rows plus whatever this process has not
+flushed yet. Deltas still buffered when a process dies are lost; since edges are
+durable, `recount` can rebuild a target's count from them.
+
+With `LIKE_FLUSH_INTERVAL` set to 0 deltas are written through in the request's
+own transaction, which keeps counts exact in tests.
+"""
+
+import atexit
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import db
+from .bulk import upsert_insert
+from .models import LikeCounter, Likes
+
+DEFAULT_SHARDS = 16
+# Session.info key of the deltas made in a session's current transaction
+UNCOMMITTED = 'like_count_deltas'
+
+
+def _upsert_counts(rows):
+    """Add each row's `count` to its shard row, creating the row if needed, in one executemany."""
+    statement = upsert_insert(LikeCounter)
+    statement = statement.on_conflict_do_update(
+        index_elements=['target_type', 'target_id', 'shard'],
+        set_={'count': LikeCounter.count + statement.excluded['count']},
+    )
+    db.session.execute(statement, rows)
+
+
+class CounterBuffer:
+    """
+    Per-process buffer of pending like count deltas, flushed to the database
+    in batches by a background timer thread.
+    """
+
+    def __init__(self):
+        self.interval = 1.0
+        self.shards = DEFAULT_SHARDS
+        self._app = None
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    @property
+    def shard(self):
+        return os.getpid() % self.shards
+
+    def configure(self, app):
+        self._app = app
+        self.interval = app.config.get('LIKE_FLUSH_INTERVAL', self.interval)
+        self.shards = app.config.get('LIKE_COUNTER_SHARDS', self.shards)
+
+    def add(self, target_type, target_id, delta):
+        """
+        Count a like or unlike made in the current transaction of `db.session`. The
+        delta is buffered only if that transaction commits.
+        """
+        if self.interval <= 0:
+            _upsert_counts([{'target_type': target_type, 'target_id': target_id,
+                             'shard': self.shard, 'count': delta}])
+            return
+
+        uncommitted = db.session.info.setdefault(UNCOMMITTED, defaultdict(int))
+        uncommitted[(target_type, target_id)] += delta
+
+    def merge(self, deltas):
+        """Buffer committed deltas for the next flush."""
+        with self._lock:
+            for key, delta in deltas.items():
+                self._pending[key] += delta
+        self._ensure_thread()
+
+    def pending(self, target_type, target_id):
+        with self._lock:
+            return self._pending.get((target_type, target_id), 0)
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='like-counter-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('Failed to flush like counters')
+
+    def flush(self):
+        """Write every pending delta in one transaction. Returns the number of targets written."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+
+        rows = [{'target_type': target_type, 'target_id': target_id, 'shard': self.shard, 'count': delta}
+                for (target_type, target_id), delta in pending.items() if delta]
+        if not rows:
+            return 0
+
+        try:
+            with self._app.app_context():
+                _upsert_counts(rows)
+                db.session.commit()
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for (target_type, target_id), delta in pending.items():
+                    self._pending[(target_type, target_id)] += delta
+            raise
+        return len(rows)
+
+
+counters = CounterBuffer()
+
+
+@event.listens_for(Session, 'after_commit')
+def _buffer_committed(session):
+    # Also fired when a savepoint is released, which commits nothing yet
+    if session.in_nested_transaction():
+        return
+    deltas = session.info.pop(UNCOMMITTED, None)
+    if deltas:
+        counters.merge(deltas)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_rolled_back(session, transaction):
+    # Runs after `after_commit`, so whatever is left belongs to a rolled back transaction
+    if transaction.parent is None:
+        session.info.pop(UNCOMMITTED, None)
+
+
+def like(user_id, target_type, target_id):
+    """
+    Record that a user likes a target. Runs inside the caller's transaction.
+
+    Returns:
+        bool: False if the user already liked it.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Likes).values(user_id=user_id, target_type=target_type, target_id=target_id))
+    except IntegrityError:
+        return False
+    counters.add(target_type, target_id, 1)
+    return True
+
+
+def unlike(user_id, target_type, target_id):
+    """
+    Remove a user's like from a target. Runs inside the caller's transaction.
+
+    Returns:
+        bool: False if the user had not liked it.
+    """
+    removed = db.session.execute(delete(Likes).where(
+        Likes.user_id == user_id, Likes.target_type == target_type, Likes.target_id == target_id)).rowcount
+    if removed:
+        counters.add(target_type, target_id, -1)
+    return bool(removed)
+
+
+def like_counts(target_type, target_ids):
+    """
+    Read the like counts of several targets of one type with a single query.
+
+    Returns:
+        dict: Target id to like count, including deltas not flushed yet.
+    """
+    rows = db.session.execute(
+        select(LikeCounter.target_id, func.sum(LikeCounter.count))
+        .where(LikeCounter.target_type == target_type, LikeCounter.target_id.in_(target_ids))
+        .group_by(LikeCounter.target_id)
+    ).all()
+    totals = dict(rows)
+    return {target_id: (totals.get(target_id) or 0) + counters.pending(target_type, target_id)
+            for target_id in target_ids}
+
+
+def recount(target_type, target_id):
+    """
+    Rebuild a target's count from its like edges, e.g. after a worker died with
+    unflushed deltas. Runs inside the caller's transaction.
+    """
+    total = db.session.scalar(select(func.count()).select_from(Likes).where(
+        Likes.target_type == target_type, Likes.target_id == target_id))
+    db.session.execute(delete(LikeCounter).where(
+        LikeCounter.target_type == target_type, LikeCounter.target_id == target_id))
+    db.session.execute(insert(LikeCounter).values(
+        target_type=target_type, target_id=target_id, shard=0, count=total))
+    return total
+
+
+def init_app(app):
+    """
+    Configure the counter buffer and flush whatever is pending when the process exits.
+    """
+    counters.configure(app)
+    if counters.interval > 0:
+        atexit.register(counters.flush)
@@ -0,0 +1,165 @@
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
+from app.models import db, User, DirectMessages
+from app import messaging
+from flask_cors import CORS
+from flask_jwt_extended import jwt_required
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+messages = Blueprint('messages', __name__)
+CORS(messages)
+
+# Seconds between keep-alive comments on an idle stream, so proxies don't close it
+HEARTBEAT_INTERVAL = 15
+REPLAY_BATCH_SIZE = 100
+MAX_MESSAGE_LENGTH = 5000
+
+"""
+ROUTE FOR SENDING A DIRECT MESSAGE
+"""
+@messages.route('/messages', methods=['POST'])
+@jwt_required()
+def send_message():
+    """
+    Endpoint to send a direct message to another user. The message is pushed to any of the
+    recipient's open streams once it is committed.
+    """
+    data = request.get_json(silent=True) or {}
+    recipient_username = data.get('recipient_username')
+    body = data.get('body')
+
+    if not recipient_username or not body:
+        return jsonify({'error': 'Recipient username and message body are required'}), 400
+
+    if not isinstance(recipient_username, str) or not isinstance(body, str):
+        return jsonify({'error': 'Recipient username and message body must be strings'}), 400
+
+    if len(body) > MAX_MESSAGE_LENGTH:
+        return jsonify({'error': f'Messages must be at most {MAX_MESSAGE_LENGTH} characters'}), 400
+
+    recipient = User.query.filter_by(username=recipient_username).first()
+    if recipient is None:
+        return jsonify({'error': 'Recipient user not found'}), 404
+
+    message = DirectMessages(sender_id=g.current_user_id, recipient_id=recipient.id, body=body)
+    try:
+        db.session.add(message)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    try:
+        messaging.publish(message)
+    except Exception:
+        # The message is saved; open streams pick it up when they reconnect with Last-Event-ID
+        current_app.logger.exception('Failed to publish direct message %s', message.id)
+    return jsonify({'message': message.serialize()}), 201
+
+"""
+ROUTE FOR READING A CONVERSATION
+"""
+@messages.route('/messages', methods=['GET'])
+@jwt_required()
+def get_conversation():
+    """
+    Endpoint returning the messages exchanged with another user (`with=<username>`), newest
+    first. Pass `before=<message id>` to page further back.
+    """
+    other = User.query.filter_by(username=request.args.get('with')).first()
+    if other is None:
+        return jsonify({'error': 'User not found'}), 404
+
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        before = request.args.get('before', type=int)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    me = g.current_user_id
+    query = DirectMessages.query.filter(or_(
+        and_(DirectMessages.sender_id == me, DirectMessages.recipient_id == other.id),
+        and_(DirectMessages.sender_id == other.id, DirectMessages.recipient_id == me),
+    ))
+    if before:
+        query = query.filter(DirectMessages.id < before)
+    rows = query.order_by(DirectMessages.id.desc()).limit(limit).all()
+
+    return jsonify({'messages': [message.serialize() for message in rows]}), 200
+
+"""
+ROUTE FOR STREAMING INCOMING DIRECT MESSAGES
+"""
+@messages.route('/messages/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_messages():
+    """
+    Server-Sent Events stream of the current user's incoming messages. Each event's id is the
+    message id, so a reconnecting client (which sends `Last-Event-ID`, or `last_event_id` in
+    the query string) only receives the messages it missed. Browsers' EventSource cannot set
+    headers, so the access token may also be passed as `?jwt=`.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    user_id = g.current_user_id
+    if last_event_id is None:
+        # A fresh connection starts from now rather than replaying the whole inbox
+        last_event_id = db.session.query(db.func.max(DirectMessages.id)).filter_by(recipient_id=user_id).scalar() or 0
+    db.session.close()
+
+    response = Response(stream_with_context(_event_stream(user_id, last_event_id)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _format_event(message):
+    return 'id: {}\nevent: message\ndata: {}\n\n'.format(message['id'], current_app.json.dumps(message))
+
+
+def _replay(user_id, after_id):
+    """
+    Yield the user's messages newer than `after_id` from the database, using the
+    (recipient_id, id) index, and release the connection afterwards.
+    """
+    try:
+        query = (DirectMessages.query
+                 .filter(DirectMessages.recipient_id == user_id, DirectMessages.id > after_id)
+                 .order_by(DirectMessages.id))
+        for message in query.yield_per(REPLAY_BATCH_SIZE):
+            yield messaging.to_payload(message)
+    finally:
+        # Streams are long lived; don't hold a pooled connection while idle
+        db.session.close()
+
+
+def _event_stream(user_id, last_event_id):
+    # Subscribe before replaying so nothing committed in between is missed
+    subscription = messaging.subscribe(user_id)
+    try:
+        yield 'retry: 3000\n\n'
+        for message in _replay(user_id, last_event_id):
+            last_event_id = message['id']
+            yield _format_event(message)
+
+        while True:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                for message in _replay(user_id, last_event_id):
+                    last_event_id = message['id']
+                    yield _format_event(message)
+
+            message = subscription.get(timeout=HEARTBEAT_INTERVAL)
+            if message is None:
+                yield ': keep-alive\n\n'
+            elif message is messaging.REPLAY:
+                continue
+            elif message['id'] > last_event_id:
+                last_event_id = message['id']
+                yield _format_event(message)
+    finally:
+        subscription.close()
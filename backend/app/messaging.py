@@ -0,0 +1,216 @@
+"""
+This module pushes new direct messages to connected clients.
+
+Each worker process runs a `Hub` holding one bounded queue per open
+`/messages/stream` connection. After a message is committed it is published
+through a backend, which delivers it to the hub of every worker:
+
+* `MemoryBackend` dispatches straight to the local hub. It is only correct with
+  a single worker and is what tests use.
+* `PostgresBackend` publishes with `pg_notify` and runs one listener thread per
+  worker that `LISTEN`s on the channel and dispatches notifications to the hub,
+  so any number of workers share one stream of messages.
+
+Live messages carry their full payload, so delivering them never touches the
+database. The database is only read to replay what a client missed: messages
+after its `Last-Event-ID` on reconnect, or after its last delivered message if
+its queue overflowed. A NOTIFY payload must be under 8000 bytes, so a message
+too big for one is announced by id alone and its recipient's streams replay it
+from the database.
+"""
+
+import json
+import queue
+import threading
+from collections import defaultdict
+from select import select as wait_for_io
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from . import db
+
+CHANNEL = 'direct_messages'
+QUEUE_SIZE = 256
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_BYTES = 7999
+# Queued to wake a stream that must replay from the database
+REPLAY = object()
+
+
+class Subscription:
+    """One open stream's view of the hub."""
+
+    def __init__(self, hub, user_id):
+        self.hub = hub
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        # Set when a message had to be dropped because the client is reading too slowly
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Wait up to `timeout` seconds for the next message. Returns None on timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """In-process registry of open streams, keyed by recipient."""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def dispatch(self, recipient_id, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(recipient_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def request_replay(self, recipient_id):
+        """Make a user's streams read the messages they have not seen from the database."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(recipient_id, ()))
+        for subscription in subscriptions:
+            subscription.overflowed = True
+            try:
+                subscription.queue.put_nowait(REPLAY)
+            except queue.Full:
+                pass
+
+
+class MemoryBackend:
+    """Delivers published messages to this process's hub only."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self, app):
+        pass
+
+    def publish(self, recipient_id, message):
+        self.hub.dispatch(recipient_id, message)
+
+
+class PostgresBackend:
+    """Delivers published messages to every worker's hub with LISTEN/NOTIFY."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, app):
+        # Listening needs a live connection, so the thread starts on the first stream
+        self._app = app
+
+    def publish(self, recipient_id, message):
+        payload = notify_payload(recipient_id, message)
+        with db.engine.connect() as connection:
+            connection.execute(select(func.pg_notify(CHANNEL, payload)))
+            connection.commit()
+
+    def ensure_listening(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='dm-listener', daemon=True)
+                self._thread.start()
+
+    def _dispatch(self, payload):
+        data = json.loads(payload)
+        if 'message' in data:
+            self.hub.dispatch(data['recipient_id'], data['message'])
+        else:
+            self.hub.request_replay(data['recipient_id'])
+
+    def _listen(self):
+        with self._app.app_context():
+            connection = db.engine.raw_connection()
+        try:
+            driver = connection.driver_connection
+            if hasattr(driver, 'notifies') and callable(driver.notifies):
+                # psycopg 3
+                driver.autocommit = True
+                driver.execute(f'LISTEN {CHANNEL}')
+                for notification in driver.notifies():
+                    self._dispatch(notification.payload)
+            else:
+                # psycopg2
+                driver.set_isolation_level(0)
+                driver.cursor().execute(f'LISTEN {CHANNEL}')
+                while True:
+                    if wait_for_io([driver], [], [], 30) == ([], [], []):
+                        continue
+                    driver.poll()
+                    while driver.notifies:
+                        self._dispatch(driver.notifies.pop(0).payload)
+        except Exception:
+            self._app.logger.exception('Direct message listener stopped')
+        finally:
+            connection.close()
+
+
+def notify_payload(recipient_id, message):
+    """
+    Encode a message for `pg_notify`: in full if it fits, otherwise by id only.
+    """
+    payload = json.dumps({'recipient_id': recipient_id, 'message': message}, default=str, ensure_ascii=False)
+    if len(payload.encode()) <= MAX_NOTIFY_BYTES:
+        return payload
+    return json.dumps({'recipient_id': recipient_id, 'message_id': message['id']})
+
+
+hub = Hub()
+backend = MemoryBackend(hub)
+
+
+def to_payload(message):
+    """Serialize a `DirectMessages` row to the plain JSON types sent to streams."""
+    return json.loads(current_app.json.dumps(message.serialize()))
+
+
+def publish(message):
+    """Push a committed `DirectMessages` row to its recipient's open streams."""
+    backend.publish(message.recipient_id, to_payload(message))
+
+
+def subscribe(user_id):
+    """Open a subscription for a user's incoming messages."""
+    if isinstance(backend, PostgresBackend):
+        backend.ensure_listening()
+    return hub.subscribe(user_id)
+
+
+def init_app(app):
+    """
+    Pick the message backend named by `MESSAGE_BACKEND` ('memory' or 'postgres').
+    """
+    global backend
+    if app.config.get('MESSAGE_BACKEND', 'memory') == 'postgres':
+        backend = PostgresBackend(hub)
+    else:
+        backend = MemoryBackend(hub)
+    backend.start(app)
@@ -0,0 +1,252 @@
+"""
+This module measures what each request costs in SQL and exposes it at
+`/metrics` in the Prometheus text format.
+
+SQLAlchemy cursor events count every statement of a request, add up the time
+spent in the database and remember the slowest statement. The totals end up
+in histograms labelled with the request's endpoint name (`auth.login_user`,
+`itinerary.get_or_list_itineraries`, ...) and in a `db` entry of the
+Server-Timing header. The slowest statement gets a `db-slowest` entry named by
+its fingerprint, the same one the slow query log uses (see app.slowlog). A
+statement that runs more than `N_PLUS_ONE_THRESHOLD` times within one request
+is reported as a likely N+1 query: it is logged and counted in
+`nomad_n_plus_one_total`.
+
+`/metrics` is only served when `METRICS_TOKEN` is set, to scrapers that send
+it as a bearer token.
+
+Statements are grouped by their SQL text, which SQLAlchemy already renders
+with placeholders instead of values, so the per-statement cost is two clock
+reads and a dictionary update. Metrics live in the memory of each worker
+process; with several workers, scrape each one or aggregate in Prometheus.
+"""
+
+import bisect
+import hmac
+import logging
+import threading
+import time
+
+from flask import Response, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .slowlog import fingerprint, normalize
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed set of labels."""
+
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labelvalues, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*map(repr, self.buckets), '+Inf'), values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, [('le', bound)])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {values[-1]!r}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """A Prometheus counter with a fixed set of labels."""
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._series[labelvalues] = self._series.get(labelvalues, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = dict(self._series)
+        for labelvalues, value in sorted(series.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {value}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+request_duration = Histogram('nomad_request_duration_seconds', 'Time spent handling requests.',
+                             ('endpoint', 'method'), LATENCY_BUCKETS)
+request_queries = Histogram('nomad_db_queries_per_request', 'SQL statements executed per request.',
+                            ('endpoint',), COUNT_BUCKETS)
+request_db_time = Histogram('nomad_db_time_seconds', 'Time spent executing SQL per request.',
+                            ('endpoint',), LATENCY_BUCKETS)
+n_plus_one = Counter('nomad_n_plus_one_total', 'Requests in which one statement repeated more than the threshold.',
+                     ('endpoint',))
+METRICS = [request_duration, request_queries, request_db_time, n_plus_one]
+
+
+class QueryStats:
+    """The SQL executed by one request."""
+
+    __slots__ = ('count', 'duration', 'slowest', 'slowest_duration', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = None
+        self.slowest_duration = 0.0
+        self.statements = {}
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        if duration > self.slowest_duration:
+            self.slowest, self.slowest_duration = statement, duration
+        statements = self.statements
+        statements[statement] = statements.get(statement, 0) + 1
+
+    def repeated(self, threshold):
+        """Return `(statement, executions)` of the most repeated statement above `threshold`, or None."""
+        if self.count <= threshold:
+            return None
+        statement, executions = max(self.statements.items(), key=lambda item: item[1])
+        return (statement, executions) if executions > threshold else None
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started or not has_request_context():
+        return
+    duration = time.perf_counter() - started.pop()
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = QueryStats()
+    stats.record(statement, duration)
+
+
+def _handle_error(context):
+    # The failed statement never reaches after_cursor_execute
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+
+
+def _record_request(response):
+    endpoint = _endpoint()
+    stats = g.get('query_stats') or QueryStats()
+    started = g.get('request_started')
+    if started is not None:
+        request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+    request_queries.observe(stats.count, endpoint)
+    request_db_time.observe(stats.duration, endpoint)
+
+    repeated = stats.repeated(current_app.config.get('N_PLUS_ONE_THRESHOLD', 10))
+    if repeated is not None:
+        n_plus_one.inc(endpoint)
+        logger.warning('Possible N+1 in %s: statement ran %d times: %s', endpoint, repeated[1], repeated[0])
+
+    if stats.count:
+        timing = f'db;desc="{stats.count} queries";dur={stats.duration * 1000:.1f}'
+        if stats.slowest is not None:
+            timing += (f', db-slowest;desc="{fingerprint(normalize(stats.slowest))}";'
+                       f'dur={stats.slowest_duration * 1000:.1f}')
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+    return response
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(presented.encode(), token.encode()):
+        return jsonify({'error': 'A valid metrics token is required'}), 401
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def reset():
+    """Forget every observation, e.g. between tests."""
+    for metric in METRICS:
+        metric.clear()
+
+
+def init_app(app):
+    """
+    Instrument SQL execution for the app's requests, unless `METRICS_ENABLED`
+    is off, and add the `/metrics` route if a `METRICS_TOKEN` is configured.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    # Listening on the Engine class covers the primary, the replica and async engines alike
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    if app.config.get('METRICS_TOKEN'):
+        app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
@@ -5,9 +5,8 @@ The primary model defined here is the User model, which represents a user in the
 """
 
 from flask_sqlalchemy import SQLAlchemy
-import hashlib
 import datetime
-from . import db
+from . import db, passwords
 
 class User(db.Model):
     """
@@ -19,23 +18,43 @@ class User(db.Model):
         email_address (str): Unique email address for the user.
         password_hash (str): Hashed password for the user.
         created_at (datetime): Timestamp indicating when the user was created.
+        updated_at (datetime): Timestamp of the last change to the user.
+        version (int): Counter bumped on every change, used for ETags.
+        is_private (bool): Whether new followers need to be approved.
+        followers_count (int): Number of accepted followers.
+        following_count (int): Number of accepted users this user follows.
+        deleted_at (datetime): When the account was deleted; its rows are removed in the background
+            (see app.deletion) and it is hidden from every read meanwhile.
+        calendar_token_version (int): Version signed into the calendar feed URL; bumping it revokes the old URL.
 
     Methods:
         set_password(password): Sets the user's password.
+        check_password(password): Verifies a password against the stored hash.
+        password_needs_rehash(): Reports whether the stored hash should be upgraded.
         serialize(): Serializes the user object to a dictionary.
     """
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email_address = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(80), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # Bumped in SQL on every UPDATE; backs the profile ETag. Not used as an optimistic lock
+    # because requests work on rows rebuilt from the identity cache.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1', onupdate=db.text('version + 1'))
     itinerary = db.relationship('Itinerary', backref='user', lazy=True)
-    following_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    followers_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    is_private = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # Denormalized from the followers table and kept in step with it in the same transaction
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     comments_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     likes_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     direct_messages_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # Set once the user has too many followers to fan their itineraries out on write
+    fanout_on_read = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    deleted_at = db.Column(db.DateTime)
+    calendar_token_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     
     
@@ -50,12 +69,15 @@ class User(db.Model):
     
     def set_password(self, password):
         """
-        Set the password for the user by hashing it.
+        Set the password for the user by hashing it in the password hashing pool.
 
         Args:
             password (str): The plaintext password to hash and store.
+
+        Raises:
+            HashingBusy: If the hashing pool is saturated.
         """
-        self.password_hash = hashlib.sha256(password.encode()).hexdigest()
+        self.password_hash = passwords.pool.hash(password)
         
     def check_password(self, password):
         """
@@ -66,8 +88,20 @@ class User(db.Model):
 
         Returns:
             bool: True if the password matches, False otherwise.
+
+        Raises:
+            HashingBusy: If the hashing pool is saturated.
+        """
+        return passwords.pool.verify(password, self.password_hash)
+
+    def password_needs_rehash(self):
         """
-        return self.password_hash == hashlib.sha256(password.encode()).hexdigest()
+        Check if the stored hash uses an outdated algorithm or work factor.
+
+        Returns:
+            bool: True if the password should be rehashed on the next successful login.
+        """
+        return passwords.pool.needs_rehash(self.password_hash)
     
     def serialize(self):
         """
@@ -80,7 +114,10 @@ class User(db.Model):
             'id': self.id,
             'username': self.username,
             'email_address': self.email_address,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'is_private': self.is_private,
+            'followers_count': self.followers_count,
+            'following_count': self.following_count
         }
         
 # DATA MODEL FOR ITINERARIES
@@ -90,33 +127,70 @@ class Itinerary(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id')) 
     itinerary_name = db.Column(db.String(80), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     events = db.relationship('Event', backref='itinerary', lazy=True)  
+    # Set when the itinerary is deleted; reads skip it until app.deletion has removed it
+    deleted_at = db.Column(db.DateTime)
+
+    # Covers the per-user keyset pagination in GET /itineraries
+    __table_args__ = (
+        db.Index('ix_itinerary_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
+    # Every ORM update bumps `version` and fails with StaleDataError if the row changed
+    # since it was loaded. Writes that bypass the ORM (e.g. bulk event uploads) bump it themselves.
+    __mapper_args__ = {'version_id_col': version}
+
+    def serialize(self, include_events=True):
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'itinerary_name': self.itinerary_name,
+            'created_at': self.created_at
+        }
+        if include_events:
+            data['events'] = [event.serialize() for event in self.events]
+        return data
     
 
 # DATA MODEL FOR EVENTS
 class Event(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
-    itinerary_id = db.Column(db.Integer, db.ForeignKey('itinerary.id')) 
+    itinerary_id = db.Column(db.Integer, db.ForeignKey('itinerary.id'))
     time_of_event = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Optional end; an event without one is a single instant (see app.schedule)
+    ends_at = db.Column(db.DateTime)
     event_name = db.Column(db.String(80), nullable=False)
     event_description = db.Column(db.String(80), nullable=False)
     event_location = db.Column(db.String(80), nullable=False)
     event_address = db.Column(db.String(80), nullable=False)
     event_city = db.Column(db.String(80), nullable=False)
     event_state = db.Column(db.String(80), nullable=False)
+    # Optional coordinates; `geohash` is derived from them (see app.geo) and indexed for spatial lookups
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+
+    # Serves lookups by itinerary and the time range scans of the schedule conflict checks
+    __table_args__ = (
+        db.Index('ix_event_itinerary_id_time_of_event', 'itinerary_id', 'time_of_event'),
+    )
     
     def serialize(self):
         return {
             'id': self.id,
             'itinerary_id': self.itinerary_id,
             'time_of_event': self.time_of_event,
+            'ends_at': self.ends_at,
             'event_name': self.event_name,
             'event_description': self.event_description,
             'event_location': self.event_location,
             'event_address': self.event_address,
             'event_city': self.event_city,
-            'event_state': self.event_state
+            'event_state': self.event_state,
+            'latitude': self.latitude,
+            'longitude': self.longitude
         }
         
         
@@ -124,12 +198,43 @@ class Event(db.Model):
 class Locations(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
 
 
 # DATA MODEL FOR FOLLOWERS
+# Each row is one edge of the follow graph: `follower_id` follows `followee_id`.
+# Edges to private accounts start out pending until the followee accepts them.
 class Followers(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    PENDING = 'pending'
+    ACCEPTED = 'accepted'
+
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    followee_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    status = db.Column(db.String(10), nullable=False, default=ACCEPTED)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # The primary key answers "does A follow B" and the forward adjacency lookups; these
+    # cover the paginated follower/following lists and the reverse adjacency lookups.
+    __table_args__ = (
+        db.Index('ix_followers_followee_id_status_created_at', 'followee_id', 'status', 'created_at', 'follower_id'),
+        db.Index('ix_followers_follower_id_status_created_at', 'follower_id', 'status', 'created_at', 'followee_id'),
+    )
+
+
+# DATA MODEL FOR HOME FEED ENTRIES
+# One row per (follower, itinerary), written when a followed user creates or updates an itinerary
+class FeedEntry(db.Model):
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    itinerary_id = db.Column(db.Integer, db.ForeignKey('itinerary.id'), primary_key=True, index=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # Covers the keyset paginated timeline read
+    __table_args__ = (
+        db.Index('ix_feed_entry_owner_id_created_at_itinerary_id', 'owner_id', 'created_at', 'itinerary_id'),
+    )
 
 
 # DATA MODEL FOR COMMENTS
@@ -139,14 +244,151 @@ class Comments(db.Model):
     
 
 # DATA MODEL FOR LIKES
+# One row per user per liked target, so liking twice is a no-op
 class Likes(db.Model):
+    ITINERARY = 'itinerary'
+    COMMENT = 'comment'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    target_type = db.Column(db.String(20), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_likes_target_type_target_id', 'target_type', 'target_id'),
+    )
+
+
+# DATA MODEL FOR LIKE COUNTS
+# A target's like count is the sum of its shard rows. Each worker process writes to its own
+# shard, so concurrent flushes from different workers never contend for the same row.
+class LikeCounter(db.Model):
+    target_type = db.Column(db.String(20), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# DATA MODEL FOR SHARED RATE LIMITS
+# One row per rate limited key, holding the time (in epoch seconds) at which its bucket is full
+# again. Rows with a time in the past carry no state and are swept periodically.
+class RateLimitBucket(db.Model):
+    key = db.Column(db.String(200), primary_key=True)
+    full_at = db.Column(db.Float, nullable=False)
+
+
+# DATA MODEL FOR ITINERARY SHARE GRANTS
+# One row per user an itinerary was shared with inside the platform
+class ItineraryShare(db.Model):
+    itinerary_id = db.Column(db.Integer, db.ForeignKey('itinerary.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shared_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # Serves "shared with me", newest first
+    __table_args__ = (
+        db.Index('ix_itinerary_share_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+
+# DATA MODEL FOR INBOX NOTIFICATIONS
+# Notifications are coalesced per recipient before they are written (see app.notifications):
+# `count` is how many events one row stands for and `data` holds the most recent of them.
+class Notification(db.Model):
+    ITINERARY_SHARED = 'itinerary_shared'
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=1)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+
+    # Serves the inbox, newest first
+    __table_args__ = (
+        db.Index('ix_notification_user_id_id', 'user_id', 'id'),
+    )
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'count': self.count,
+            'data': self.data,
+            'created_at': self.created_at,
+            'read_at': self.read_at
+        }
+
+
+# DATA MODEL FOR DELETION JOBS
+# One row per deleted account or itinerary, recording how far the background deleter got:
+# `step` names the purge step being run, NULL until the first one starts (see app.deletion.STEPS).
+class DeletionJob(db.Model):
+    USER = 'user'
+    ITINERARY = 'itinerary'
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    target_type = db.Column(db.String(20), nullable=False)
+    target_id = db.Column(db.Integer, nullable=False)
+    # Not a foreign key: the requesting account may be the one being deleted
+    requested_by = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    step = db.Column(db.String(40))
+    rows_deleted = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    # A running job whose lease has passed belongs to a worker that died and is picked up again
+    lease_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    # Serve the workers' search for the oldest unfinished job, and the latest deletion a user
+    # requested, which moves their calendar feed's Last-Modified
+    __table_args__ = (
+        db.Index('ix_deletion_job_status_id', 'status', 'id'),
+        db.Index('ix_deletion_job_requested_by_created_at', 'requested_by', 'created_at'),
+    )
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'target_type': self.target_type,
+            'target_id': self.target_id,
+            'status': self.status,
+            'rows_deleted': self.rows_deleted,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
 
 # DATA MODLES FOR DIRECT MESSAGES
 class DirectMessages(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    # The first index serves stream replays (a recipient's messages after a given id),
+    # the second a conversation's history in either direction
+    __table_args__ = (
+        db.Index('ix_direct_messages_recipient_id_id', 'recipient_id', 'id'),
+        db.Index('ix_direct_messages_sender_id_recipient_id_id', 'sender_id', 'recipient_id', 'id'),
+    )
+
+    def serialize(self):
+        return {
+            'id': self.id,
+            'sender_id': self.sender_id,
+            'recipient_id': self.recipient_id,
+            'body': self.body,
+            'created_at': self.created_at
+        }
 
 
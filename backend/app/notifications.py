@@ -0,0 +1,138 @@
+"""
+This module writes inbox notifications in the background, coalesced per recipient.
+
+Sharing an itinerary with a large group would cost a notification insert per
+recipient if it were done on the request path. Instead requests hand their
+notifications to a per-process `NotificationQueue` and return. A background
+thread flushes the queue every `NOTIFICATION_FLUSH_INTERVAL` seconds with one
+multi-row INSERT, writing a single row per recipient and kind for everything
+queued since the last flush: three shares in quick succession become one
+"3 itineraries shared with you" notification. Each row keeps the details of at
+most `MAX_COALESCED_ITEMS` of the events it stands for.
+
+Like the like counters (see app.likes), notifications still queued when a
+process dies are lost; the share grants they announce are durable. With
+`NOTIFICATION_FLUSH_INTERVAL` set to 0 every `add` is flushed immediately,
+which keeps tests deterministic.
+"""
+
+import atexit
+import datetime
+import os
+import threading
+
+from sqlalchemy import insert
+
+from . import db
+from .models import Notification
+
+# Details kept per coalesced notification; `count` still covers every event
+MAX_COALESCED_ITEMS = 20
+
+
+class _Pending:
+    __slots__ = ('count', 'items')
+
+    def __init__(self):
+        self.count = 0
+        self.items = []
+
+
+class NotificationQueue:
+    """
+    Per-process buffer of notifications waiting to be written, keyed by
+    `(recipient, kind)` and flushed in batches by a background timer thread.
+    """
+
+    def __init__(self):
+        self.interval = 1.0
+        self._app = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def configure(self, app):
+        self._app = app
+        self.interval = app.config.get('NOTIFICATION_FLUSH_INTERVAL', self.interval)
+
+    def add(self, kind, recipients, item):
+        """
+        Queue the same notification for many recipients. Call after the change it
+        announces has been committed.
+
+        Args:
+            kind (str): Notification kind, e.g. `Notification.ITINERARY_SHARED`.
+            recipients (iterable): User ids to notify.
+            item (dict): JSON-serializable details of the event.
+        """
+        with self._lock:
+            for user_id in recipients:
+                pending = self._pending.get((user_id, kind))
+                if pending is None:
+                    pending = self._pending[(user_id, kind)] = _Pending()
+                pending.count += 1
+                pending.items.append(item)
+                if len(pending.items) > MAX_COALESCED_ITEMS:
+                    del pending.items[0]
+
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Started lazily, and again after a fork, since threads do not survive fork()
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='notification-flush', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('Failed to write notifications')
+
+    def flush(self):
+        """Write every queued notification in one transaction. Returns the number of rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        now = datetime.datetime.utcnow()
+        rows = [{'user_id': user_id, 'kind': kind, 'count': entry.count, 'data': {'items': entry.items},
+                 'created_at': now}
+                for (user_id, kind), entry in pending.items()]
+        try:
+            with self._app.app_context():
+                db.session.execute(insert(Notification), rows)
+                db.session.commit()
+        except Exception:
+            # Merge the notifications back so the next flush retries them
+            with self._lock:
+                for key, entry in pending.items():
+                    current = self._pending.setdefault(key, _Pending())
+                    current.count += entry.count
+                    current.items[:0] = entry.items
+                    del current.items[:-MAX_COALESCED_ITEMS]
+            raise
+        return len(rows)
+
+
+queue = NotificationQueue()
+
+
+def init_app(app):
+    """
+    Configure the notification queue and flush whatever is queued when the process exits.
+    """
+    queue.configure(app)
+    if queue.interval > 0:
+        atexit.register(queue.flush)
@@ -0,0 +1,89 @@
+"""
+This module contains helpers for keyset (cursor) pagination.
+
+A cursor is an opaque, URL-safe token encoding the sort key of the last row on
+a page. The next page is fetched with a `WHERE (created_at, id) < (...)`
+predicate instead of an OFFSET, so every page costs the same index range scan
+no matter how deep the client has paged.
+"""
+
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client supplied cursor cannot be decoded."""
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Encode a `(created_at, id)` sort key into an opaque cursor string.
+
+    Args:
+        created_at (datetime): Timestamp of the last row on the page.
+        row_id (int): Primary key of the last row on the page.
+
+    Returns:
+        str: URL-safe cursor token.
+    """
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): Cursor token supplied by the client.
+
+    Returns:
+        tuple: The `(created_at, id)` sort key.
+
+    Raises:
+        InvalidCursor: If the token is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def parse_limit(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Parse a `limit` query parameter, clamping it to `[1, maximum]`.
+
+    Raises:
+        ValueError: If the value is not an integer.
+    """
+    if value in (None, ''):
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def keyset_filter(created_at_column, id_column, cursor):
+    """
+    Build the predicate selecting rows that sort after `cursor` in
+    `(created_at DESC, id DESC)` order.
+
+    Args:
+        created_at_column: Timestamp column of the sort key.
+        id_column: Primary key column used as the tie breaker.
+        cursor (tuple): Decoded `(created_at, id)` sort key.
+
+    Returns:
+        A SQLAlchemy boolean expression.
+    """
+    created_at, row_id = cursor
+    return or_(
+        created_at_column < created_at,
+        and_(created_at_column == created_at, id_column < row_id),
+    )
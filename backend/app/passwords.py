@@ -0,0 +1,262 @@
+"""
+This module hashes and verifies passwords off the request thread.
+
+Hashes are stored in a self-describing format so the algorithm and work factor
+can change without invalidating existing passwords:
+
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+
+Hashes without a `$` are the original unsalted SHA-256 hex digests. They still
+verify, and `needs_rehash` reports them so the login route can upgrade them.
+A stored hash that cannot be parsed never verifies.
+
+The KDFs are deliberately slow, so they run in a dedicated process pool with a
+bounded number of in-flight jobs. When the pool is saturated `HashingBusy` is
+raised immediately and turned into a 503, instead of letting a burst on /login
+or /register queue up and tie down every request thread. The time spent
+hashing is reported per request in a `Server-Timing` header.
+"""
+
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import g, has_request_context, jsonify
+
+DEFAULT_ALGORITHM = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool has no room for another job."""
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(data):
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def hash_password(password, algorithm=DEFAULT_ALGORITHM, iterations=600000, n=2 ** 14, r=8, p=1):
+    """
+    Hash a password with a fresh salt.
+
+    Args:
+        password (str): The plaintext password.
+        algorithm (str): `pbkdf2_sha256` or `scrypt`.
+        iterations (int): PBKDF2 iteration count.
+        n, r, p (int): scrypt cost parameters.
+
+    Returns:
+        str: The encoded hash, including algorithm and parameters.
+    """
+    salt = os.urandom(SALT_BYTES)
+    if algorithm == 'pbkdf2_sha256':
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+        return f'pbkdf2_sha256${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+    if algorithm == 'scrypt':
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p)
+        return f'scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}'
+    raise ValueError(f'Unsupported password hashing algorithm: {algorithm}')
+
+
+def verify_password(password, encoded):
+    """
+    Check a plaintext password against an encoded hash of any supported format.
+
+    Returns:
+        bool: True if the password matches, False also if `encoded` is malformed.
+    """
+    if '$' not in encoded:
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(candidate, encoded)
+
+    algorithm, *fields = encoded.split('$')
+    try:
+        if algorithm == 'pbkdf2_sha256':
+            iterations, salt, expected = fields
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(salt), int(iterations))
+        elif algorithm == 'scrypt':
+            n, r, p, salt, expected = fields
+            n, r, p = int(n), int(r), int(p)
+            digest = hashlib.scrypt(password.encode(), salt=_b64decode(salt), n=n, r=r, p=p,
+                                    maxmem=256 * n * r * p)
+        else:
+            return False
+        return hmac.compare_digest(digest, _b64decode(expected))
+    except (ValueError, OverflowError):
+        # Wrong field count, non-integer or out of range costs, or bad base64
+        return False
+
+
+def _parameters(encoded):
+    """Return the algorithm and parameters encoded in a hash."""
+    if '$' not in encoded:
+        return ('sha256',)
+    algorithm, *fields = encoded.split('$')
+    try:
+        return (algorithm, *map(int, fields[:-2]))
+    except ValueError:
+        return (algorithm,)
+
+
+class HashingPool:
+    """
+    A process pool for password hashing that admits at most
+    `workers + queue_size` jobs at a time.
+
+    With `workers` set to 0 hashing runs inline on the calling thread, which
+    keeps tests and single-process development simple.
+    """
+
+    def __init__(self):
+        self.algorithm = DEFAULT_ALGORITHM
+        self.params = {'iterations': 600000, 'n': 2 ** 14, 'r': 8, 'p': 1}
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = 10
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def configure(self, config):
+        self.algorithm = config.get('PASSWORD_HASH_ALGORITHM', self.algorithm)
+        self.params = {
+            'iterations': config.get('PASSWORD_HASH_ITERATIONS', self.params['iterations']),
+            'n': config.get('PASSWORD_HASH_SCRYPT_N', self.params['n']),
+            'r': config.get('PASSWORD_HASH_SCRYPT_R', self.params['r']),
+            'p': config.get('PASSWORD_HASH_SCRYPT_P', self.params['p']),
+        }
+        self.workers = config.get('HASH_POOL_WORKERS', self.workers)
+        self.queue_size = config.get('HASH_POOL_QUEUE_SIZE', self.queue_size)
+        self.timeout = config.get('HASH_POOL_TIMEOUT', self.timeout)
+        self.shutdown()
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork, so pre-forking servers don't share a pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run `fn` in the pool and wait for its result, recording the elapsed
+        time on the current request.
+
+        Raises:
+            HashingBusy: If the pool is saturated or the job times out.
+        """
+        started = time.perf_counter()
+        try:
+            if not self.workers:
+                return fn(*args, **kwargs)
+
+            executor = self._get_executor()
+            slots = self._slots
+            if not slots.acquire(blocking=False):
+                raise HashingBusy('Password hashing is at capacity')
+            try:
+                future = executor.submit(fn, *args, **kwargs)
+            except BaseException:
+                slots.release()
+                raise
+            future.add_done_callback(lambda _: slots.release())
+            try:
+                return future.result(timeout=self.timeout)
+            except TimeoutError as e:
+                raise HashingBusy('Password hashing timed out') from e
+        finally:
+            if has_request_context():
+                g.password_hash_ms = g.get('password_hash_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+    def hash(self, password):
+        return self.run(hash_password, password, self.algorithm, **self.params)
+
+    def hash_many(self, passwords):
+        """
+        Hash a list of passwords in parallel for bulk jobs.
+
+        At most `workers` of them are in the pool at a time and each waits for
+        a free slot, so requests hashing concurrently are delayed by at most one
+        round of bulk jobs instead of being refused.
+        """
+        if not self.workers:
+            return [self.hash(password) for password in passwords]
+
+        executor = self._get_executor()
+        slots, in_flight = self._slots, threading.BoundedSemaphore(self.workers)
+
+        def release(_):
+            slots.release()
+            in_flight.release()
+
+        futures = []
+        for password in passwords:
+            in_flight.acquire()
+            slots.acquire()
+            try:
+                future = executor.submit(hash_password, password, self.algorithm, **self.params)
+            except BaseException:
+                release(None)
+                raise
+            future.add_done_callback(release)
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def verify(self, password, encoded):
+        return self.run(verify_password, password, encoded)
+
+    def needs_rehash(self, encoded):
+        """Return True if `encoded` was not produced with the current algorithm and parameters."""
+        if self.algorithm == 'scrypt':
+            current = ('scrypt', self.params['n'], self.params['r'], self.params['p'])
+        else:
+            current = (self.algorithm, self.params['iterations'])
+        return _parameters(encoded) != current
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pool = HashingPool()
+
+
+def _add_server_timing(response):
+    elapsed = g.get('password_hash_ms')
+    if elapsed is not None:
+        timing = f'hash;desc="password hashing";dur={elapsed:.1f}'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+    return response
+
+
+def _hashing_busy(error):
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+def init_app(app):
+    """
+    Configure the hashing pool from the app config and register the 503
+    handler and the Server-Timing hook.
+    """
+    pool.configure(app.config)
+    app.after_request(_add_server_timing)
+    app.register_error_handler(HashingBusy, _hashing_busy)
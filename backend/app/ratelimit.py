@@ -0,0 +1,256 @@
+"""
+This module rate limits the authentication endpoints per client IP and per
+username and client IP.
+
+Each limit is a token bucket, kept as a generic cell rate algorithm (GCRA): a
+limit of N requests per period P refills one token every P/N seconds, and the
+whole state of a bucket is the single time at which it will be full again.
+A request is allowed when taking one token would not push that time more than
+P into the future. Storing one float per key keeps the in-memory store compact,
+and a key whose time is in the past holds no information at all, so idle keys
+are simply dropped by a periodic sweep.
+
+With `RATE_LIMIT_BACKEND` set to 'database' the buckets live in the
+`rate_limit_bucket` table instead, updated with one atomic upsert per key, all
+in a single transaction per request, so limits hold across every worker sharing
+the database. A database error lets the request through rather than locking
+everyone out of their accounts.
+
+Limits are checked before the endpoint touches the database or the hashing pool,
+and exceeding one is answered with a 429 and a `Retry-After` header. Since that
+is before the credentials are known, a bucket keyed on the username alone would
+let anyone lock an account out by failing to log in to it; username buckets are
+therefore kept per client IP as well. Clients
+are identified by `request.remote_addr`; behind a reverse proxy the app must be
+wrapped in werkzeug's `ProxyFix` so that it is the client's address.
+"""
+
+import functools
+import logging
+import math
+import re
+import threading
+import time
+
+from flask import jsonify, request
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from .bulk import upsert_insert
+from .models import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+# Longest username kept in a key, so clients cannot grow the store with huge usernames
+MAX_KEY_VALUE = 100
+
+
+class RateLimited(Exception):
+    """Raised when a request exceeds one of its rate limits."""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Rate limit exceeded, retry in {retry_after:.1f}s')
+        self.retry_after = retry_after
+
+
+class Limit:
+    """`count` requests per `period` seconds, all of which may arrive at once."""
+
+    __slots__ = ('count', 'period', 'interval')
+
+    def __init__(self, count, period):
+        if count < 1 or period <= 0:
+            raise ValueError('A rate limit needs a positive count and period')
+        self.count = count
+        self.period = float(period)
+        # Time for one token to come back
+        self.interval = self.period / count
+
+    def __repr__(self):
+        return f'Limit({self.count}, {self.period:g})'
+
+
+def parse_limit(text):
+    """
+    Parse a limit such as '5/minute' or '100/15minutes'.
+
+    Raises:
+        ValueError: If the text is not a limit.
+    """
+    match = LIMIT_PATTERN.match(text or '')
+    if match is None:
+        raise ValueError(f'Invalid rate limit: {text!r}')
+    count, multiplier, unit = match.groups()
+    return Limit(int(count), int(multiplier or 1) * PERIODS[unit])
+
+
+class MemoryStore:
+    """Buckets of this process, as a dict from key to the time the bucket is full again."""
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, sweep_interval=60.0):
+        self.sweep_interval = sweep_interval
+        self._full_at = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def __len__(self):
+        return len(self._full_at)
+
+    def hit(self, charges):
+        """
+        Take a token from the bucket of each `(key, limit)` in turn, stopping at the first empty one.
+        Return 0 if every token was taken, or the seconds until the empty bucket has one again.
+        """
+        now = self.clock()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            for key, limit in charges:
+                full_at = max(self._full_at.get(key, now), now) + limit.interval
+                if full_at - now > limit.period:
+                    return full_at - limit.period - now
+                self._full_at[key] = full_at
+            return 0.0
+
+    def _sweep(self, now):
+        # Rebuilding the dict, rather than deleting from it, also gives back the memory of dropped keys
+        self._full_at = {key: full_at for key, full_at in self._full_at.items() if full_at > now}
+        self._next_sweep = now + self.sweep_interval
+
+    def clear(self):
+        with self._lock:
+            self._full_at.clear()
+
+
+class DatabaseStore:
+    """Buckets shared by every worker, stored in the `rate_limit_bucket` table."""
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, sweep_interval=60.0):
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _statement(dialect, key, limit, now):
+        table = RateLimitBucket.__table__
+        statement = upsert_insert(table, dialect)
+        greatest = func.greatest if dialect == 'postgresql' else func.max
+
+        full_at = greatest(table.c.full_at, now) + limit.interval
+        # The update only happens, and a row is only returned, when the request is allowed
+        return (statement.values(key=key, full_at=now + limit.interval)
+                .on_conflict_do_update(index_elements=['key'], set_={'full_at': full_at},
+                                       where=full_at - now <= limit.period)
+                .returning(table.c.full_at))
+
+    def hit(self, charges):
+        """
+        Take a token from the bucket of each `(key, limit)` in turn, stopping at the first empty one,
+        in a single transaction. Return 0 if every token was taken, or the seconds until the empty
+        bucket has one again.
+        """
+        now = self.clock()
+        try:
+            with db.engine.begin() as connection:
+                self._maybe_sweep(connection, now)
+                for key, limit in charges:
+                    statement = self._statement(connection.dialect.name, key, limit, now)
+                    if connection.execute(statement).first() is None:
+                        full_at = connection.scalar(select(RateLimitBucket.full_at)
+                                                    .where(RateLimitBucket.key == key))
+                        return max(0.0, max(full_at or now, now) + limit.interval - limit.period - now)
+        except SQLAlchemyError:
+            logger.warning('Rate limit store unavailable, allowing the request', exc_info=True)
+        return 0.0
+
+    def _maybe_sweep(self, connection, now):
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        connection.execute(delete(RateLimitBucket).where(RateLimitBucket.full_at <= now))
+
+    def clear(self):
+        with db.engine.begin() as connection:
+            connection.execute(delete(RateLimitBucket))
+
+
+class Limiter:
+    """The limits of each rate limited endpoint and the store of their buckets."""
+
+    def __init__(self):
+        self.enabled = False
+        self.store = MemoryStore()
+        # (endpoint name, 'ip' or 'username') -> Limit
+        self.limits = {}
+
+    def configure(self, config):
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        sweep_interval = config.get('RATE_LIMIT_SWEEP_INTERVAL', 60.0)
+        if config.get('RATE_LIMIT_BACKEND', 'memory') == 'database':
+            self.store = DatabaseStore(sweep_interval)
+        else:
+            self.store = MemoryStore(sweep_interval)
+
+        self.limits = {}
+        for name in ('login', 'register'):
+            for kind in ('ip', 'username'):
+                text = config.get(f'RATE_LIMIT_{name.upper()}_PER_{kind.upper()}')
+                if text:
+                    self.limits[name, kind] = parse_limit(text)
+
+    def check(self, name, ip=None, username=None):
+        """
+        Charge a request to `name` against its per-IP limit and the IP's own
+        per-username limit, so other clients never use up an account's attempts.
+
+        The username is only charged when the IP is within its limit, so one
+        client cannot use up the attempts of an account it is being throttled on.
+
+        Raises:
+            RateLimited: If either limit is exceeded.
+        """
+        if not self.enabled:
+            return
+        charges = [(f'{name}:{kind}:{value}', self.limits[name, kind])
+                   for kind, value in (('ip', ip), ('username', username and f'{username[:MAX_KEY_VALUE]}@{ip}'))
+                   if value and (name, kind) in self.limits]
+        retry_after = self.store.hit(charges) if charges else 0.0
+        if retry_after:
+            raise RateLimited(retry_after)
+
+
+limiter = Limiter()
+
+
+def rate_limited(name):
+    """Check the limits configured for `name` (e.g. `RATE_LIMIT_LOGIN_PER_IP`) before running the view."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if limiter.enabled:
+                body = request.get_json(silent=True)
+                username = body.get('username') if isinstance(body, dict) else None
+                limiter.check(name, request.remote_addr, username if isinstance(username, str) else None)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _rate_limited(error):
+    response = jsonify({'error': 'Too many attempts, please try again later'})
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response, 429
+
+
+def init_app(app):
+    """Configure the limits and the store from the app config and register the 429 handler."""
+    limiter.configure(app.config)
+    app.register_error_handler(RateLimited, _rate_limited)
@@ -0,0 +1,143 @@
+"""
+This module sizes the database connection pools and routes reads to a replica.
+
+Engine options come from the config (see `Config`), so pool size, overflow,
+pre-ping, recycling and the statement timeout can be tuned per deployment from
+the environment. When `SQLALCHEMY_REPLICA_URI` is set, it is added as the
+'replica' bind and `RoutingSession` sends the queries of GET and HEAD requests
+to it. Everything else goes to the primary:
+
+* requests with any other method,
+* INSERT/UPDATE/DELETE statements and ORM flushes, whatever the method,
+* every request made by a user who wrote to the primary less than
+  `REPLICA_STICKY_SECONDS` ago, so users always read their own writes even
+  while the replica lags behind.
+
+The sticky window travels with the client, so it holds whichever worker
+serves the next request: a successful write sets a short-lived signed cookie
+carrying "primary until T". Clients that drop cookies fall back to a per
+process `TTLCache` keyed by JWT identity. Routes that write without an
+authenticated identity (registration, login, username changes) call
+`mark_written` themselves.
+"""
+
+import hashlib
+import math
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy.engine import make_url
+
+from .cache import TTLCache
+
+REPLICA = 'replica'
+READ_METHODS = {'GET', 'HEAD'}
+PRIMARY_COOKIE = 'read_primary'
+
+# JWT identities that wrote recently and must read from the primary
+recent_writers = TTLCache(maxsize=100000, ttl=5.0)
+
+
+def engine_options(url, config):
+    """
+    Build `SQLALCHEMY_ENGINE_OPTIONS` for a database URL from the pool settings.
+    Options the dialect's pool does not support are left out.
+    """
+    options = {
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 1800),
+    }
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite keeps one connection per thread and takes no sizing options
+        return options
+
+    options['pool_size'] = config.get('DB_POOL_SIZE', 5)
+    options['max_overflow'] = config.get('DB_MAX_OVERFLOW', 10)
+    options['pool_timeout'] = config.get('DB_POOL_TIMEOUT', 30)
+    statement_timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout and backend == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout)}'}
+    return options
+
+
+def mark_written(identity):
+    """Send `identity`'s reads to the primary for the next `REPLICA_STICKY_SECONDS`."""
+    if identity is not None:
+        recent_writers.set(identity, True)
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['JWT_SECRET_KEY'], salt='read-primary',
+                             signer_kwargs={'digest_method': hashlib.sha256})
+
+
+def primary_until():
+    """Return when the current request's sticky cookie expires, or 0 if it has no valid one."""
+    token = request.cookies.get(PRIMARY_COOKIE)
+    if not token:
+        return 0
+    try:
+        until = _serializer().loads(token)
+    except BadSignature:
+        return 0
+    return until if isinstance(until, (int, float)) else 0
+
+
+def reads_from_replica():
+    """Return True if the current request's reads may be served by the replica."""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return False
+    if primary_until() > time.time():
+        return False
+    identity = g.get('jwt_identity')
+    return identity is None or not recent_writers.get(identity)
+
+
+class RoutingSession(Session):
+    """
+    Session that executes the reads of read-only requests on the 'replica'
+    bind when one is configured.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None and reads_from_replica():
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _remember_writer(response):
+    if request.method not in READ_METHODS and response.status_code < 400:
+        mark_written(g.get('jwt_identity'))
+        sticky = current_app.config.get('REPLICA_STICKY_SECONDS', recent_writers.ttl)
+        response.set_cookie(PRIMARY_COOKIE, _serializer().dumps(time.time() + sticky), max_age=math.ceil(sticky),
+                            httponly=True, samesite='Lax')
+    return response
+
+
+def configure(app):
+    """
+    Fill in the engine options and the replica bind from the config. Must run
+    before `db.init_app`.
+    """
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+
+    replica_uri = config.get('SQLALCHEMY_REPLICA_URI')
+    if replica_uri:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA, {'url': replica_uri, **engine_options(replica_uri, config)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app):
+    """
+    Size the sticky window from the config and remember which users write.
+    """
+    recent_writers.ttl = app.config.get('REPLICA_STICKY_SECONDS', recent_writers.ttl)
+    app.after_request(_remember_writer)
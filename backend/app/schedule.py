@@ -0,0 +1,118 @@
+"""
+This module detects overlapping events across all of a user's itineraries.
+
+An event runs from `time_of_event` to `ends_at`; without an end it is a single
+instant. Two events conflict when each starts before the other ends, or when
+they start at the same time, so back-to-back events are fine but two events
+booked for the same slot are not.
+
+Events can last at most `MAX_EVENT_DURATION`. That bound turns "which events
+overlap [start, end)" into a range scan of the `(itinerary_id, time_of_event)`
+index over `[start - MAX_EVENT_DURATION, end]` instead of a scan of every event.
+
+`sweep_conflicts` finds every conflicting pair with one pass over the events in
+start order, holding only the events still running at the current time.
+"""
+
+import datetime
+import heapq
+
+from sqlalchemy import and_, func, or_, select
+
+from . import db
+from .models import Event, Itinerary
+
+MAX_EVENT_DURATION = datetime.timedelta(days=14)
+SWEEP_BATCH_SIZE = 1000
+
+# An event without an end time ends when it starts
+event_end = func.coalesce(Event.ends_at, Event.time_of_event)
+
+
+def validate_interval(start, end):
+    """
+    Raises:
+        ValueError: If `end` is before `start` or the event is longer than `MAX_EVENT_DURATION`.
+    """
+    if end is None:
+        return
+    if end < start:
+        raise ValueError('ends_at must not be before time_of_event')
+    if end - start > MAX_EVENT_DURATION:
+        raise ValueError(f'Events can last at most {MAX_EVENT_DURATION.days} days')
+
+
+def overlapping_events(user_id, start, end=None, exclude_id=None, limit=10):
+    """
+    Return up to `limit` of the user's events that conflict with an event from `start` to `end`.
+
+    Args:
+        user_id (int): Owner whose itineraries are checked.
+        start (datetime): Start of the new or updated event.
+        end (datetime): Its end, or None for an instant.
+        exclude_id (int): Event to leave out, e.g. the one being updated.
+    """
+    end = end or start
+    statement = (select(Event)
+                 .join(Itinerary, Itinerary.id == Event.itinerary_id)
+                 .where(Itinerary.user_id == user_id,
+                        # The indexed range: nothing starting earlier can still be running
+                        Event.time_of_event.between(start - MAX_EVENT_DURATION, end),
+                        or_(and_(Event.time_of_event < end, event_end > start), Event.time_of_event == start))
+                 .order_by(Event.time_of_event, Event.id)
+                 .limit(limit))
+    if exclude_id is not None:
+        statement = statement.where(Event.id != exclude_id)
+    return db.session.scalars(statement).all()
+
+
+def _summary(row):
+    return {
+        'id': row.id,
+        'itinerary_id': row.itinerary_id,
+        'event_name': row.event_name,
+        'time_of_event': row.time_of_event,
+        'ends_at': row.ends_at,
+    }
+
+
+def sweep_conflicts(user_id, since=None, until=None):
+    """
+    Yield `(first, second)` summaries of every pair of the user's conflicting
+    events, ordered by the start of `second`.
+
+    Events are streamed in start order in batches of `SWEEP_BATCH_SIZE`. Only
+    the events still running at the current start (and those sharing it) are
+    kept, so memory depends on how many events overlap, not on how many there are.
+    """
+    statement = (select(Event.id, Event.itinerary_id, Event.event_name, Event.time_of_event, Event.ends_at)
+                 .join(Itinerary, Itinerary.id == Event.itinerary_id)
+                 .where(Itinerary.user_id == user_id, Event.time_of_event.is_not(None))
+                 .order_by(Event.time_of_event, Event.id))
+    if since is not None:
+        # Events that started up to MAX_EVENT_DURATION earlier may still be running
+        statement = statement.where(Event.time_of_event >= since - MAX_EVENT_DURATION)
+    if until is not None:
+        statement = statement.where(Event.time_of_event < until)
+
+    running = []  # heap of (end, id, summary)
+    same_start, current_start = [], None
+    for row in db.session.execute(statement.execution_options(yield_per=SWEEP_BATCH_SIZE)):
+        start = row.time_of_event
+        summary = _summary(row)
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        if start != current_start:
+            same_start, current_start = [], start
+
+        # Everything left in `running` ends after this event starts
+        conflicts = {entry[1]: entry[2] for entry in running}
+        conflicts.update((other['id'], other) for other in same_start)
+        if since is None or (row.ends_at or start) >= since:
+            for other in sorted(conflicts.values(), key=lambda other: (other['time_of_event'], other['id'])):
+                yield other, summary
+
+        same_start.append(summary)
+        end = row.ends_at or start
+        if end > start:
+            heapq.heappush(running, (end, row.id, summary))
@@ -0,0 +1,116 @@
+"""
+This module implements indexed substring search over itinerary names.
+
+A leading-wildcard `ILIKE '%term%'` cannot use a B-tree index, so each backend
+gets a trigram index instead:
+
+* PostgreSQL: a pg_trgm GIN index on `itinerary.itinerary_name`. `ILIKE` can use
+  it directly and results are ranked by `similarity()`.
+* SQLite: a contentless FTS5 table using the trigram tokenizer, kept in sync
+  with `itinerary` by triggers and ranked by bm25. Each row also indexes an
+  `#<user_id>#` owner token so the user scope is resolved inside the index
+  rather than by filtering every match across all users.
+
+Terms shorter than a trigram cannot use either index and fall back to a plain
+`LIKE`, which is still bounded by the per-user index on `itinerary.user_id`.
+"""
+
+from sqlalchemy import DDL, Integer, String, column, event, func, table
+
+from . import db
+from .models import Itinerary
+
+TRIGRAM_LENGTH = 3
+
+# The FTS5 shadow table is not part of the ORM metadata; this lightweight
+# construct is only used to build queries against it.
+itinerary_fts = table(
+    'itinerary_fts',
+    column('rowid', Integer),
+    column('itinerary_fts', String),
+    column('rank'),
+)
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS itinerary_fts USING fts5(
+        itinerary_name, owner, content='', tokenize='trigram'
+    )""",
+    # Rank on the name only; the owner token is there for filtering
+    "INSERT INTO itinerary_fts(itinerary_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+    """CREATE TRIGGER IF NOT EXISTS itinerary_fts_ai AFTER INSERT ON itinerary BEGIN
+        INSERT INTO itinerary_fts(rowid, itinerary_name, owner)
+        VALUES (new.id, new.itinerary_name, '#' || new.user_id || '#');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS itinerary_fts_ad AFTER DELETE ON itinerary BEGIN
+        INSERT INTO itinerary_fts(itinerary_fts, rowid, itinerary_name, owner)
+        VALUES ('delete', old.id, old.itinerary_name, '#' || old.user_id || '#');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS itinerary_fts_au AFTER UPDATE OF itinerary_name, user_id ON itinerary BEGIN
+        INSERT INTO itinerary_fts(itinerary_fts, rowid, itinerary_name, owner)
+        VALUES ('delete', old.id, old.itinerary_name, '#' || old.user_id || '#');
+        INSERT INTO itinerary_fts(rowid, itinerary_name, owner)
+        VALUES (new.id, new.itinerary_name, '#' || new.user_id || '#');
+    END""",
+]
+
+# Backfills the contentless index from rows that existed before it
+SQLITE_BACKFILL = """INSERT INTO itinerary_fts(rowid, itinerary_name, owner)
+    SELECT id, itinerary_name, '#' || user_id || '#' FROM itinerary"""
+
+POSTGRESQL_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_itinerary_name_trgm ON itinerary USING gin (itinerary_name gin_trgm_ops)',
+]
+
+# Create the search structures whenever the itinerary table is created outside of
+# migrations (db.create_all() in tests and benchmarks).
+for statement in SQLITE_DDL:
+    event.listen(Itinerary.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRESQL_DDL:
+    event.listen(Itinerary.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(Itinerary.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS itinerary_fts').execute_if(dialect='sqlite'))
+
+
+def _like_pattern(term):
+    """Escape LIKE wildcards in a user supplied term and wrap it for substring matching."""
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _fts_phrase(text):
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def search_itineraries(query, user_id, term, dialect=None):
+    """
+    Narrow an itinerary query to the user's rows whose name contains `term`,
+    best match first. Ranking is applied before any ordering the caller adds
+    afterwards.
+
+    Args:
+        query: A `Query` or `Select` over `Itinerary`.
+        user_id (int): Owner the search is scoped to.
+        term (str): Substring to search for, case-insensitively.
+        dialect (str): Database dialect name. Defaults to the bound engine's.
+
+    Returns:
+        The filtered and ranked query.
+    """
+    dialect = dialect or db.engine.dialect.name
+    query = query.filter(Itinerary.user_id == user_id)
+
+    if len(term) < TRIGRAM_LENGTH:
+        return query.filter(Itinerary.itinerary_name.ilike(_like_pattern(term), escape='\\'))
+
+    if dialect == 'sqlite':
+        match = 'owner : {} AND itinerary_name : {}'.format(_fts_phrase(f'#{user_id}#'), _fts_phrase(term))
+        return (query
+                .join(itinerary_fts, itinerary_fts.c.rowid == Itinerary.id)
+                .filter(itinerary_fts.c.itinerary_fts.op('MATCH')(match))
+                .order_by(itinerary_fts.c.rank))
+
+    query = query.filter(Itinerary.itinerary_name.ilike(_like_pattern(term), escape='\\'))
+    if dialect == 'postgresql':
+        query = query.order_by(func.similarity(Itinerary.itinerary_name, term).desc())
+    return query
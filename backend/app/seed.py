@@ -0,0 +1,307 @@
+"""
+This module implements `flask seed`, which fills the database with a large
+synthetic dataset for capacity planning and benchmarks.
+
+It generates users, itineraries per user, events per itinerary and follow
+edges from configurable distributions, optionally skewed so that a few hot
+users attract most followers. Everything is derived from `--seed`, so the same
+options produce the same rows on the same starting database.
+
+Rows are written in batches through `app.bulk` (COPY on PostgreSQL,
+`executemany` elsewhere) with explicit primary keys, so nothing is read back
+while loading. Secondary indexes of the loaded tables are dropped first and
+rebuilt once at the end, which is much cheaper than maintaining them row by
+row. This is meant for development and staging databases: the app should not
+be serving traffic while it runs.
+
+    flask seed --users 100000 --itineraries-per-user 5 --events-per-itinerary 20 --skew 1.1
+"""
+
+import bisect
+import datetime
+import itertools
+import math
+import random
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+
+from . import db
+from .bulk import write_rows
+from . import geo
+from .models import Event, FeedEntry, Followers, Itinerary, User
+from .passwords import pool
+from .search import POSTGRESQL_DDL
+
+DISTRIBUTIONS = ('constant', 'uniform', 'poisson', 'pareto')
+
+CITIES = [('Lisbon', 'Lisboa', 38.72, -9.14), ('Porto', 'Porto', 41.15, -8.61), ('Austin', 'TX', 30.27, -97.74),
+          ('Denver', 'CO', 39.74, -104.99), ('Kyoto', 'Kyoto', 35.01, 135.77), ('Paris', 'Ile-de-France', 48.86, 2.35),
+          ('Rome', 'Lazio', 41.90, 12.50), ('Oaxaca', 'Oaxaca', 17.07, -96.73), ('Cusco', 'Cusco', -13.53, -71.97),
+          ('Hanoi', 'Hanoi', 21.03, 105.85), ('Berlin', 'Berlin', 52.52, 13.40), ('Seattle', 'WA', 47.61, -122.33)]
+ACTIVITIES = ['Breakfast', 'Museum visit', 'Walking tour', 'Lunch', 'Hike', 'Market', 'Dinner', 'Concert',
+              'Boat trip', 'Check in', 'Cooking class', 'Flight']
+PLACES = ['Old Town', 'Harbour', 'Central Station', 'Riverside', 'Main Square', 'Botanical Garden']
+TRIP_WORDS = ['weekend', 'honeymoon', 'roadtrip', 'conference', 'family trip', 'summer', 'backpacking']
+
+# (user, itinerary, event, followers and feed entry columns) in the order rows are generated
+USER_COLUMNS = ('id', 'username', 'email_address', 'password_hash', 'created_at', 'updated_at', 'version',
+                'is_private', 'followers_count', 'following_count', 'fanout_on_read')
+ITINERARY_COLUMNS = ('id', 'user_id', 'itinerary_name', 'created_at', 'updated_at', 'version')
+EVENT_COLUMNS = ('id', 'itinerary_id', 'time_of_event', 'ends_at', 'event_name', 'event_description', 'event_location',
+                 'event_address', 'event_city', 'event_state', 'latitude', 'longitude', 'geohash')
+FOLLOWER_COLUMNS = ('follower_id', 'followee_id', 'status', 'created_at')
+
+DEFERRED_INDEX_TABLES = (Itinerary, Event, Followers, FeedEntry)
+
+
+def sampler(distribution, mean, rng):
+    """
+    Return a function drawing non-negative integers with the given mean.
+
+    'pareto' is heavy tailed: most draws are small and a few are very large.
+    """
+    if distribution == 'constant':
+        value = round(mean)
+        return lambda: value
+    if distribution == 'uniform':
+        high = round(2 * mean)
+        return lambda: rng.randint(0, high)
+    if distribution == 'poisson':
+        if mean < 30:
+            limit = math.exp(-mean)
+
+            def draw():
+                # Knuth's method, fine for small means
+                count, product = 0, rng.random()
+                while product > limit:
+                    count += 1
+                    product *= rng.random()
+                return count
+            return draw
+        deviation = math.sqrt(mean)
+        return lambda: max(0, round(rng.gauss(mean, deviation)))
+    if distribution == 'pareto':
+        # alpha = 2 gives a mean of 2 * scale
+        scale = mean / 2
+        cap = max(1, round(mean * 100))
+        return lambda: min(cap, int(rng.paretovariate(2.0) * scale))
+    raise ValueError(f'Unknown distribution: {distribution}')
+
+
+def zipf_cumulative_weights(count, skew):
+    """Cumulative weights making rank r (0-based) `(r + 1) ** -skew` times as likely; 0 skew is uniform."""
+    return list(itertools.accumulate((rank + 1) ** -skew for rank in range(count)))
+
+
+def follow_edges(user_ids, follows, skew, rng):
+    """
+    Generate `(follower_id, followee_id)` pairs. Every user follows about
+    `follows()` others, chosen with Zipf skew so the first users are the hot ones.
+    """
+    cumulative = zipf_cumulative_weights(len(user_ids), skew)
+    total = cumulative[-1]
+    last = len(user_ids) - 1
+    for follower_id in user_ids:
+        wanted = min(follows(), last)
+        followees = set()
+        # Bounded retries: a user cannot follow itself and edges are unique
+        for _ in range(wanted * 3):
+            if len(followees) == wanted:
+                break
+            followee_id = user_ids[bisect.bisect_left(cumulative, rng.random() * total)]
+            if followee_id != follower_id:
+                followees.add(followee_id)
+        for followee_id in sorted(followees):
+            yield follower_id, followee_id
+
+
+def _place(latitude, longitude):
+    latitude, longitude = round(latitude, 6), round(longitude, 6)
+    return latitude, longitude, geo.encode(latitude, longitude)
+
+
+def _next_id(connection, model):
+    return (connection.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _deferred_indexes():
+    return [index for model in DEFERRED_INDEX_TABLES for index in model.__table__.indexes]
+
+
+class _Loader:
+    """Buffers rows per table and writes each table's buffer in one bulk statement."""
+
+    def __init__(self, connection, batch_size):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.written = {}
+
+    def add(self, table_name, columns, row):
+        buffer = self.buffers.setdefault(table_name, (columns, []))[1]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Buffers are flushed in insertion order, so parents are written before their children
+        for table_name, (columns, rows) in self.buffers.items():
+            write_rows(self.connection, table_name, columns, rows)
+            self.written[table_name] = self.written.get(table_name, 0) + len(rows)
+            rows.clear()
+        self.connection.commit()
+
+
+@click.command('seed')
+@click.option('--users', default=1000, show_default=True, help='Number of users to create.')
+@click.option('--itineraries-per-user', default=5.0, show_default=True, help='Mean itineraries per user.')
+@click.option('--itinerary-distribution', type=click.Choice(DISTRIBUTIONS), default='poisson', show_default=True)
+@click.option('--events-per-itinerary', default=20.0, show_default=True, help='Mean events per itinerary.')
+@click.option('--event-distribution', type=click.Choice(DISTRIBUTIONS), default='poisson', show_default=True)
+@click.option('--follows-per-user', default=20.0, show_default=True, help='Mean users each user follows.')
+@click.option('--follow-distribution', type=click.Choice(DISTRIBUTIONS), default='pareto', show_default=True)
+@click.option('--skew', default=1.0, show_default=True,
+              help='Zipf exponent for picking followees; 0 is uniform, higher concentrates followers on hot users.')
+@click.option('--private-fraction', default=0.05, show_default=True, help='Share of private accounts.')
+@click.option('--days', default=365, show_default=True, help='Timestamps are spread over this many days.')
+@click.option('--start', default='2024-01-01', show_default=True, help='First day of the generated timeline.')
+@click.option('--password', default='password', show_default=True, help='Password of every generated user.')
+@click.option('--seed', 'seed_value', default=0, show_default=True, help='Random seed.')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per bulk statement.')
+@click.option('--feeds/--no-feeds', default=True, show_default=True, help='Materialize home feed entries.')
+@click.option('--defer-indexes/--keep-indexes', default=True, show_default=True,
+              help='Drop secondary indexes while loading and rebuild them at the end.')
+@with_appcontext
+def seed_command(users, itineraries_per_user, itinerary_distribution, events_per_itinerary, event_distribution,
+                 follows_per_user, follow_distribution, skew, private_fraction, days, start, password, seed_value,
+                 batch_size, feeds, defer_indexes):
+    """Generate a large synthetic dataset with bulk inserts."""
+    rng = random.Random(seed_value)
+    start = datetime.datetime.strptime(start, '%Y-%m-%d')
+    span = days * 86400
+
+    def timestamp(offset):
+        # The text form SQLAlchemy stores on SQLite; PostgreSQL parses it as well
+        return (start + datetime.timedelta(seconds=offset)).isoformat(' ', 'microseconds')
+
+    started = time.perf_counter()
+    password_hash = pool.hash(password)
+    engine = db.engine
+
+    with engine.connect() as connection:
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            # Durability is not needed for a dataset that can be regenerated
+            connection.exec_driver_sql('PRAGMA synchronous = OFF')
+
+        has_rtree = dialect == 'sqlite' and connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'event_rtree'").first() is not None
+
+        first_user = _next_id(connection, User)
+        first_itinerary = _next_id(connection, Itinerary)
+        first_event = _next_id(connection, Event)
+        user_ids = list(range(first_user, first_user + users))
+
+        # The follow graph comes first so user rows can carry their final counts
+        click.echo(f'Generating follow graph for {users} users...')
+        private = {user_id for user_id in user_ids if rng.random() < private_fraction}
+        edges = list(follow_edges(user_ids, sampler(follow_distribution, follows_per_user, rng), skew, rng))
+        followers_count = dict.fromkeys(user_ids, 0)
+        following_count = dict.fromkeys(user_ids, 0)
+        for follower_id, followee_id in edges:
+            if followee_id not in private:
+                followers_count[followee_id] += 1
+                following_count[follower_id] += 1
+        fanout_limit = current_app.config.get('FEED_FANOUT_LIMIT', 10000)
+
+        if defer_indexes:
+            for index in _deferred_indexes():
+                index.drop(connection, checkfirst=True)
+            if dialect == 'postgresql':
+                connection.exec_driver_sql('DROP INDEX IF EXISTS ix_itinerary_name_trgm')
+            elif has_rtree:
+                # The spatial index is filled in one pass at the end instead of by a trigger per row
+                connection.exec_driver_sql('DROP TRIGGER IF EXISTS event_rtree_ai')
+            connection.commit()
+
+        loader = _Loader(connection, batch_size)
+
+        click.echo('Loading users and follow edges...')
+        for user_id in user_ids:
+            created_at = timestamp(rng.randrange(span))
+            loader.add('user', USER_COLUMNS, (
+                user_id, f'user{user_id}', f'user{user_id}@example.com', password_hash, created_at, created_at, 1,
+                user_id in private, followers_count[user_id], following_count[user_id],
+                followers_count[user_id] > fanout_limit))
+        for follower_id, followee_id in edges:
+            status = Followers.PENDING if followee_id in private else Followers.ACCEPTED
+            loader.add('followers', FOLLOWER_COLUMNS,
+                       (follower_id, followee_id, status, timestamp(rng.randrange(span))))
+        loader.flush()
+        del edges
+
+        click.echo('Loading itineraries and events...')
+        itineraries = sampler(itinerary_distribution, itineraries_per_user, rng)
+        events = sampler(event_distribution, events_per_itinerary, rng)
+        # Places are spread a few kilometres around each city centre
+        templates = [(activity, f'{activity} at {place}', place, f'{rng.randint(1, 999)} {place} Street', city, state,
+                      *_place(latitude + rng.uniform(-0.05, 0.05), longitude + rng.uniform(-0.05, 0.05)))
+                     for activity in ACTIVITIES for place in PLACES for city, state, latitude, longitude in CITIES]
+        itinerary_id, event_id = first_itinerary, first_event
+        for user_id in user_ids:
+            for _ in range(itineraries()):
+                offset = rng.randrange(span)
+                created_at = timestamp(offset)
+                city = rng.choice(CITIES)[0]
+                loader.add('itinerary', ITINERARY_COLUMNS, (
+                    itinerary_id, user_id, f'{city} {rng.choice(TRIP_WORDS)} {itinerary_id}', created_at, created_at, 1))
+                for _ in range(events()):
+                    starts = offset + rng.randrange(14 * 86400)
+                    loader.add('event', EVENT_COLUMNS, (event_id, itinerary_id, timestamp(starts),
+                                                        timestamp(starts + rng.randrange(1800, 4 * 3600, 900)),
+                                                        *rng.choice(templates)))
+                    event_id += 1
+                itinerary_id += 1
+        loader.flush()
+
+        if feeds:
+            click.echo('Materializing home feeds...')
+            authors = select(User.id).where(User.fanout_on_read.is_(False), User.id >= first_user)
+            connection.execute(FeedEntry.__table__.insert().from_select(
+                ['owner_id', 'itinerary_id', 'author_id', 'created_at'],
+                select(Followers.follower_id, Itinerary.id, Itinerary.user_id, Itinerary.created_at)
+                .join(Itinerary, Itinerary.user_id == Followers.followee_id)
+                .where(Followers.status == Followers.ACCEPTED, Followers.followee_id.in_(authors),
+                       Itinerary.id >= first_itinerary)))
+            connection.commit()
+
+        if defer_indexes:
+            click.echo('Rebuilding indexes...')
+            for index in _deferred_indexes():
+                index.create(connection, checkfirst=True)
+            if dialect == 'postgresql':
+                connection.exec_driver_sql(POSTGRESQL_DDL[1])
+            elif has_rtree:
+                connection.exec_driver_sql(f'{geo.SQLITE_BACKFILL} AND id >= {int(first_event)}')
+                connection.exec_driver_sql(geo.SQLITE_DDL[1])
+            connection.commit()
+
+        if dialect == 'postgresql':
+            # Rows were written with explicit ids, so move the sequences past them
+            for table_name in ('user', 'itinerary', 'event'):
+                connection.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table_name}\"', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM \"{table_name}\"))")
+        connection.exec_driver_sql('ANALYZE')
+        connection.commit()
+
+    elapsed = time.perf_counter() - started
+    written = loader.written
+    total = sum(written.values())
+    click.echo(f"Seeded {written.get('user', 0)} users, {written.get('followers', 0)} follow edges, "
+               f"{written.get('itinerary', 0)} itineraries and {written.get('event', 0)} events "
+               f'in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s).')
@@ -0,0 +1,33 @@
+from flask import Blueprint, current_app, jsonify, request
+from app.sharing import get_snapshot, shared_itinerary_id
+from flask_cors import CORS
+
+shared = Blueprint('shared', __name__)
+CORS(shared)
+
+"""
+ROUTE FOR VIEWING AN ITINERARY THROUGH A SHARE LINK
+"""
+@shared.route('/shared/<token>', methods=['GET'])
+def get_shared_itinerary(token):
+    """
+    Public, read-only endpoint behind share links. The signed token names the itinerary and
+    when the link expires, so no login is needed. Browsers asking for HTML get a rendered page,
+    everyone else gets JSON. Both come from a cached snapshot of the itinerary.
+    """
+    itinerary_id = shared_itinerary_id(token)
+    if itinerary_id is None:
+        return jsonify({'error': 'Share link is invalid or has expired'}), 404
+
+    snapshot = get_snapshot(itinerary_id)
+    if snapshot is None:
+        return jsonify({'error': 'Itinerary not found'}), 404
+
+    html = request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html'
+    response = current_app.response_class(snapshot.html if html else snapshot.json,
+                                          mimetype='text/html' if html else 'application/json')
+    response.set_etag(snapshot.etag + ('-html' if html else ''))
+    response.vary.add('Accept')
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config.get('SHARE_SNAPSHOT_TTL', 60)
+    return response.make_conditional(request)
@@ -0,0 +1,196 @@
+"""
+This module implements public share links for itineraries.
+
+A share link carries a signed token: the itinerary id and an expiry time,
+signed with HMAC-SHA256 under the app's secret. Checking a token needs no
+database access and tokens cannot be forged or extended.
+
+Shared itineraries are served from pre-rendered snapshots (JSON, and HTML for
+browsers) held in a cache bounded both in entries and in bytes per entry. A
+snapshot is re-rendered only when the itinerary changes: writes in this process
+drop it immediately, and after `SHARE_SNAPSHOT_TTL` seconds a snapshot is
+revalidated with a version-only query, which covers writes made by other
+workers. In between, views of a hot link do not touch the database at all.
+
+Itineraries can also be shared with other users of the platform. Sharing with
+any number of recipients takes two statements: one `IN` query resolving their
+usernames and one multi-row insert of the grants, which skips users who already
+have one. Their notifications are queued to app.notifications.
+"""
+
+import datetime
+import hashlib
+import time
+
+from flask import current_app, render_template_string
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import event, select
+from sqlalchemy.orm import selectinload
+
+from . import db
+from .bulk import upsert_insert
+from .cache import TTLCache
+from .conditional import itinerary_etag
+from .models import Event, Itinerary, ItineraryShare, User
+
+snapshots = TTLCache(maxsize=1000, ttl=3600.0)
+
+HTML_TEMPLATE = """<!doctype html>
+<html lang="en">
+<head><meta charset="utf-8"><title>{{ itinerary.itinerary_name }}</title></head>
+<body>
+<h1>{{ itinerary.itinerary_name }}</h1>
+<p>Shared by {{ owner }}</p>
+<ul>
+{% for event in events %}
+  <li>
+    <strong>{{ event.event_name }}</strong>
+    {% if event.time_of_event %}<time>{{ event.time_of_event.strftime('%Y-%m-%d %H:%M') }}</time>{% endif %}
+    <p>{{ event.event_description }}</p>
+    <p>{{ event.event_location }}, {{ event.event_address }}, {{ event.event_city }}, {{ event.event_state }}</p>
+  </li>
+{% endfor %}
+</ul>
+</body>
+</html>
+"""
+
+
+class Snapshot:
+    """A rendered shared itinerary."""
+
+    __slots__ = ('itinerary_id', 'version', 'etag', 'json', 'html', 'checked_at')
+
+    def __init__(self, itinerary_id, version, json, html):
+        self.itinerary_id = itinerary_id
+        self.version = version
+        self.etag = itinerary_etag(itinerary_id, version) + '-shared'
+        self.json = json
+        self.html = html
+        self.checked_at = time.monotonic()
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['JWT_SECRET_KEY'], salt='share-link',
+                             signer_kwargs={'digest_method': hashlib.sha256})
+
+
+def share_token(itinerary_id, expires_at):
+    """Return a signed token granting read access to an itinerary until `expires_at` (an aware datetime)."""
+    return _serializer().dumps([itinerary_id, int(expires_at.timestamp())])
+
+
+def shared_itinerary_id(token):
+    """Return the itinerary id of a valid, unexpired token, or None."""
+    try:
+        itinerary_id, expires = _serializer().loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    if not isinstance(itinerary_id, int) or expires < time.time():
+        return None
+    return itinerary_id
+
+
+def render_snapshot(itinerary_id):
+    """Load an itinerary with its events and render it, or return None if it no longer exists."""
+    row = db.session.execute(
+        select(Itinerary, User.username)
+        .join(User, User.id == Itinerary.user_id)
+        .options(selectinload(Itinerary.events))
+        .where(Itinerary.id == itinerary_id)).first()
+    if row is None:
+        return None
+    itinerary, owner = row
+    events = sorted(itinerary.events, key=lambda event: (event.time_of_event is None, event.time_of_event, event.id))
+
+    data = itinerary.serialize(include_events=False)
+    data['owner'] = owner
+    data['events'] = [event.serialize() for event in events]
+    json = current_app.json.dumps(data).encode()
+    html = render_template_string(HTML_TEMPLATE, itinerary=itinerary, owner=owner, events=events).encode()
+    return Snapshot(itinerary.id, itinerary.version, json, html)
+
+
+def get_snapshot(itinerary_id):
+    """
+    Return the current snapshot of an itinerary, rendering it if needed, or None if it is gone.
+    """
+    config = current_app.config
+    snapshot = snapshots.get(itinerary_id)
+    if snapshot is not None:
+        if time.monotonic() - snapshot.checked_at < config.get('SHARE_SNAPSHOT_TTL', 60):
+            return snapshot
+        version = db.session.scalar(select(Itinerary.version).where(Itinerary.id == itinerary_id))
+        if version == snapshot.version:
+            snapshot.checked_at = time.monotonic()
+            return snapshot
+
+    snapshot = render_snapshot(itinerary_id)
+    if snapshot is None:
+        snapshots.pop(itinerary_id)
+    elif len(snapshot.json) + len(snapshot.html) <= config.get('SHARE_SNAPSHOT_MAX_BYTES', 256 * 1024):
+        snapshots.set(itinerary_id, snapshot)
+    return snapshot
+
+
+def invalidate(itinerary_id):
+    """Drop the snapshot of an itinerary after it changed."""
+    snapshots.pop(itinerary_id)
+
+
+def _itinerary_changed(mapper, connection, target):
+    invalidate(target.id)
+
+
+def _event_changed(mapper, connection, target):
+    invalidate(target.itinerary_id)
+
+
+for change in ('after_update', 'after_delete'):
+    event.listen(Itinerary, change, _itinerary_changed)
+for change in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Event, change, _event_changed)
+
+
+def link_expiry(days):
+    return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=days)
+
+
+def share_with_users(itinerary_id, owner_id, usernames):
+    """
+    Grant users access to an itinerary. Runs inside the caller's transaction.
+
+    Args:
+        itinerary_id (int): The itinerary, which the caller has checked belongs to `owner_id`.
+        owner_id (int): The user sharing it.
+        usernames (list): The recipients' usernames.
+
+    Returns:
+        dict: `shared` maps each newly granted username to its user id; `already_shared`
+        and `not_found` list the usernames that were skipped.
+    """
+    wanted = list(dict.fromkeys(usernames))
+    users = dict(db.session.execute(select(User.username, User.id)
+                                    .where(User.username.in_(wanted), User.id != owner_id)).all())
+    shared = {}
+    if users:
+        now = datetime.datetime.utcnow()
+        statement = (upsert_insert(ItineraryShare)
+                     .values([{'itinerary_id': itinerary_id, 'user_id': user_id, 'shared_by': owner_id,
+                               'created_at': now} for user_id in users.values()])
+                     .on_conflict_do_nothing()
+                     .returning(ItineraryShare.user_id))
+        granted = set(db.session.execute(statement).scalars())
+        shared = {username: user_id for username, user_id in users.items() if user_id in granted}
+
+    return {
+        'shared': shared,
+        'already_shared': [username for username in users if username not in shared],
+        'not_found': [username for username in wanted if username not in users],
+    }
+
+
+def init_app(app):
+    """Size the snapshot cache from the app config."""
+    snapshots.maxsize = app.config.get('SHARE_CACHE_SIZE', snapshots.maxsize)
+    snapshots.clear()
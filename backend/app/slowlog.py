@@ -0,0 +1,278 @@
+"""
+This module records slow SQL statements, with their query plans, to a
+rotating log file.
+
+Every statement on any engine is timed. One that runs longer than
+`SLOW_QUERY_THRESHOLD_MS` is written as a JSON line holding its normalized
+SQL, a fingerprint of it, the parameters, the duration and the route that ran
+it. Bound parameters can hold passwords, emails or message bodies, so only
+their types are logged (`<str>`, `<int>`, ...) unless
+`SLOW_QUERY_LOG_PARAMETERS` opts in to logging the values.
+
+The first time a fingerprint is seen (and again once
+`SLOW_QUERY_EXPLAIN_INTERVAL` has passed) the plan is captured as well, with
+`EXPLAIN (ANALYZE off)` on PostgreSQL and `EXPLAIN QUERY PLAN` on SQLite, so a
+statement that keeps being slow does not pay for an EXPLAIN every time.
+
+`flask slow-queries` rolls the log up by fingerprint, worst offenders first:
+
+    flask slow-queries --sort total --limit 10
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from logging.handlers import RotatingFileHandler
+
+import click
+from flask import current_app, has_request_context, request
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .cache import TTLCache
+
+logger = logging.getLogger('nomad.slow_queries')
+logger.propagate = False
+
+EXPLAIN_PREFIXES = {
+    'postgresql': 'EXPLAIN (ANALYZE off) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'mysql': 'EXPLAIN ',
+}
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+MAX_PARAMETER_LENGTH = 200
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(statement):
+    """
+    Reduce a statement to its shape: literals and placeholders become `?`,
+    lists of them become `(...)` and whitespace is collapsed.
+    """
+    statement = _STRING.sub('?', statement)
+    statement = _PLACEHOLDER.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _LIST.sub('(...)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def _parameters(parameters, executemany, values=False):
+    if executemany:
+        parameters = parameters[0] if parameters else None
+    describe = _truncate if values else _placeholder
+    if isinstance(parameters, dict):
+        return {key: describe(value) for key, value in parameters.items()}
+    if parameters:
+        return [describe(value) for value in parameters]
+    return None
+
+
+def _placeholder(value):
+    return None if value is None else f'<{type(value).__name__}>'
+
+
+def _truncate(value):
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    value = str(value)
+    return value if len(value) <= MAX_PARAMETER_LENGTH else value[:MAX_PARAMETER_LENGTH] + '...'
+
+
+def _route():
+    if not has_request_context():
+        return None
+    return f'{request.method} {request.path} ({request.endpoint or "unmatched"})'
+
+
+class SlowQueryRecorder:
+    """Times statements and logs the slow ones. Configured from the app by `init_app`."""
+
+    def __init__(self):
+        self.threshold = 0.0
+        self.log_parameters = False
+        self.explained = TTLCache(maxsize=10000, ttl=3600.0)
+
+    def configure(self, config, path):
+        self.threshold = config.get('SLOW_QUERY_THRESHOLD_MS', 0) / 1000
+        self.log_parameters = config.get('SLOW_QUERY_LOG_PARAMETERS', False)
+        self.explained.ttl = config.get('SLOW_QUERY_EXPLAIN_INTERVAL', self.explained.ttl)
+        self.explained.clear()
+
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        if self.threshold:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=config.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 2 ** 20),
+                                          backupCount=config.get('SLOW_QUERY_LOG_BACKUPS', 5), delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.threshold and context is not None:
+            context._slow_query_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_slow_query_started', None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        if duration >= self.threshold:
+            self.record(conn, statement, parameters, executemany, duration)
+
+    def record(self, conn, statement, parameters, executemany, duration):
+        normalized = normalize(statement)
+        key = fingerprint(normalized)
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'fingerprint': key,
+            'duration_ms': round(duration * 1000, 3),
+            'statement': normalized,
+            'parameters': _parameters(parameters, executemany, self.log_parameters),
+            'route': _route(),
+            'executemany': executemany,
+        }
+        if self.explained.get(key) is None:
+            self.explained.set(key, True)
+            entry['plan'] = self.explain(conn, statement, parameters, executemany)
+        logger.info(json.dumps(entry, default=str))
+
+    def explain(self, conn, statement, parameters, executemany):
+        """Return the plan of `statement` as a list of lines, or None if it cannot be explained."""
+        dialect = conn.dialect.name
+        prefix = EXPLAIN_PREFIXES.get(dialect)
+        if prefix is None or not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+
+        # The raw DBAPI cursor bypasses SQLAlchemy's events, so explaining is not itself timed or logged.
+        # On PostgreSQL a savepoint keeps a failed EXPLAIN from aborting the caller's transaction.
+        cursor = conn.connection.dbapi_connection.cursor()
+        savepoint = dialect == 'postgresql'
+        try:
+            if savepoint:
+                cursor.execute('SAVEPOINT slow_query_explain')
+            cursor.execute(prefix + statement, parameters or ())
+            rows = cursor.fetchall()
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        except Exception as e:
+            if savepoint:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            return [f'EXPLAIN failed: {e}']
+        finally:
+            cursor.close()
+
+        if dialect == 'sqlite':
+            # (id, parent, notused, detail): indent each step under its parent
+            depth = {0: -1}
+            lines = []
+            for step_id, parent, _, detail in rows:
+                depth[step_id] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[step_id] + detail)
+            return lines
+        return [' | '.join(str(column) for column in row) for row in rows]
+
+
+recorder = SlowQueryRecorder()
+
+
+def log_path(app):
+    return app.config.get('SLOW_QUERY_LOG') or os.path.join(app.instance_path, 'slow_queries.log')
+
+
+def read_log(path):
+    """Yield the entries of a slow query log and its rotated backups, oldest file first."""
+    directory, base = os.path.split(path)
+    backups = sorted((int(name[len(base) + 1:]), name) for name in os.listdir(directory or '.')
+                     if name.startswith(base + '.') and name[len(base) + 1:].isdigit())
+    # RotatingFileHandler numbers backups from newest (.1) to oldest
+    for name in [name for _, name in reversed(backups)] + [base]:
+        if not os.path.exists(os.path.join(directory, name)):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def rollup(entries):
+    """
+    Group log entries by fingerprint.
+
+    Returns:
+        list: One dict per fingerprint with its count, total/max/mean duration, routes and latest plan.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['fingerprint'])
+        if group is None:
+            group = groups[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'], 'statement': entry['statement'], 'count': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'routes': set(), 'plan': None, 'last_seen': None}
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['last_seen'] = entry['time']
+        if entry.get('route'):
+            group['routes'].add(entry['route'].rsplit(' (', 1)[-1].rstrip(')'))
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+    for group in groups.values():
+        group['mean_ms'] = group['total_ms'] / group['count']
+        group['routes'] = sorted(group['routes'])
+    return list(groups.values())
+
+
+@click.command('slow-queries')
+@click.option('--sort', type=click.Choice(['total', 'count', 'max', 'mean']), default='total', show_default=True)
+@click.option('--limit', default=20, show_default=True, help='Number of fingerprints to show.')
+@click.option('--log', 'path', help='Log file to read instead of the configured one.')
+@with_appcontext
+def slow_queries_command(sort, limit, path):
+    """Summarize the slow query log by statement fingerprint."""
+    path = path or log_path(current_app)
+    if not os.path.exists(path):
+        raise click.ClickException(f'No slow query log at {path}')
+
+    groups = sorted(rollup(read_log(path)), key=lambda group: group[f'{sort}_ms' if sort != 'count' else 'count'],
+                    reverse=True)
+    for group in groups[:limit]:
+        click.echo(f"{group['fingerprint']}  {group['count']:6d}x  total {group['total_ms']:10.1f} ms  "
+                   f"mean {group['mean_ms']:8.1f} ms  max {group['max_ms']:8.1f} ms  "
+                   f"last {group['last_seen']}")
+        click.echo(f"    {group['statement']}")
+        if group['routes']:
+            click.echo(f"    routes: {', '.join(group['routes'])}")
+        for line in group['plan'] or ():
+            click.echo(f'    | {line}')
+
+
+def init_app(app):
+    """
+    Configure slow query logging from the app config and add the
+    `slow-queries` command. A `SLOW_QUERY_THRESHOLD_MS` of 0 turns logging off.
+    """
+    recorder.configure(app.config, log_path(app))
+    if not event.contains(Engine, 'before_cursor_execute', recorder.before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', recorder.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', recorder.after_cursor_execute)
+    app.cli.add_command(slow_queries_command)
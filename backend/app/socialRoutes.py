@@ -1,20 +1,88 @@
-from flask import Blueprint, jsonify, request
-from app.models import db, User, Follower, Comment, Like, DirectMessage
+from flask import Blueprint, g, jsonify, request
+from app.models import db, User, Itinerary, Followers, Comments, Likes, DirectMessages, Notification
+from app.feed import read_feed
+from app.identity import forget_user
+from app import follows, likes
+from app.pagination import decode_cursor, parse_limit
 from flask_cors import CORS
 from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import datetime
 
 social = Blueprint('social', __name__)
 CORS(social)
 
+def _list_edges(direction):
+    """
+    Shared implementation of the paginated followers/following lists.
+    """
+    status = request.args.get('status', Followers.ACCEPTED)
+    if status not in (Followers.ACCEPTED, Followers.PENDING):
+        return jsonify({'error': 'Invalid status'}), 400
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    rows, next_cursor = follows.list_edges(g.current_user_id, direction, status, cursor, limit)
+    return jsonify({
+        'users': [{'id': user.id, 'username': user.username, 'since': since} for user, since in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+
+def _target_user():
+    """
+    Look up the user named by the request body's `username`, returning an error response if
+    it is missing or refers to the current user.
+    """
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    if not username:
+        return None, (jsonify({'error': 'Username is required'}), 400)
+
+    target = User.query.filter_by(username=username).first()
+    if target is None:
+        return None, (jsonify({'error': 'User not found'}), 404)
+    if target.id == g.current_user_id:
+        return None, (jsonify({'error': 'You cannot follow yourself'}), 400)
+    return target, None
+
+
+def _create_edge(target):
+    try:
+        status = follows.follow(g.current_user, target)
+        db.session.commit()
+    except follows.AlreadyFollowing:
+        db.session.rollback()
+        return jsonify({'error': 'Already following or requested'}), 409
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    # Both users' cached profiles carry follow counts
+    forget_user(g.current_user.username)
+    forget_user(target.username)
+    if status == Followers.PENDING:
+        return jsonify({'message': 'Follow request sent', 'status': status}), 202
+    return jsonify({'message': 'Now following user', 'status': status}), 201
+
+
 """
 ROUTE FOR RETREIVING A USERS FOLLOWERS
 """
 @social.route('/followers', methods=['GET'])
 @jwt_required()
 def get_followers():
-    current_user_id = get_jwt_identity()
+    """
+    Endpoint listing the users who follow the current user, newest first. Pass `status=pending`
+    to list incoming follow requests instead. Paginate with `limit` and `cursor`.
+    """
+    return _list_edges('followers')
 
 """
 ROUTE FOR RETREIVING A USERS FOLLOWING
@@ -22,7 +90,32 @@ ROUTE FOR RETREIVING A USERS FOLLOWING
 @social.route('/following', methods=['GET'])
 @jwt_required()
 def get_following():
-    current_user_id = get_jwt_identity()
+    """
+    Endpoint listing the users the current user follows, newest first. Pass `status=pending`
+    to list outgoing follow requests instead. Paginate with `limit` and `cursor`.
+    """
+    return _list_edges('following')
+
+"""
+ROUTE FOR CHECKING WHICH OF SEVERAL USERS THE CURRENT USER FOLLOWS
+"""
+@social.route('/following/check', methods=['GET'])
+@jwt_required()
+def check_following():
+    """
+    Endpoint answering "does the current user follow each of these users" for a comma separated
+    list of user ids (`ids=1,2,3`) with a single query.
+    """
+    try:
+        user_ids = [int(user_id) for user_id in request.args.get('ids', '').split(',') if user_id]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of user ids'}), 400
+
+    if not user_ids or len(user_ids) > follows.MAX_CHECK_IDS:
+        return jsonify({'error': f'Provide between 1 and {follows.MAX_CHECK_IDS} ids'}), 400
+
+    followed = follows.following_among(g.current_user_id, user_ids)
+    return jsonify({str(user_id): user_id in followed for user_id in user_ids}), 200
 
 """
 ROUTE FOLLOWING A NEW PERSON
@@ -30,7 +123,14 @@ ROUTE FOLLOWING A NEW PERSON
 @social.route('/follow', methods=['POST'])
 @jwt_required()
 def follow():
-    current_user_id = get_jwt_identity()
+    target, error = _target_user()
+    if error:
+        return error
+
+    if target.is_private:
+        return jsonify({'error': 'This account is private, send a follow request instead'}), 403
+
+    return _create_edge(target)
     
 
 """
@@ -39,7 +139,23 @@ ROUTE FOR UNFOLLOWING SOMEONE
 @social.route('/unfollow', methods=['POST'])
 @jwt_required()
 def unfollow():
-    current_user_id = get_jwt_identity()
+    target, error = _target_user()
+    if error:
+        return error
+
+    try:
+        removed = follows.unfollow(g.current_user_id, target.id)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    if not removed:
+        return jsonify({'error': 'You are not following this user'}), 404
+
+    forget_user(g.current_user.username)
+    forget_user(target.username)
+    return jsonify({'message': 'Unfollowed user'}), 200
 
 """
 ROUTE FOR REQUESTING TO FOLLOW SOMEONE THAT IS ON PRIVATE
@@ -47,7 +163,14 @@ ROUTE FOR REQUESTING TO FOLLOW SOMEONE THAT IS ON PRIVATE
 @social.route('/request', methods=['POST'])
 @jwt_required()
 def request_to_follow():
-    current_user_id = get_jwt_identity()
+    target, error = _target_user()
+    if error:
+        return error
+
+    if not target.is_private:
+        return jsonify({'error': 'This account is public, follow it directly'}), 400
+
+    return _create_edge(target)
 
 """
 ROUTE FOR ACCEPTING OR DENYING SOMEONES FOLLOW REQUEST
@@ -55,4 +178,140 @@ ROUTE FOR ACCEPTING OR DENYING SOMEONES FOLLOW REQUEST
 @social.route('/request', methods=['PUT'])
 @jwt_required()
 def accept_deny_request():
-    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action not in ('accept', 'deny'):
+        return jsonify({'error': "Action must be 'accept' or 'deny'"}), 400
+
+    requester, error = _target_user()
+    if error:
+        return error
+
+    try:
+        if action == 'accept':
+            handled = follows.accept(g.current_user_id, requester.id)
+        else:
+            handled = follows.deny(g.current_user_id, requester.id)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    if not handled:
+        return jsonify({'error': 'No pending request from this user'}), 404
+
+    forget_user(g.current_user.username)
+    forget_user(requester.username)
+    message = 'Follow request accepted' if action == 'accept' else 'Follow request denied'
+    return jsonify({'message': message}), 200
+
+"""
+ROUTE FOR READING THE HOME FEED OF ITINERARIES FROM FOLLOWED USERS
+"""
+@social.route('/feed', methods=['GET'])
+@jwt_required()
+def get_feed():
+    """
+    Endpoint returning the itineraries recently created or updated by the users the current user
+    follows, newest first. Paginate with `limit` and the `cursor` from the previous response.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        cursor = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
+
+    itineraries, next_cursor = read_feed(g.current_user_id, cursor, limit)
+    return jsonify({
+        'itineraries': [itinerary.serialize() for itinerary in itineraries],
+        'next_cursor': next_cursor
+    }), 200
+
+
+def _set_like(target_type, target_id, liked):
+    """
+    Shared implementation of liking and unliking an itinerary or comment.
+    Comments are not linked to an itinerary, so they follow their author's visibility.
+    """
+    model = Itinerary if target_type == Likes.ITINERARY else Comments
+    target = db.session.get(model, target_id)
+    # Targets the user may not see are reported as missing so their existence does not leak
+    if target is None or not follows.can_view(g.current_user_id, target.user_id):
+        return jsonify({'error': f'{target_type.capitalize()} not found'}), 404
+
+    try:
+        if liked:
+            changed = likes.like(g.current_user_id, target_type, target_id)
+        else:
+            changed = likes.unlike(g.current_user_id, target_type, target_id)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'error': 'Database error'}), 500
+
+    count = likes.like_counts(target_type, [target_id])[target_id]
+    return jsonify({'liked': liked, 'changed': changed, 'likes': count}), 200
+
+"""
+ROUTES FOR LIKING AND UNLIKING AN ITINERARY
+"""
+@social.route('/itineraries/<int:itinerary_id>/like', methods=['POST', 'DELETE'])
+@jwt_required()
+def like_itinerary(itinerary_id):
+    return _set_like(Likes.ITINERARY, itinerary_id, request.method == 'POST')
+
+"""
+ROUTES FOR LIKING AND UNLIKING A COMMENT
+"""
+@social.route('/comments/<int:comment_id>/like', methods=['POST', 'DELETE'])
+@jwt_required()
+def like_comment(comment_id):
+    return _set_like(Likes.COMMENT, comment_id, request.method == 'POST')
+
+"""
+ROUTE FOR READING THE LIKE COUNTS OF SEVERAL ITINERARIES OR COMMENTS
+"""
+@social.route('/likes', methods=['GET'])
+@jwt_required()
+def get_like_counts():
+    """
+    Endpoint returning like counts for a comma separated list of target ids, e.g.
+    `/likes?type=itinerary&ids=1,2,3`.
+    """
+    target_type = request.args.get('type', Likes.ITINERARY)
+    if target_type not in (Likes.ITINERARY, Likes.COMMENT):
+        return jsonify({'error': 'Invalid type'}), 400
+
+    try:
+        target_ids = [int(target_id) for target_id in request.args.get('ids', '').split(',') if target_id]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of ids'}), 400
+
+    if not target_ids or len(target_ids) > follows.MAX_CHECK_IDS:
+        return jsonify({'error': f'Provide between 1 and {follows.MAX_CHECK_IDS} ids'}), 400
+
+    counts = likes.like_counts(target_type, target_ids)
+    return jsonify({str(target_id): count for target_id, count in counts.items()}), 200
+
+"""
+ROUTE FOR READING THE NOTIFICATION INBOX
+"""
+@social.route('/notifications', methods=['GET'])
+@jwt_required()
+def get_notifications():
+    """
+    Endpoint returning the current user's notifications, newest first. Pass the last `id`
+    as `before` to read the next page.
+    """
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        before = request.args.get('before', type=int)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    query = select(Notification).where(Notification.user_id == g.current_user_id)
+    if before is not None:
+        query = query.where(Notification.id < before)
+    rows = db.session.scalars(query.order_by(Notification.id.desc()).limit(limit)).all()
+    return jsonify({'notifications': [notification.serialize() for notification in rows]}), 200
@@ -0,0 +1,284 @@
+"""
+Reproducible latency benchmark of the HTTP API's main flows.
+
+Runs register, login, get_profile, itinerary create/list/update/delete and
+share link requests, each a fixed number of times in a fixed order, and
+reports p50/p95/p99 latency, throughput and SQL queries per request.
+
+By default everything runs in-process through the Flask test client against a
+fresh SQLite database with the testing config. `--base-url` runs the same
+requests against a running server instead; queries per request are then not
+available. The suite registers and logs in far more often than the auth rate
+limits allow, so start that server with `RATE_LIMIT_ENABLED=false`. Requests
+answered with a 429 anyway are counted as errors and left out of the latency
+figures. Results are written as JSON, and `--compare` reports how a run
+differs from an earlier one:
+
+    python -m benchmarks.api_suite --iterations 200 --output before.json
+    python -m benchmarks.api_suite --iterations 200 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+PASSWORD = 'benchmark-password'
+
+
+class Flow:
+    """
+    One kind of request. `request(state, n)` returns `(method, path, body)` for
+    the n-th call; `setup(client, state, iterations)` prepares whatever it needs.
+    """
+
+    def __init__(self, name, request, setup=None):
+        self.name = name
+        self.request = request
+        self.setup = setup
+
+
+def _create_itineraries(client, state, iterations, key):
+    ids = []
+    for n in range(iterations):
+        response = client.call('POST', '/create-itinerary', {'itinerary_name': f'{key} {n}'}, state['headers'])
+        ids.append(response.json['itinerary'])
+    state[key] = ids
+
+
+FLOWS = [
+    Flow('register', lambda state, n: ('POST', '/register', {
+        'username': f"{state['prefix']}-new-{n}", 'email_address': f"{state['prefix']}-new-{n}@example.com",
+        'password': PASSWORD})),
+    Flow('login', lambda state, n: ('POST', '/login', {'username': state['username'], 'password': PASSWORD})),
+    Flow('get_profile', lambda state, n: ('GET', '/get_profile', None)),
+    Flow('create_itinerary', lambda state, n: ('POST', '/create-itinerary', {'itinerary_name': f'trip {n}'})),
+    Flow('list_itineraries', lambda state, n: ('GET', '/itineraries?limit=20', None)),
+    Flow('update_itinerary', lambda state, n: ('PUT', '/itineraries/update', {
+        'id': state['update'][n], 'itinerary_name': f'renamed {n}'}),
+        setup=lambda client, state, iterations: _create_itineraries(client, state, iterations, 'update')),
+    Flow('delete_itinerary', lambda state, n: ('DELETE', '/itineraries/delete', {'id': state['delete'][n]}),
+        setup=lambda client, state, iterations: _create_itineraries(client, state, iterations, 'delete')),
+    Flow('share_link', lambda state, n: ('POST', f"/itineraries/{state['update'][n]}/share/link",
+                                         {'share_type': 'link'})),
+]
+
+
+class _Response:
+    def __init__(self, status_code, json):
+        self.status_code = status_code
+        self.json = json
+
+
+class InProcessTarget:
+    """Sends requests through the Flask test client and counts the SQL statements they run."""
+
+    def __init__(self):
+        from sqlalchemy import event
+
+        from app import create_app, db
+
+        self.app = create_app()
+        self.queries = 0
+        with self.app.app_context():
+            db.create_all()
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._count)
+        self.client = self.app.test_client()
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def call(self, method, path, body, headers):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return _Response(response.status_code, response.get_json(silent=True))
+
+
+class ServerTarget:
+    """Sends requests to a running server. Query counts are not visible from here."""
+
+    queries = None
+
+    def __init__(self, base_url):
+        import httpx
+
+        self.client = httpx.Client(base_url=base_url, timeout=60)
+
+    def call(self, method, path, body, headers):
+        response = self.client.request(method, path, json=body, headers=headers)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return _Response(response.status_code, data)
+
+
+def _summarize(latencies, queries, errors, rate_limited, elapsed):
+    if not latencies:
+        return {'requests': 0, 'errors': errors, 'rate_limited': rate_limited, 'throughput_rps': None,
+                'mean_ms': None, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None,
+                'queries_per_request': None, 'max_queries': None}
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rate_limited': rate_limited,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(quantiles[49] * 1000, 3),
+        'p95_ms': round(quantiles[94] * 1000, 3),
+        'p99_ms': round(quantiles[98] * 1000, 3),
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def run_suite(target, iterations, flows=FLOWS, warmup=5):
+    """
+    Run every flow against `target` and return the per-flow summary.
+
+    Returns:
+        dict: Flow name to its latency, throughput and query statistics.
+
+    Raises:
+        RuntimeError: If the benchmark user cannot log in, e.g. because the server rate limits it.
+    """
+    prefix = uuid.uuid4().hex[:8]
+    state = {'prefix': prefix, 'username': f'{prefix}-user'}
+    target.call('POST', '/register', {'username': state['username'], 'email_address': f"{state['username']}@example.com",
+                                      'password': PASSWORD}, None)
+    response = target.call('POST', '/login', {'username': state['username'], 'password': PASSWORD}, None)
+    if response.status_code != 200:
+        hint = ' (rate limited: run the server with RATE_LIMIT_ENABLED=false)' if response.status_code == 429 else ''
+        raise RuntimeError(f'Could not log in the benchmark user: HTTP {response.status_code}{hint}')
+    state['headers'] = {'Authorization': f"Bearer {response.json['access_token']}"}
+
+    for flow in flows:
+        if flow.setup:
+            flow.setup(target, state, iterations)
+
+    results = {}
+    for flow in flows:
+        if flow.name not in ('register', 'delete_itinerary', 'update_itinerary'):
+            # Warm caches and lazily initialized code paths; flows that consume rows are not repeated
+            for n in range(min(warmup, iterations)):
+                target.call(*flow.request(state, n), state['headers'])
+
+        latencies, queries, errors, rate_limited = [], [], 0, 0
+        started = time.perf_counter()
+        for n in range(iterations):
+            method, path, body = flow.request(state, n)
+            before = target.queries
+            request_started = time.perf_counter()
+            response = target.call(method, path, body, state['headers'])
+            elapsed = time.perf_counter() - request_started
+            errors += response.status_code >= 400
+            if response.status_code == 429:
+                # A rejection costs next to nothing and would make the flow look faster
+                rate_limited += 1
+                continue
+            latencies.append(elapsed)
+            if before is not None:
+                queries.append(target.queries - before)
+        results[flow.name] = _summarize(latencies, queries, errors, rate_limited, time.perf_counter() - started)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, threshold):
+    """
+    Print each flow's p50/p95 change against a baseline run.
+
+    Returns:
+        list: Names of flows whose p95 grew by more than `threshold` (a fraction).
+    """
+    regressions = []
+    for name, result in current['flows'].items():
+        before = baseline['flows'].get(name)
+        if before is None or result['p95_ms'] is None or before['p95_ms'] is None:
+            continue
+        change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:>17}: p50 {before['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms   "
+              f"p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({change:+.0%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=100, help='requests per flow')
+    parser.add_argument('--base-url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p95 growth reported as a regression, as a fraction (default 0.2)')
+    args = parser.parse_args()
+
+    path = None
+    if args.base_url:
+        target = ServerTarget(args.base_url)
+    else:
+        # Must be set before the app's config is imported
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.environ['FLASK_ENV'] = 'testing'
+        os.environ['TEST_DATABASE_URL'] = f'sqlite:///{path}'
+        os.environ.pop('TEST_DATABASE_REPLICA_URL', None)
+        target = InProcessTarget()
+
+    try:
+        flows = run_suite(target, args.iterations)
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'target': args.base_url or 'test-client+sqlite',
+        'iterations': args.iterations,
+        'flows': flows,
+    }
+
+    for name, result in flows.items():
+        if not result['requests']:
+            print(f"{name:>17}: no successful samples  "
+                  f"({result['errors']} errors, {result['rate_limited']} rate limited)")
+            continue
+        queries = '' if result['queries_per_request'] is None else f"  {result['queries_per_request']:5.1f} queries"
+        print(f"{name:>17}: p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} ms  "
+              f"{result['throughput_rps']:8.1f} req/s{queries}  ({result['errors']} errors, "
+              f"{result['rate_limited']} rate limited)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
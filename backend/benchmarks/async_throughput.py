@@ -0,0 +1,143 @@
+"""
+Compare request throughput of the WSGI and ASGI entry points under high concurrency.
+
+Seeds a database, then serves the app twice from a subprocess:
+
+* sync:  the Flask app on werkzeug's threaded WSGI server
+* async: `app.asgi` on uvicorn
+
+and drives each with the same number of concurrent clients requesting
+`GET /itineraries` and `GET /get_profile`. Needs uvicorn and httpx, plus
+aiosqlite (or asyncpg with `--database-url postgresql://...`). Run from the
+backend directory:
+
+    python -m benchmarks.async_throughput --concurrency 200 --requests 5000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVERS = {
+    'sync': [sys.executable, '-c',
+             'import logging, sys; from werkzeug.serving import run_simple; from app import create_app; '
+             'logging.getLogger("werkzeug").setLevel(logging.ERROR); '
+             'run_simple("127.0.0.1", int(sys.argv[1]), create_app(), threaded=True)'],
+    'async': [sys.executable, '-m', 'uvicorn', '--factory', 'app.asgi:create_asgi_app',
+              '--host', '127.0.0.1', '--log-level', 'warning', '--port'],
+}
+PATHS = ['/itineraries?limit=20', '/get_profile']
+
+
+def seed(itineraries, events):
+    from app import create_app, db
+    from app.models import Event, Itinerary, User
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import insert
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='bench', email_address='bench@example.com', password_hash='x'))
+        db.session.flush()
+        db.session.execute(insert(Itinerary), [{'user_id': 1, 'itinerary_name': f'trip {n}'}
+                                               for n in range(itineraries)])
+        db.session.execute(insert(Event), [
+            {'itinerary_id': n % itineraries + 1, 'event_name': f'event {n}', 'event_description': 'dinner',
+             'event_location': 'cafe', 'event_address': 'main st', 'event_city': 'Vienna', 'event_state': 'W'}
+            for n in range(events)])
+        db.session.commit()
+        return create_access_token(identity='bench')
+
+
+async def load(port, token, concurrency, total):
+    import httpx
+
+    headers = {'Authorization': f'Bearer {token}'}
+    latencies = []
+    failures = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal failures
+            for n in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(PATHS[n % len(PATHS)], headers=headers)
+                except httpx.TransportError:
+                    failures += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                failures += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, failures
+
+
+def wait_until_listening(port, server, timeout=30):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('Server exited during startup')
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/get_profile', timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--itineraries', type=int, default=200)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    path = None
+    if args.database_url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        args.database_url = f'sqlite:///{path}'
+    # The servers and this process read the same config from the environment
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('FLASK_ENV', 'development')
+
+    try:
+        token = seed(args.itineraries, args.events)
+        for name, command in SERVERS.items():
+            server = subprocess.Popen(command + [str(args.port)])
+            try:
+                wait_until_listening(args.port, server)
+                asyncio.run(load(args.port, token, 10, 100))  # warm up
+                elapsed, latencies, failures = asyncio.run(
+                    load(args.port, token, args.concurrency, args.requests))
+            finally:
+                server.terminate()
+                server.wait()
+
+            quantiles = statistics.quantiles(latencies, n=100)
+            print(f'{name:>5}: {args.requests / elapsed:7.0f} req/s  p50 {quantiles[49] * 1000:6.1f} ms  '
+                  f'p99 {quantiles[98] * 1000:7.1f} ms  ({failures} failed, concurrency {args.concurrency})')
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
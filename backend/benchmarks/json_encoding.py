@@ -0,0 +1,93 @@
+"""
+Benchmark JSON response encoding of large event lists.
+
+Builds `jsonify` responses for itineraries holding 10k events in total and
+compares Flask's default provider (stdlib `json`, HTTP dates) with
+`app.jsonprovider.FastJSONProvider` using orjson and its stdlib fallback. Also
+reports what gzip and Brotli compression cost and save on the same payload.
+Run from the backend directory:
+
+    python -m benchmarks.json_encoding --events 10000 --repeat 20
+"""
+
+import argparse
+import datetime
+import random
+import statistics
+import time
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from app import compression
+from app.jsonprovider import FastJSONProvider, orjson
+from app.models import Event, Itinerary
+
+
+def build_payload(events, per_itinerary, rng):
+    """Serialize itineraries the way `/itineraries` does, without a database."""
+    start = datetime.datetime(2024, 1, 1)
+    itineraries = []
+    for itinerary_id in range(1, events // per_itinerary + 1):
+        itinerary = Itinerary(id=itinerary_id, user_id=1, itinerary_name=f'trip {itinerary_id}',
+                              created_at=start)
+        itinerary.events = [
+            Event(id=(itinerary_id - 1) * per_itinerary + n, itinerary_id=itinerary_id,
+                  time_of_event=start + datetime.timedelta(minutes=rng.randrange(525600)),
+                  event_name=f'event {n}', event_description='dinner with friends',
+                  event_location='Cafe Central', event_address='Herrengasse 14',
+                  event_city='Vienna', event_state='Vienna')
+            for n in range(per_itinerary)
+        ]
+        itineraries.append(itinerary)
+    return [itinerary.serialize() for itinerary in itineraries]
+
+
+def time_provider(provider, payload, repeat):
+    app = Flask(__name__)
+    app.json = provider(app)
+    samples = []
+    with app.app_context():
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = jsonify(payload).get_data()
+            samples.append(time.perf_counter() - started)
+    return statistics.median(samples), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--per-itinerary', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payload = build_payload(args.events, args.per_itinerary, random.Random(0))
+
+    providers = [('flask default', DefaultJSONProvider),
+                 ('fast (stdlib)', lambda app: FastJSONProvider(app, 'stdlib'))]
+    if orjson is not None:
+        providers.append(('fast (orjson)', lambda app: FastJSONProvider(app, 'orjson')))
+    else:
+        print('orjson is not installed; skipping it')
+
+    baseline = None
+    for name, provider in providers:
+        elapsed, body = time_provider(provider, payload, args.repeat)
+        baseline = baseline or elapsed
+        print(f'{name:>14}: {elapsed * 1000:7.1f} ms  {len(body) / 1024:7.0f} KiB  '
+              f'{baseline / elapsed:4.1f}x')
+
+    for encoding in ('gzip', 'br'):
+        if encoding == 'br' and compression.brotli is None:
+            print('brotli is not installed; skipping it')
+            continue
+        started = time.perf_counter()
+        compressed = compression.compress(body, encoding, 6)
+        elapsed = time.perf_counter() - started
+        print(f'{encoding:>14}: {elapsed * 1000:7.1f} ms  {len(compressed) / 1024:7.0f} KiB  '
+              f'{len(body) / len(compressed):4.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
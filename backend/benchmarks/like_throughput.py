@@ -0,0 +1,127 @@
+"""
+Load test concurrent likes on one hot itinerary.
+
+Compares two ways of maintaining the like count, both writing the like edge in
+the same transaction:
+
+* naive:    `UPDATE like_counter SET count = count + 1` on a single row per like
+* buffered: `app.likes`, which coalesces deltas in memory and flushes them to a
+            per-process shard row on a timer
+
+Run from the backend directory, optionally against PostgreSQL where row lock
+contention on the naive counter is most visible:
+
+    python -m benchmarks.like_throughput --threads 16 --likes 200
+    python -m benchmarks.like_throughput --database-url postgresql://...
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import insert, update
+
+from app import config
+
+
+def build_app(database_url, flush_interval):
+    config.Config.SQLALCHEMY_DATABASE_URI = database_url
+    config.Config.LIKE_FLUSH_INTERVAL = flush_interval
+    from app import create_app, db
+    from app.models import Itinerary, User
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(username='author', email_address='author@example.com', password_hash='x'))
+        db.session.add(Itinerary(user_id=1, itinerary_name='viral trip'))
+        db.session.commit()
+    return app
+
+
+def naive_like(user_id):
+    from app import db
+    from app.models import LikeCounter, Likes
+
+    db.session.execute(insert(Likes).values(user_id=user_id, target_type=Likes.ITINERARY, target_id=1))
+    updated = db.session.execute(update(LikeCounter)
+                                 .where(LikeCounter.target_type == Likes.ITINERARY,
+                                        LikeCounter.target_id == 1, LikeCounter.shard == 0)
+                                 .values(count=LikeCounter.count + 1)).rowcount
+    if not updated:
+        db.session.execute(insert(LikeCounter).values(target_type=Likes.ITINERARY, target_id=1, shard=0, count=1))
+
+
+def buffered_like(user_id):
+    from app import likes
+    from app.models import Likes
+
+    likes.like(user_id, Likes.ITINERARY, 1)
+
+
+def run(app, like, threads, per_thread):
+    from app import db
+
+    errors = []
+
+    def worker(offset):
+        with app.app_context():
+            for i in range(per_thread):
+                for attempt in range(20):
+                    try:
+                        like(offset + i)
+                        db.session.commit()
+                        break
+                    except Exception as e:
+                        db.session.rollback()
+                        if attempt == 19:
+                            errors.append(e)
+                        time.sleep(0.001 * (attempt + 1))
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread + 1,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--likes', type=int, default=200, help='likes per thread')
+    args = parser.parse_args()
+
+    path = None
+    database_url = args.database_url
+    if database_url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+
+    total = args.threads * args.likes
+    try:
+        for name, like, flush_interval in (('naive', naive_like, 0), ('buffered', buffered_like, 0.5)):
+            app = build_app(database_url, flush_interval)
+            elapsed, failed = run(app, like, args.threads, args.likes)
+
+            from app import db, likes
+            from app.models import Likes
+            with app.app_context():
+                if flush_interval:
+                    likes.counters.flush()
+                count = likes.like_counts(Likes.ITINERARY, [1])[1]
+            print(f'{name:>9}: {total / elapsed:8.0f} likes/s  '
+                  f'({elapsed:.2f}s for {total} likes, {failed} failed, final count {count})')
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
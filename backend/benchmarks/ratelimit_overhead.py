@@ -0,0 +1,94 @@
+"""
+Measure the per-request overhead of the auth rate limiter.
+
+Times `Limiter.check` directly for each store, with the keys spread over a
+configurable number of client IPs and usernames, and then a rejected /login
+request (missing password, so nothing is hashed or looked up) through the test
+client with the limiter off and on, which adds the cost of the decorator and of
+reading the body.
+
+Run from the backend directory:
+
+    python -m benchmarks.ratelimit_overhead --checks 50000 --clients 10000
+    python -m benchmarks.ratelimit_overhead --database-url postgresql://...
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from app import config
+
+
+def build_app(database_url, backend, enabled):
+    config.Config.SQLALCHEMY_DATABASE_URI = database_url
+    config.Config.RATE_LIMIT_ENABLED = enabled
+    config.Config.RATE_LIMIT_BACKEND = backend
+    # High enough that nothing is rejected, so every check takes the full path
+    config.Config.RATE_LIMIT_LOGIN_PER_IP = '1000000/minute'
+    config.Config.RATE_LIMIT_LOGIN_PER_USERNAME = '1000000/minute'
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all(bind_key=None)
+    return app
+
+
+def time_checks(app, checks, clients):
+    from app.ratelimit import limiter
+
+    with app.app_context():
+        started = time.perf_counter()
+        for i in range(checks):
+            client = i % clients
+            limiter.check('login', f'10.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}', f'user{client}')
+        elapsed = time.perf_counter() - started
+        size = len(limiter.store) if hasattr(limiter.store, '__len__') else None
+    return elapsed / checks * 1e6, size
+
+
+def time_requests(app, requests):
+    client = app.test_client()
+    started = time.perf_counter()
+    for i in range(requests):
+        client.post('/login', json={'username': f'user{i}'})
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--checks', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=10000, help='distinct IPs and usernames')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    path = None
+    database_url = args.database_url
+    if database_url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+
+    try:
+        for backend in ('memory', 'database'):
+            app = build_app(database_url, backend, True)
+            checks = args.checks if backend == 'memory' else args.checks // 10
+            per_check, size = time_checks(app, checks, args.clients)
+            keys = f', {size} keys held' if size is not None else ''
+            print(f'{backend:>8} check: {per_check:8.2f} us per request (ip + username){keys}')
+
+        baseline = time_requests(build_app(database_url, 'memory', False), args.requests)
+        for backend in ('memory', 'database'):
+            limited = time_requests(build_app(database_url, backend, True), args.requests)
+            print(f'{backend:>8} /login: {limited:8.1f} us per request, {limited - baseline:+.1f} us over '
+                  f'{baseline:.1f} us without the limiter')
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
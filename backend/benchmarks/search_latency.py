@@ -0,0 +1,89 @@
+"""
+Benchmark itinerary name lookups as the itinerary table grows.
+
+Compares the old leading-wildcard `ILIKE '%term%'` scan with the indexed search
+path in `app.search` on an SQLite database. Run from the backend directory:
+
+    python -m benchmarks.search_latency --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Itinerary
+from app.search import search_itineraries
+
+WORDS = ['paris', 'rome', 'tokyo', 'lisbon', 'kyoto', 'berlin', 'oslo', 'lima',
+         'weekend', 'honeymoon', 'roadtrip', 'conference', 'family', 'summer']
+
+
+def populate(engine, rows, users, rng):
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            name = ' '.join(rng.sample(WORDS, 2)) + ' ' + ''.join(rng.choices(string.ascii_lowercase, k=6))
+            batch.append({'user_id': rng.randrange(users), 'itinerary_name': name})
+            if len(batch) == 5000:
+                conn.execute(insert(Itinerary), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(Itinerary), batch)
+
+
+def time_lookups(session, build, terms):
+    samples = []
+    for user_id, term in terms:
+        started = time.perf_counter()
+        session.execute(build(select(Itinerary.id), user_id, term).limit(20)).all()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--users', type=int, default=10,
+                        help='rows are spread evenly over this many users; fewer users means bigger per-user scans')
+    parser.add_argument('--lookups', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scan = lambda query, user_id, term: query.where(
+        Itinerary.user_id == user_id, Itinerary.itinerary_name.ilike(f'%{term}%'))
+    indexed = lambda query, user_id, term: search_itineraries(query, user_id, term, dialect='sqlite')
+
+    # Common terms match a large share of a user's rows, so the unordered scan stops early
+    # while the ranked search scores every match. Selective terms are the case the index is for.
+    print('median lookup latency in ms')
+    print(f"{'rows':>10} {'common/scan':>12} {'common/index':>13} {'selective/scan':>15} {'selective/index':>16}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine(f'sqlite:///{path}')
+        try:
+            db.metadata.create_all(engine)
+            populate(engine, size, args.users, rng)
+            common = [(rng.randrange(args.users), rng.choice(WORDS)[1:5]) for _ in range(args.lookups)]
+            selective = [(rng.randrange(args.users), ''.join(rng.choices(string.ascii_lowercase, k=4)))
+                         for _ in range(args.lookups)]
+            with Session(engine) as session:
+                results = [time_lookups(session, build, terms)
+                           for terms in (common, selective) for build in (scan, indexed)]
+            print(f'{size:>10} {results[0]:>12.3f} {results[1]:>13.3f} {results[2]:>15.3f} {results[3]:>16.3f}')
+        finally:
+            engine.dispose()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""deletion job steps by name
+
+Revision ID: 1e0977926cb2
+Revises: 5dded0b7d84a
+Create Date: 2026-10-18 19:07:52.626577
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e0977926cb2'
+down_revision = '5dded0b7d84a'
+branch_labels = None
+depends_on = None
+
+
+# Step order when jobs stored an index, as of revision 5dded0b7d84a
+STEP_NAMES = {
+    'itinerary': ['feed_entries', 'likes', 'like_counters', 'shares', 'events', 'itinerary'],
+    'user': ['feed_entries', 'feed_entries_authored', 'likes_given', 'itinerary_likes', 'comment_likes',
+             'itinerary_like_counters', 'comment_like_counters', 'shares', 'events', 'itineraries', 'following',
+             'followers', 'direct_messages', 'locations', 'notifications', 'comments', 'user'],
+}
+
+
+def _pairs():
+    for target_type, names in STEP_NAMES.items():
+        for index, name in enumerate(names):
+            yield target_type, index, name
+
+
+def upgrade():
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('step_name', sa.String(length=40), nullable=True))
+
+    job = sa.table('deletion_job', sa.column('target_type'), sa.column('step', sa.Integer()),
+                   sa.column('step_name', sa.String()))
+    for target_type, index, name in _pairs():
+        op.execute(job.update().where(job.c.target_type == target_type, job.c.step == index).values(step_name=name))
+
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.drop_column('step')
+        batch_op.alter_column('step_name', new_column_name='step')
+
+
+def downgrade():
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('step_index', sa.Integer(), nullable=False, server_default='0'))
+
+    job = sa.table('deletion_job', sa.column('target_type'), sa.column('step', sa.String()),
+                   sa.column('step_index', sa.Integer()))
+    for target_type, index, name in _pairs():
+        op.execute(job.update().where(job.c.target_type == target_type, job.c.step == name).values(step_index=index))
+
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.drop_column('step')
+        batch_op.alter_column('step_index', new_column_name='step', server_default=None)
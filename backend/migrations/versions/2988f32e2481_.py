@@ -0,0 +1,64 @@
+"""tombstones and deletion jobs
+
+Revision ID: 2988f32e2481
+Revises: df1ba2ae9017
+Create Date: 2026-10-18 18:52:00.592459
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2988f32e2481'
+down_revision = 'df1ba2ae9017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deletion_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('target_type', sa.String(length=20), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('requested_by', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('step', sa.Integer(), nullable=False),
+    sa.Column('rows_deleted', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('lease_until', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.create_index('ix_deletion_job_status_id', ['status', 'id'], unique=False)
+
+    # Nullable columns without defaults, so PostgreSQL adds them without rewriting the tables
+    with op.batch_alter_table('itinerary', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
+
+    with op.batch_alter_table('itinerary', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # Dropping a column rebuilds the table on SQLite, which loses its triggers
+        from app.search import SQLITE_DDL
+
+        for statement in SQLITE_DDL[2:]:
+            op.execute(statement)
+
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_deletion_job_status_id')
+
+    op.drop_table('deletion_job')
@@ -0,0 +1,38 @@
+"""event end times and time range index
+
+Revision ID: 3799ea9419e0
+Revises: cc77c31d83d6
+Create Date: 2026-10-18 18:39:04.434709
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3799ea9419e0'
+down_revision = 'cc77c31d83d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ends_at', sa.DateTime(), nullable=True))
+        # The composite index also serves every lookup the single-column one did
+        batch_op.drop_index(batch_op.f('ix_event_itinerary_id'))
+        batch_op.create_index('ix_event_itinerary_id_time_of_event', ['itinerary_id', 'time_of_event'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index('ix_event_itinerary_id_time_of_event')
+        batch_op.create_index(batch_op.f('ix_event_itinerary_id'), ['itinerary_id'], unique=False)
+        batch_op.drop_column('ends_at')
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # Dropping a column rebuilds the table on SQLite, which loses its triggers
+        from app.geo import SQLITE_DDL
+
+        for statement in SQLITE_DDL[1:]:
+            op.execute(statement)
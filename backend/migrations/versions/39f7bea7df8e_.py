@@ -0,0 +1,42 @@
+"""idempotent like edges and sharded like counters
+
+Revision ID: 39f7bea7df8e
+Revises: d4f341b69bd0
+Create Date: 2026-10-18 18:09:40.273947
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '39f7bea7df8e'
+down_revision = 'd4f341b69bd0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('likes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('target_type', sa.String(length=20), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'target_type', 'target_id')
+    )
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.create_index('ix_likes_target_type_target_id', ['target_type', 'target_id'], unique=False)
+
+    op.create_table('like_counter',
+    sa.Column('target_type', sa.String(length=20), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('target_type', 'target_id', 'shard')
+    )
+
+
+def downgrade():
+    op.drop_table('like_counter')
+    op.drop_table('likes')
@@ -0,0 +1,40 @@
+"""trigram search index for itinerary names
+
+Revision ID: 41a79eede069
+Revises: 92401a5c7da4
+Create Date: 2026-10-18 18:00:08.763796
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '41a79eede069'
+down_revision = '92401a5c7da4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from app.search import POSTGRESQL_DDL, SQLITE_BACKFILL, SQLITE_DDL
+
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRESQL_DDL:
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        # Index the itineraries that already exist
+        op.execute(SQLITE_BACKFILL)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_itinerary_name_trgm')
+    elif dialect == 'sqlite':
+        for trigger in ('itinerary_fts_ai', 'itinerary_fts_ad', 'itinerary_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS itinerary_fts')
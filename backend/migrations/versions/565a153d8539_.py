@@ -0,0 +1,57 @@
+"""follower edges and materialized home feed
+
+Revision ID: 565a153d8539
+Revises: c08e2bce4df6
+Create Date: 2026-10-18 18:06:52.827828
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '565a153d8539'
+down_revision = 'c08e2bce4df6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('followers',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followee_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['followee_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('follower_id', 'followee_id')
+    )
+    with op.batch_alter_table('followers', schema=None) as batch_op:
+        batch_op.create_index('ix_followers_followee_id_status_created_at', ['followee_id', 'status', 'created_at', 'follower_id'], unique=False)
+        batch_op.create_index('ix_followers_follower_id_status_created_at', ['follower_id', 'status', 'created_at', 'followee_id'], unique=False)
+
+    op.create_table('feed_entry',
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('itinerary_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['author_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['itinerary_id'], ['itinerary.id'], ),
+    sa.ForeignKeyConstraint(['owner_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('owner_id', 'itinerary_id')
+    )
+    with op.batch_alter_table('feed_entry', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_feed_entry_author_id'), ['author_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_feed_entry_itinerary_id'), ['itinerary_id'], unique=False)
+        batch_op.create_index('ix_feed_entry_owner_id_created_at_itinerary_id', ['owner_id', 'created_at', 'itinerary_id'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fanout_on_read', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('fanout_on_read')
+
+    op.drop_table('feed_entry')
+    op.drop_table('followers')
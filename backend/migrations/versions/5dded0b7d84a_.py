@@ -0,0 +1,56 @@
+"""platform share grants and notifications
+
+Revision ID: 5dded0b7d84a
+Revises: 2988f32e2481
+Create Date: 2026-10-18 18:55:01.971855
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5dded0b7d84a'
+down_revision = '2988f32e2481'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('itinerary_share',
+    sa.Column('itinerary_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('shared_by', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['itinerary_id'], ['itinerary.id'], ),
+    sa.ForeignKeyConstraint(['shared_by'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('itinerary_id', 'user_id')
+    )
+    with op.batch_alter_table('itinerary_share', schema=None) as batch_op:
+        batch_op.create_index('ix_itinerary_share_user_id_created_at', ['user_id', 'created_at'], unique=False)
+
+    op.create_table('notification',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=30), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('read_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.create_index('ix_notification_user_id_id', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notification', schema=None) as batch_op:
+        batch_op.drop_index('ix_notification_user_id_id')
+
+    op.drop_table('notification')
+    with op.batch_alter_table('itinerary_share', schema=None) as batch_op:
+        batch_op.drop_index('ix_itinerary_share_user_id_created_at')
+
+    op.drop_table('itinerary_share')
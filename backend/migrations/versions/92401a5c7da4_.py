@@ -0,0 +1,32 @@
+"""index itinerary pagination and event lookups
+
+Revision ID: 92401a5c7da4
+Revises: de59e914e618
+Create Date: 2026-10-18 17:59:12.072526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '92401a5c7da4'
+down_revision = 'de59e914e618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('itinerary', schema=None) as batch_op:
+        batch_op.create_index('ix_itinerary_user_id_created_at_id', ['user_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_event_itinerary_id'), ['itinerary_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_event_itinerary_id'))
+
+    with op.batch_alter_table('itinerary', schema=None) as batch_op:
+        batch_op.drop_index('ix_itinerary_user_id_created_at_id')
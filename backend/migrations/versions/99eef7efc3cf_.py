@@ -0,0 +1,36 @@
+"""direct messages
+
+Revision ID: 99eef7efc3cf
+Revises: 39f7bea7df8e
+Create Date: 2026-10-18 18:10:59.785218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '99eef7efc3cf'
+down_revision = '39f7bea7df8e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('direct_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.Integer(), nullable=False),
+    sa.Column('recipient_id', sa.Integer(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['recipient_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['sender_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('direct_messages', schema=None) as batch_op:
+        batch_op.create_index('ix_direct_messages_recipient_id_id', ['recipient_id', 'id'], unique=False)
+        batch_op.create_index('ix_direct_messages_sender_id_recipient_id_id', ['sender_id', 'recipient_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_table('direct_messages')
@@ -0,0 +1,32 @@
+"""calendar feed token versions
+
+Revision ID: bb3945b67398
+Revises: 1e0977926cb2
+Create Date: 2026-10-18 19:17:52.780526
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bb3945b67398'
+down_revision = '1e0977926cb2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('calendar_token_version', sa.Integer(), server_default='1', nullable=False))
+
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.create_index('ix_deletion_job_requested_by_created_at', ['requested_by', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('deletion_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_deletion_job_requested_by_created_at')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('calendar_token_version')
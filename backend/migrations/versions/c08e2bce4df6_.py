@@ -0,0 +1,32 @@
+"""widen user.password_hash for encoded KDF hashes
+
+Revision ID: c08e2bce4df6
+Revises: 41a79eede069
+Create Date: 2026-10-18 18:04:55.987060
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c08e2bce4df6'
+down_revision = '41a79eede069'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=80),
+               type_=sa.String(length=255),
+               existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('password_hash',
+               existing_type=sa.String(length=255),
+               type_=sa.String(length=80),
+               existing_nullable=False)
@@ -0,0 +1,56 @@
+"""coordinates, geohash and r-tree index for events and locations
+
+Revision ID: cc77c31d83d6
+Revises: d13dd153eb66
+Create Date: 2026-10-18 18:36:27.612714
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cc77c31d83d6'
+down_revision = 'd13dd153eb66'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index(batch_op.f('ix_event_geohash'), ['geohash'], unique=False)
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('geohash', sa.String(length=12), nullable=True))
+        batch_op.create_index(batch_op.f('ix_locations_geohash'), ['geohash'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        from app.geo import SQLITE_BACKFILL, SQLITE_DDL
+
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        op.execute(SQLITE_BACKFILL)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('event_rtree_ai', 'event_rtree_ad', 'event_rtree_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS event_rtree')
+
+    with op.batch_alter_table('locations', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_locations_geohash'))
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_event_geohash'))
+        batch_op.drop_column('geohash')
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
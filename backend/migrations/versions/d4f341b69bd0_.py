@@ -0,0 +1,41 @@
+"""private accounts and denormalized follow counts
+
+Revision ID: d4f341b69bd0
+Revises: 565a153d8539
+Create Date: 2026-10-18 18:08:17.267434
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f341b69bd0'
+down_revision = '565a153d8539'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user')}
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_private', sa.Boolean(), server_default=sa.false(), nullable=False))
+        batch_op.add_column(sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+        # Single-valued follow columns that could not represent a graph
+        for column in ('following_id', 'followers_id'):
+            if column in existing:
+                batch_op.drop_column(column)
+
+    op.execute(
+        'UPDATE "user" SET '
+        "followers_count = (SELECT COUNT(*) FROM followers WHERE followee_id = \"user\".id AND status = 'accepted'), "
+        "following_count = (SELECT COUNT(*) FROM followers WHERE follower_id = \"user\".id AND status = 'accepted')"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('following_count')
+        batch_op.drop_column('followers_count')
+        batch_op.drop_column('is_private')
@@ -0,0 +1,28 @@
+"""shared rate limit buckets
+
+Revision ID: df1ba2ae9017
+Revises: 3799ea9419e0
+Create Date: 2026-10-18 18:45:14.670925
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'df1ba2ae9017'
+down_revision = '3799ea9419e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_bucket',
+    sa.Column('key', sa.String(length=200), nullable=False),
+    sa.Column('full_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_bucket')
@@ -0,0 +1,56 @@
+import pytest
+
+from app import config, create_app, db
+
+
+@pytest.fixture
+def settings():
+    """
+    Config values the `app` fixture sets on top of `TestingConfig`. Test modules
+    override this fixture to change them.
+    """
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch, settings):
+    """An app on a fresh SQLite database of its own, without a replica."""
+    monkeypatch.setenv('FLASK_ENV', 'testing')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'nomad.db'}")
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_REPLICA_URI', None)
+    for name, value in settings.items():
+        monkeypatch.setattr(config.TestingConfig, name, value)
+    app = create_app()
+    with app.app_context():
+        # Only the primary: other tests may have registered replica metadata on the shared db
+        db.create_all(bind_key=None)
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def login():
+    """Return a helper that registers a user (if needed), logs them in and returns auth headers."""
+    def login(client, username):
+        client.post('/register', json={'username': username, 'email_address': f'{username}@example.com',
+                                       'password': 'password123'})
+        response = client.post('/login', json={'username': username, 'password': 'password123'})
+        return {'Authorization': 'Bearer ' + response.json['access_token']}
+    return login
+
+
+@pytest.fixture
+def create_itinerary():
+    """Return a helper that creates an itinerary with `events` events and returns its id."""
+    def create_itinerary(client, headers, name, events=0):
+        itinerary_id = client.post('/create-itinerary', json={'itinerary_name': name},
+                                   headers=headers).json['itinerary']
+        for n in range(events):
+            client.post(f'/itineraries/{itinerary_id}/events', headers=headers, json={
+                'event_name': f'{name} {n}', 'event_description': 'd', 'event_location': 'l', 'event_address': 'a',
+                'event_city': 'c', 'event_state': 's', 'time_of_event': f'2024-05-0{n + 1} 10:00:00',
+                'allow_conflicts': True})
+        return itinerary_id
+    return create_itinerary
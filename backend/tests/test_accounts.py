@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import OperationalError
+
+from app import accounts, db
+from app.models import User
+
+
+@pytest.fixture
+def settings():
+    return {'ADMIN_USERNAMES': ['root'], 'BULK_PROVISION_BATCH_SIZE': 2}
+
+
+def register(client, username, email_address):
+    return client.post('/register', json={'username': username, 'email_address': email_address,
+                                          'password': 'password123'})
+
+
+def test_register_is_one_insert_and_maps_duplicates(app):
+    client = app.test_client()
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert register(client, 'ana', 'ana@example.com').status_code == 201
+    assert [s.split()[0] for s in statements] == ['INSERT']
+
+    response = register(client, 'ana', 'other@example.com')
+    assert response.status_code == 409 and response.json['error'] == 'Username already exists'
+    response = register(client, 'bea', 'ana@example.com')
+    assert response.status_code == 409 and response.json['error'] == 'Email address already has a user'
+
+
+def test_admin_provisions_users_in_batches(app, login):
+    client = app.test_client()
+    headers = login(client, 'root')
+    register(client, 'taken', 'taken@example.com')
+    users = [{'username': f'emp{i}', 'email_address': f'emp{i}@corp.example', 'password': 'secret'} for i in range(5)]
+    users += [
+        {'username': 'taken', 'email_address': 'new@corp.example', 'password': 'secret'},
+        {'username': 'emp0', 'email_address': 'again@corp.example', 'password': 'secret'},
+        {'username': 'fresh', 'email_address': 'emp1@corp.example', 'password': 'secret'},
+        {'username': 'nopass', 'email_address': 'nopass@corp.example'},
+    ]
+
+    response = client.post('/admin/users', json={'users': users}, headers=headers)
+    assert response.status_code == 201
+    assert sorted(user['username'] for user in response.json['created']) == [f'emp{i}' for i in range(5)]
+    errors = {row.get('username', row.get('index')): row.get('error', row.get('errors'))
+              for row in response.json['skipped']}
+    assert errors == {'taken': 'Username already exists', 'emp0': 'Username already exists',
+                      'fresh': 'Email address already has a user', 8: {'password': 'Missing'}}
+
+    assert client.post('/login', json={'username': 'emp3', 'password': 'secret'}).status_code == 200
+    assert client.post('/admin/users', json={'users': users}, headers=login(client, 'eve')).status_code == 403
+
+
+def test_admin_provisioning_reports_database_errors(app, login, monkeypatch):
+    client = app.test_client()
+    headers = login(client, 'root')
+    provision_batch = accounts.provision_batch
+
+    def failing_batch(rows):
+        if rows[0]['username'] == 'emp2':
+            raise OperationalError('INSERT INTO user ...', {}, Exception('database is locked'))
+        return provision_batch(rows)
+
+    monkeypatch.setattr(accounts, 'provision_batch', failing_batch)
+    users = [{'username': f'emp{i}', 'email_address': f'emp{i}@corp.example', 'password': 'secret'} for i in range(4)]
+    response = client.post('/admin/users', json={'users': users}, headers=headers)
+    assert response.status_code == 500
+    assert response.json['error'] == 'Database error'
+    assert [user['username'] for user in response.json['created']] == ['emp0', 'emp1']
+
+
+def test_provision_command(app, tmp_path):
+    source = tmp_path / 'users.csv'
+    source.write_text('username,email_address,password\n'
+                      + ''.join(f'cli{i},cli{i}@corp.example,pw{i}\n' for i in range(5))
+                      + 'cli0,dup@corp.example,pw\nbroken,,pw\n')
+    result = app.test_cli_runner().invoke(args=['provision-users', str(source), '--batch-size', '2'])
+    assert result.exit_code == 0, result.output
+    assert 'Done: 5 created, 1 already existed, 1 invalid' in result.output
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(User)) == 5
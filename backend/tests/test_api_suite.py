@@ -0,0 +1,55 @@
+import pytest
+
+from app import config
+from benchmarks.api_suite import FLOWS, InProcessTarget, _Response, run_suite
+
+
+def test_every_flow_succeeds_in_process(tmp_path, monkeypatch):
+    monkeypatch.setenv('FLASK_ENV', 'testing')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "bench.db"}')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_REPLICA_URI', None)
+
+    results = run_suite(InProcessTarget(), iterations=3, warmup=1)
+
+    assert set(results) == {flow.name for flow in FLOWS}
+    for result in results.values():
+        assert result['errors'] == 0
+        assert result['requests'] == 3
+        assert result['p50_ms'] <= result['p99_ms']
+        assert result['queries_per_request'] >= 1
+
+
+class RateLimitedTarget:
+    """Answers every third request, and the login after setup, with a 429."""
+
+    queries = None
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.login_status = 200
+
+    def call(self, method, path, body, headers):
+        if path == '/login' and self.login_status != 200:
+            return _Response(self.login_status, None)
+        self.calls += 1
+        if self.calls % 3 == 0:
+            return _Response(429, None)
+        return self.inner.call(method, path, body, headers)
+
+
+def test_rate_limited_requests_are_errors_not_samples(tmp_path, monkeypatch):
+    monkeypatch.setenv('FLASK_ENV', 'testing')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "bench.db"}')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_REPLICA_URI', None)
+    target = RateLimitedTarget(InProcessTarget())
+    flows = [flow for flow in FLOWS if flow.name in ('get_profile', 'create_itinerary')]
+
+    results = run_suite(target, iterations=6, flows=flows, warmup=0)
+    for result in results.values():
+        assert result['rate_limited'] == result['errors'] == 2
+        assert result['requests'] == 4
+
+    target.login_status = 429
+    with pytest.raises(RuntimeError, match='RATE_LIMIT_ENABLED=false'):
+        run_suite(target, iterations=1, flows=flows)
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('asgiref')
+
+from flask_jwt_extended import create_access_token, create_refresh_token
+
+from app import config, db
+from app.asgi import create_asgi_app
+from app.asyncdb import async_db
+from app.models import User
+
+
+@pytest.fixture
+def asgi_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('FLASK_ENV', 'testing')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "nomad.db"}')
+    monkeypatch.setattr(config.TestingConfig, 'SQLALCHEMY_REPLICA_URI', None)
+    asgi_app = create_asgi_app()
+    with asgi_app.flask_app.app_context():
+        db.create_all()
+        db.session.add(User(username='traveler', email_address='traveler@example.com', password_hash='x'))
+        db.session.commit()
+    yield asgi_app
+    asyncio.run(async_db.dispose())
+
+
+def test_native_and_delegated_routes_agree(asgi_app):
+    with asgi_app.flask_app.app_context():
+        headers = {'Authorization': 'Bearer ' + create_access_token(identity='traveler')}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://nomad') as client:
+            # POST goes through the WSGI app, the listing is served natively
+            for name in ('lisbon', 'porto'):
+                assert (await client.post('/create-itinerary', json={'itinerary_name': name},
+                                          headers=headers)).status_code == 201
+
+            listing = await client.get('/itineraries?limit=1', headers=headers)
+            assert [itinerary['itinerary_name'] for itinerary in listing.json()] == ['porto']
+            assert listing.headers['X-Next-Cursor']
+
+            cached = await client.get('/itineraries?limit=1',
+                                      headers={**headers, 'If-None-Match': listing.headers['ETag']})
+            assert cached.status_code == 304
+
+            streamed = await client.get('/itineraries?format=ndjson', headers=headers)
+            assert streamed.text.count('\n') == 2
+
+            profile = await client.get('/get_profile', headers=headers)
+            assert profile.json()['user']['username'] == 'traveler'
+            assert (await client.get('/get_profile')).status_code == 401
+
+    asyncio.run(scenario())
+
+
+def test_native_routes_check_tokens_like_jwt_required(asgi_app):
+    with asgi_app.flask_app.app_context():
+        refresh = {'Authorization': 'Bearer ' + create_refresh_token(identity='traveler')}
+        ghost = {'Authorization': 'Bearer ' + create_access_token(identity='ghost')}
+    flask_client = asgi_app.flask_app.test_client()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://nomad') as client:
+            for headers in (refresh, ghost, {'Authorization': 'Token abc'}):
+                native = await client.get('/get_profile', headers=headers)
+                wsgi = flask_client.get('/get_profile', headers=headers)
+                assert native.status_code == wsgi.status_code != 200
+                assert native.json() == wsgi.json
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import pytest
+from flask import Flask
+
+from app.conditional import collection_etag, is_fresh, precondition_failed
+
+
+@pytest.fixture
+def settings():
+    # Compress even a single itinerary, which weakens its ETag
+    return {'COMPRESS_MIN_SIZE': 1}
+
+
+def test_collection_etag_changes_with_versions_and_cursor():
+    base = collection_etag([(1, 1), (2, 1)], 'cursor')
+    assert collection_etag([(1, 1), (2, 1)], 'cursor') == base
+    assert collection_etag([(1, 1), (2, 2)], 'cursor') != base
+    assert collection_etag([(1, 1), (2, 1)], None) != base
+    assert collection_etag([(2, 1), (1, 1)], 'cursor') != base
+
+
+def test_conditional_headers():
+    app = Flask(__name__)
+    with app.test_request_context(headers={'If-None-Match': '"user-1-2"', 'If-Match': '"itinerary-1-3"'}):
+        assert is_fresh('user-1-2')
+        assert not is_fresh('user-1-3')
+        assert not precondition_failed('itinerary-1-3')
+        assert precondition_failed('itinerary-1-4')
+    with app.test_request_context():
+        assert not precondition_failed('itinerary-1-4')
+    with app.test_request_context(headers={'If-Match': 'W/"itinerary-1-3", "itinerary-2-1-gzip"'}):
+        assert not precondition_failed('itinerary-1-3')
+        assert not precondition_failed('itinerary-2-1')
+        assert precondition_failed('itinerary-1-3-gzip1')
+
+
+def test_etag_from_get_is_accepted_by_update(app, login):
+    client = app.test_client()
+    headers = login(client, 'editor')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Lyon'}, headers=headers).json['itinerary']
+
+    plain = client.get(f'/itineraries?id={itinerary_id}', headers=headers)
+    compressed = client.get(f'/itineraries?id={itinerary_id}', headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == 'W/' + plain.headers['ETag']
+
+    update = {'id': itinerary_id, 'itinerary_name': 'Lyon 2'}
+    response = client.put('/itineraries/update', json=update,
+                          headers={**headers, 'If-Match': compressed.headers['ETag']})
+    assert response.status_code == 200
+    # The copy fetched before the update is now stale
+    response = client.put('/itineraries/update', json=update, headers={**headers, 'If-Match': plain.headers['ETag']})
+    assert response.status_code == 412
+
+    fresh = client.get(f'/itineraries?id={itinerary_id}', headers=headers)
+    assert client.put('/itineraries/update', json=update,
+                      headers={**headers, 'If-Match': fresh.headers['ETag']}).status_code == 200
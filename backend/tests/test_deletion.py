@@ -0,0 +1,146 @@
+import datetime
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app import db, deletion, likes
+from app.models import DeletionJob, DirectMessages, Event, FeedEntry, Followers, Itinerary, Likes, User
+
+
+@pytest.fixture
+def settings():
+    return {'DELETION_BATCH_SIZE': 2}
+
+
+@pytest.fixture(autouse=True)
+def manual_worker(monkeypatch):
+    # Jobs are only run when a test asks for it
+    monkeypatch.setattr(deletion.worker, 'notify', lambda: None)
+
+
+def count(model, *criteria):
+    return db.session.scalar(select(func.count()).select_from(model).where(*criteria)
+                             .execution_options(include_deleted=True))
+
+
+def test_itinerary_is_hidden_at_once_and_purged_in_batches(app, login, create_itinerary):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    kept = create_itinerary(client, headers, 'Lisbon', events=1)
+    doomed = create_itinerary(client, headers, 'Porto', events=5)
+    client.post(f'/itineraries/{doomed}/like', headers=login(client, 'fan'))
+
+    response = client.delete('/itineraries/delete', json={'id': doomed}, headers=headers)
+    assert response.status_code == 202
+    job_url = response.headers['Location']
+
+    listed = client.get('/itineraries', headers=headers).json
+    assert [itinerary['id'] for itinerary in listed] == [kept]
+    assert client.get('/itineraries?name=Porto', headers=headers).status_code == 404
+    assert client.post(f'/itineraries/{doomed}/like', headers=headers).status_code == 404
+    assert client.get(job_url, headers=headers).json['job']['status'] == DeletionJob.PENDING
+
+    with app.app_context():
+        assert count(Event, Event.itinerary_id == doomed) == 5
+        assert deletion.worker.run_pending() == 1
+        assert count(Event, Event.itinerary_id == doomed) == 0
+        assert count(Itinerary, Itinerary.id == doomed) == 0
+        assert count(Likes) == 0
+        assert count(Event) == 1
+
+    # Five events, the like, its counter row and the itinerary
+    job = client.get(job_url, headers=headers).json['job']
+    assert job['status'] == DeletionJob.DONE and job['rows_deleted'] == 8
+
+
+def test_account_deletion_purges_everything_and_fixes_counts(app, login, create_itinerary):
+    client = app.test_client()
+    headers = login(client, 'leaver')
+    friend = login(client, 'friend')
+    for n in range(3):
+        create_itinerary(client, headers, f'Trip {n}', events=3)
+    client.post('/follow', json={'username': 'leaver'}, headers=friend)
+    client.post('/follow', json={'username': 'friend'}, headers=headers)
+    friends_trip = create_itinerary(client, friend, 'Friends trip')
+    client.post(f'/itineraries/{friends_trip}/like', headers=headers)
+    client.post('/messages', json={'recipient_username': 'friend', 'body': 'bye'}, headers=headers)
+
+    assert client.delete('/delete-account', headers=headers).status_code == 202
+    assert client.post('/login', json={'username': 'leaver', 'password': 'password123'}).status_code == 404
+    assert client.get('/followers', headers=friend).json['users'] == []
+
+    with app.app_context():
+        leaver = db.session.scalar(select(User.id).where(User.username == 'leaver')
+                                   .execution_options(include_deleted=True))
+        deletion.worker.run_pending()
+
+        assert count(User, User.id == leaver) == 0
+        assert count(Itinerary) == 1 and count(Event) == 0
+        assert count(Followers) == 0 and count(FeedEntry) == 0
+        assert count(DirectMessages) == 0 and count(Likes) == 0
+        friend_row = db.session.scalar(select(User).where(User.username == 'friend'))
+        assert (friend_row.followers_count, friend_row.following_count) == (0, 0)
+    assert client.get(f'/likes?ids={friends_trip}', headers=friend).json[str(friends_trip)] == 0
+
+
+def test_jobs_of_dead_workers_are_resumed(app, login, create_itinerary):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    itinerary_id = create_itinerary(client, headers, 'Rome', events=5)
+    client.delete('/itineraries/delete', json={'id': itinerary_id}, headers=headers)
+
+    with app.app_context():
+        worker = deletion.worker
+        job = worker.claim()
+        # One batch, then the worker dies
+        deleted = deletion.STEPS[job.target_type]['events'](job.target_id, worker.batch_size)
+        job.rows_deleted += deleted
+        db.session.commit()
+        assert worker.claim() is None
+
+        job.lease_until = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        job.step = 'events'
+        db.session.commit()
+        assert worker.run_pending() == 1
+        job = db.session.get(DeletionJob, job.id, populate_existing=True)
+        assert (job.status, job.attempts, job.rows_deleted) == (DeletionJob.DONE, 2, 6)
+        assert count(Event) == 0
+
+
+def test_failed_like_batches_do_not_adjust_counts_twice(app, login, create_itinerary, monkeypatch):
+    client = app.test_client()
+    owner = login(client, 'owner')
+    fan = login(client, 'fan')
+    itinerary_id = create_itinerary(client, owner, 'Naples')
+    client.post(f'/itineraries/{itinerary_id}/like', headers=fan)
+    client.delete('/delete-account', headers=fan)
+
+    counters = likes.counters
+    monkeypatch.setattr(counters, 'interval', 60)
+    monkeypatch.setattr(counters, '_ensure_thread', lambda: None)
+    monkeypatch.setattr(counters, '_pending', defaultdict(int))
+    commit = db.session.commit
+    failures = []
+
+    def commit_or_fail_once():
+        # The batch that deleted the like fails to commit, as on a lost connection
+        if db.session.info.get(likes.UNCOMMITTED) and not failures:
+            failures.append(True)
+            raise OperationalError('COMMIT', {}, Exception('lost connection'))
+        commit()
+
+    with app.app_context():
+        job = deletion.worker.claim()
+        monkeypatch.setattr(db.session, 'commit', commit_or_fail_once)
+        with pytest.raises(OperationalError):
+            deletion.worker.process(job)
+        assert counters.pending(Likes.ITINERARY, itinerary_id) == 0
+
+        # Retried once the lease runs out: the count goes down exactly once
+        job.lease_until = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        db.session.commit()
+        assert deletion.worker.run_pending() == 1
+        assert counters.pending(Likes.ITINERARY, itinerary_id) == -1
+        assert likes.like_counts(Likes.ITINERARY, [itinerary_id]) == {itinerary_id: 0}
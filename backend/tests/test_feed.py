@@ -0,0 +1,88 @@
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app.models import FeedEntry, User
+
+
+@pytest.fixture
+def settings():
+    # Authors with more than one follower are read on demand instead of fanned out
+    return {'FEED_FANOUT_LIMIT': 1}
+
+
+def read_all(client, headers, limit):
+    names, cursor = [], None
+    while True:
+        page = client.get(f'/feed?limit={limit}' + (f'&cursor={cursor}' if cursor else ''), headers=headers).json
+        assert len(page['itineraries']) <= limit
+        names += [itinerary['itinerary_name'] for itinerary in page['itineraries']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            return names
+
+
+def test_itineraries_are_fanned_out_to_followers(app, login, create_itinerary):
+    client = app.test_client()
+    reader, author = login(client, 'reader'), login(client, 'author')
+    create_itinerary(client, author, 'Before')
+    client.post('/follow', json={'username': 'author'}, headers=reader)
+
+    first = create_itinerary(client, author, 'Oslo')
+    create_itinerary(client, author, 'Bergen')
+    assert read_all(client, reader, 10) == ['Bergen', 'Oslo']
+    with app.app_context():
+        assert db.session.scalar(select(User.fanout_on_read).where(User.username == 'author')) is False
+        assert len(db.session.scalars(select(FeedEntry)).all()) == 2
+
+    # An update moves the itinerary back to the top
+    client.put('/itineraries/update', json={'id': first, 'itinerary_name': 'Oslo again'}, headers=author)
+    assert read_all(client, reader, 10) == ['Oslo again', 'Bergen']
+
+    client.post('/unfollow', json={'username': 'author'}, headers=reader)
+    assert read_all(client, reader, 10) == []
+
+
+def test_popular_authors_are_pulled_and_paged_with_pushed_entries(app, login, create_itinerary):
+    client = app.test_client()
+    reader, other = login(client, 'reader'), login(client, 'other')
+    small, big = login(client, 'small'), login(client, 'big')
+    for follower in (reader, other):
+        client.post('/follow', json={'username': 'big'}, headers=follower)
+    client.post('/follow', json={'username': 'small'}, headers=reader)
+
+    expected = []
+    for n in range(3):
+        for name, headers in (('small', small), ('big', big)):
+            create_itinerary(client, headers, f'{name} {n}')
+            expected.insert(0, f'{name} {n}')
+
+    with app.app_context():
+        assert db.session.scalar(select(User.fanout_on_read).where(User.username == 'big')) is True
+        # Only the small author's itineraries were copied into timelines
+        assert {entry.author_id for entry in db.session.scalars(select(FeedEntry))} == {
+            db.session.scalar(select(User.id).where(User.username == 'small'))}
+
+    for limit in (1, 2, 4, 50):
+        assert read_all(client, reader, limit) == expected
+    assert read_all(client, other, 2) == [name for name in expected if name.startswith('big')]
+    assert client.get('/feed?cursor=bogus', headers=reader).status_code == 400
+
+
+def test_entries_copied_before_switching_to_pull_are_not_shown_twice(app, login, create_itinerary):
+    client = app.test_client()
+    reader, author = login(client, 'reader'), login(client, 'author')
+    client.post('/follow', json={'username': 'author'}, headers=reader)
+    first = create_itinerary(client, author, 'Oslo')
+    create_itinerary(client, author, 'Bergen')
+
+    client.post('/follow', json={'username': 'author'}, headers=login(client, 'other'))
+    create_itinerary(client, author, 'Tromso')
+    client.put('/itineraries/update', json={'id': first, 'itinerary_name': 'Oslo again'}, headers=author)
+
+    with app.app_context():
+        assert db.session.scalar(select(User.fanout_on_read).where(User.username == 'author')) is True
+        # The entries copied while the author was small are kept
+        assert len(db.session.scalars(select(FeedEntry)).all()) == 2
+    for limit in (1, 2, 10):
+        assert sorted(read_all(client, reader, limit)) == ['Bergen', 'Oslo again', 'Tromso']
@@ -0,0 +1,89 @@
+def profile(client, headers):
+    return client.get('/get_profile', headers=headers).json['user']
+
+
+def counts(client, headers):
+    user = profile(client, headers)
+    return user['followers_count'], user['following_count']
+
+
+def test_follow_and_unfollow_keep_counts(app, login):
+    client = app.test_client()
+    alice, bob = login(client, 'alice'), login(client, 'bob')
+
+    assert client.post('/follow', json={'username': 'bob'}, headers=alice).status_code == 201
+    assert client.post('/follow', json={'username': 'bob'}, headers=alice).status_code == 409
+    assert client.post('/follow', json={'username': 'alice'}, headers=alice).status_code == 400
+    assert client.post('/follow', json={'username': 'ghost'}, headers=alice).status_code == 404
+    assert counts(client, alice) == (0, 1) and counts(client, bob) == (1, 0)
+    assert [user['username'] for user in client.get('/followers', headers=bob).json['users']] == ['alice']
+
+    assert client.post('/unfollow', json={'username': 'bob'}, headers=alice).status_code == 200
+    assert client.post('/unfollow', json={'username': 'bob'}, headers=alice).status_code == 404
+    assert counts(client, alice) == (0, 0) and counts(client, bob) == (0, 0)
+
+
+def test_follow_requests_are_accepted_or_denied(app, login):
+    client = app.test_client()
+    alice, bob, carol = login(client, 'alice'), login(client, 'bob'), login(client, 'carol')
+    client.put('/update_profile', json={'is_private': True}, headers=bob)
+
+    assert client.post('/follow', json={'username': 'bob'}, headers=alice).status_code == 403
+    assert client.post('/request', json={'username': 'bob'}, headers=alice).status_code == 202
+    assert client.post('/request', json={'username': 'bob'}, headers=carol).status_code == 202
+    assert client.post('/request', json={'username': 'carol'}, headers=alice).status_code == 400
+    pending = client.get('/followers?status=pending', headers=bob).json['users']
+    assert {user['username'] for user in pending} == {'alice', 'carol'}
+    assert counts(client, bob) == (0, 0)
+
+    accept = {'username': 'alice', 'action': 'accept'}
+    assert client.put('/request', json=accept, headers=bob).status_code == 200
+    assert client.put('/request', json=accept, headers=bob).status_code == 404
+    assert client.put('/request', json={'username': 'carol', 'action': 'deny'}, headers=bob).status_code == 200
+    assert client.put('/request', json={'username': 'carol', 'action': 'ignore'}, headers=bob).status_code == 400
+    assert counts(client, bob) == (1, 0) and counts(client, alice) == (0, 1) and counts(client, carol) == (0, 0)
+    assert client.get('/following?status=pending', headers=carol).json['users'] == []
+
+
+def test_going_public_accepts_pending_requests(app, login):
+    client = app.test_client()
+    alice, bob = login(client, 'alice'), login(client, 'bob')
+    client.put('/update_profile', json={'is_private': True}, headers=bob)
+    client.post('/request', json={'username': 'bob'}, headers=alice)
+
+    assert client.put('/update_profile', json={'is_private': 'false'}, headers=bob).status_code == 400
+    assert client.put('/update_profile', json={'is_private': 0}, headers=bob).status_code == 400
+    assert profile(client, bob)['is_private'] is True
+
+    assert client.put('/update_profile', json={'is_private': False}, headers=bob).status_code == 200
+    assert profile(client, bob)['is_private'] is False
+    assert client.get('/followers?status=pending', headers=bob).json['users'] == []
+    assert counts(client, bob) == (1, 0) and counts(client, alice) == (0, 1)
+
+
+def test_following_check_and_pagination(app, login):
+    client = app.test_client()
+    fan = login(client, 'fan')
+    ids = {}
+    for n in range(5):
+        headers = login(client, f'star{n}')
+        ids[f'star{n}'] = profile(client, headers)['id']
+        client.post('/follow', json={'username': f'star{n}'}, headers=fan)
+    client.post('/unfollow', json={'username': 'star2'}, headers=fan)
+
+    check = client.get(f"/following/check?ids={ids['star1']},{ids['star2']}", headers=fan).json
+    assert check == {str(ids['star1']): True, str(ids['star2']): False}
+    assert client.get('/following/check?ids=a', headers=fan).status_code == 400
+    assert client.get('/following/check', headers=fan).status_code == 400
+
+    seen, cursor = [], None
+    while True:
+        page = client.get('/following?limit=2' + (f'&cursor={cursor}' if cursor else ''), headers=fan).json
+        assert len(page['users']) <= 2
+        seen += [user['username'] for user in page['users']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == ['star4', 'star3', 'star1', 'star0']
+    assert client.get('/following?cursor=bogus', headers=fan).status_code == 400
+    assert client.get('/following?status=blocked', headers=fan).status_code == 400
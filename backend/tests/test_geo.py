@@ -0,0 +1,138 @@
+import json
+import math
+import re
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from app import db, geo
+from app.models import Event
+
+PARIS = (48.8566, 2.3522)
+
+
+def add_events(client, headers, points):
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'trip'}, headers=headers).json['itinerary']
+    body = '\n'.join(json.dumps({
+        'event_name': name, 'event_description': 'd', 'event_location': 'l', 'event_address': 'a',
+        'event_city': 'c', 'event_state': 's', 'latitude': latitude, 'longitude': longitude})
+        for name, (latitude, longitude) in points.items())
+    response = client.post(f'/itineraries/{itinerary_id}/events:bulk', data=body,
+                           content_type='application/x-ndjson', headers=headers)
+    assert response.status_code == 201
+
+
+def test_geohash_encoding():
+    assert geo.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geo.encode(*PARIS).startswith('u09tvw')
+
+
+def test_haversine_matches_known_distance():
+    london = (51.5074, -0.1278)
+    assert geo.haversine_km(*PARIS, [london[0]], [london[1]])[0] == pytest.approx(343.5, abs=1)
+
+
+def test_bounding_boxes_split_at_the_antimeridian():
+    boxes = geo.bounding_boxes(0.0, 179.99, 10)
+    assert len(boxes) == 2
+    assert boxes[0][3] == 180.0 and boxes[1][2] == -180.0
+    assert geo.bounding_boxes(89.99, 0, 10)[0][2:] == (-180.0, 180.0)
+
+
+def test_covering_cells_contain_the_whole_box():
+    box = geo.bounding_boxes(*PARIS, 3)[0]
+    cells = geo.covering_cells(box)
+    assert len(cells) <= geo.MAX_COVER_CELLS
+    for latitude in (box[0], box[1]):
+        for longitude in (box[2], box[3]):
+            assert any(geo.encode(latitude, longitude).startswith(cell) for cell in cells)
+
+
+def test_nearby_events_are_ranked_by_distance(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    add_events(client, headers, {
+        'louvre': (48.8606, 2.3376), 'eiffel': (48.8584, 2.2945), 'versailles': (48.8049, 2.1204),
+        'lyon': (45.7640, 4.8357)})
+    add_events(client, login(client, 'other'), {'notre-dame': (48.8530, 2.3499)})
+
+    response = client.get(f'/events/nearby?lat={PARIS[0]}&lon={PARIS[1]}&radius=10', headers=headers)
+    assert response.status_code == 200
+    assert [event['event_name'] for event in response.json] == ['notre-dame', 'louvre', 'eiffel']
+    assert response.json[1]['distance_km'] == pytest.approx(1.16, abs=0.05)
+
+    response = client.get(f'/events/nearby?lat={PARIS[0]}&lon={PARIS[1]}&radius=50&limit=1', headers=headers)
+    assert [event['event_name'] for event in response.json] == ['notre-dame']
+
+    assert client.get('/events/nearby?lat=100&lon=0', headers=headers).status_code == 400
+
+
+def test_geohash_prefilter_agrees_with_the_rtree(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    add_events(client, headers, {f'p{n}': (48.80 + n * 0.01, 2.30 + n * 0.007) for n in range(20)})
+
+    with app.app_context():
+        def candidates(dialect):
+            statement = geo.candidate_statement(*PARIS, 4, 1, dialect=dialect)
+            return sorted(row.id for row in db.session.execute(statement))
+
+        # The geohash ranges are plain SQL, so they can be checked against the R*Tree on SQLite
+        assert candidates('postgresql') == candidates('sqlite')
+        assert 0 < len(candidates('sqlite')) < 20
+
+
+def _locale_key(value):
+    # Like glibc's en_US.UTF-8: punctuation is ignored on the first pass
+    return re.sub(r'[^0-9a-z]', '', value.lower()), value
+
+
+def _compare(left, right):
+    return (_locale_key(left) > _locale_key(right)) - (_locale_key(left) < _locale_key(right))
+
+
+@pytest.fixture
+def locale_collation(monkeypatch):
+    """Give `event.geohash` a collation that is not bytewise, as PostgreSQL's default usually is not."""
+    def register(connection, record):
+        connection.create_collation('locale', _compare)
+
+    event.listen(Pool, 'connect', register)
+    monkeypatch.setattr(Event.__table__.c.geohash.type, 'collation', 'locale')
+    yield
+    event.remove(Pool, 'connect', register)
+
+
+def test_cell_ranges_hold_under_a_locale_collation():
+    assert geo.cell_range('u4pr') == ('u4pr', 'u4ps')
+    assert geo.cell_range('u4pz') == ('u4pz', 'u4q')
+    assert geo.cell_range('zz') == ('zz', None)
+
+    hashes = [geo.encode(57.0 + n * 0.013, 10.0 + n * 0.017) for n in range(200)]
+    for cell in ('u4pr', 'u4pz', 'u4', 'u1z'):
+        lower, upper = geo.cell_range(cell)
+        for geohash in hashes:
+            inside = _locale_key(lower) <= _locale_key(geohash) < _locale_key(upper)
+            assert inside == geohash.startswith(cell)
+
+
+def test_geohash_prefilter_agrees_under_a_locale_collation(locale_collation, app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    add_events(client, headers, {f'p{n}': (48.80 + n * 0.01, 2.30 + n * 0.007) for n in range(20)})
+
+    with app.app_context():
+        def candidates(dialect):
+            statement = geo.candidate_statement(*PARIS, 4, 1, dialect=dialect)
+            return sorted(row.id for row in db.session.execute(statement))
+
+        assert candidates('postgresql') == candidates('sqlite')
+        assert 0 < len(candidates('sqlite')) < 20
+
+
+def test_distances_without_numpy(monkeypatch):
+    expected = [float(distance) for distance in geo.haversine_km(0, 0, [0, 1], [1, 0])]
+    monkeypatch.setattr(geo, 'numpy', None)
+    assert geo.haversine_km(0, 0, [0, 1], [1, 0]) == pytest.approx(expected)
+    assert expected[0] == pytest.approx(2 * math.pi * geo.EARTH_RADIUS_KM / 360)
@@ -0,0 +1,115 @@
+import datetime
+
+from sqlalchemy import update
+
+from app import db, ics
+from app.models import Itinerary
+
+
+def add_event(client, headers, itinerary_id, name, start, **extra):
+    response = client.post(f'/itineraries/{itinerary_id}/events', headers=headers, json={
+        'event_name': name, 'event_description': 'Dinner; then drinks, maybe', 'event_location': 'Cafe',
+        'event_address': '1 Main St', 'event_city': 'Lisbon', 'event_state': 'PT', 'time_of_event': start,
+        **extra})
+    assert response.status_code == 201
+
+
+def test_escape_and_fold():
+    assert ics.escape('a,b;c\\d\ne') == r'a\,b\;c\\d\ne'
+    folded = ics.fold('SUMMARY:' + 'é' * 80)
+    lines = folded.split('\r\n')
+    assert all(len(line.encode()) <= 75 for line in lines)
+    assert ''.join(line[1:] if index else line for index, line in enumerate(lines)) == 'SUMMARY:' + 'é' * 80
+
+
+def test_itinerary_export_is_cached_and_conditional(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Lisbon'}, headers=headers).json['itinerary']
+    add_event(client, headers, itinerary_id, 'Dinner', '2024-05-01 19:00:00', ends_at='2024-05-01 21:00:00',
+              latitude=38.71, longitude=-9.14)
+
+    response = client.get(f'/itineraries/{itinerary_id}.ics', headers=headers)
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200 and response.mimetype == 'text/calendar'
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert 'DTSTART:20240501T190000Z\r\nDTEND:20240501T210000Z\r\n' in body
+    assert r'DESCRIPTION:Dinner\; then drinks\, maybe' + '\r\n' in body
+    assert 'GEO:38.710000;-9.140000\r\n' in body
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    # The rendered document is cached under its ETag
+    assert ics.rendered.get(etag.strip('"')) == body.encode()
+    assert client.get(f'/itineraries/{itinerary_id}.ics', headers=headers).get_data(as_text=True) == body
+    assert client.get(f'/itineraries/{itinerary_id}.ics', headers={**headers, 'If-None-Match': etag}).status_code == 304
+    assert client.get(f'/itineraries/{itinerary_id}.ics',
+                      headers={**headers, 'If-Modified-Since': last_modified}).status_code == 304
+
+    add_event(client, headers, itinerary_id, 'Fado', '2024-05-02 22:00:00')
+    response = client.get(f'/itineraries/{itinerary_id}.ics', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200 and 'SUMMARY:Fado' in response.get_data(as_text=True)
+
+    assert client.get(f'/itineraries/{itinerary_id}.ics', headers=login(client, 'other')).status_code == 404
+
+
+def test_subscription_feed(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    first = client.post('/create-itinerary', json={'itinerary_name': 'Lisbon'}, headers=headers).json['itinerary']
+    second = client.post('/create-itinerary', json={'itinerary_name': 'Porto'}, headers=headers).json['itinerary']
+    add_event(client, headers, first, 'Dinner', '2024-05-01 19:00:00')
+    add_event(client, headers, second, 'Wine tasting', '2024-05-03 15:00:00')
+
+    url = client.get('/calendar/subscription', headers=headers).json['url']
+    path = url.split('localhost', 1)[1]
+    response = client.get(path)
+    body = response.get_data(as_text=True)
+    assert body.count('BEGIN:VEVENT') == 2
+    assert 'CATEGORIES:Porto' in body and 'REFRESH-INTERVAL;VALUE=DURATION:PT60M' in body
+
+    assert client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    client.delete('/itineraries/delete', json={'id': second}, headers=headers)
+    response = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200 and response.get_data(as_text=True).count('BEGIN:VEVENT') == 1
+
+    assert client.get('/calendar/forged.ics').status_code == 404
+
+
+def test_deleting_an_itinerary_moves_the_feed_last_modified(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    first = client.post('/create-itinerary', json={'itinerary_name': 'Lisbon'}, headers=headers).json['itinerary']
+    client.post('/create-itinerary', json={'itinerary_name': 'Porto'}, headers=headers)
+    with app.app_context():
+        yesterday = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        db.session.execute(update(Itinerary).values(created_at=yesterday, updated_at=yesterday))
+        db.session.commit()
+
+    path = client.get('/calendar/subscription', headers=headers).json['url'].split('localhost', 1)[1]
+    last_modified = client.get(path).headers['Last-Modified']
+    assert client.get(path, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+    client.delete('/itineraries/delete', json={'id': first}, headers=headers)
+    response = client.get(path, headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 200 and 'CATEGORIES:Lisbon' not in response.get_data(as_text=True)
+    assert response.headers['Last-Modified'] != last_modified
+
+
+def test_rotating_the_subscription_revokes_the_old_url(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    old = client.get('/calendar/subscription', headers=headers).json['url'].split('localhost', 1)[1]
+    assert client.get(old).status_code == 200
+
+    rotated = client.post('/calendar/subscription/rotate', headers=headers).json
+    new = rotated['url'].split('localhost', 1)[1]
+    assert rotated['webcal_url'].startswith('webcal://') and new != old
+    assert client.get(old).status_code == 404
+    assert client.get(new).status_code == 200
+    assert client.get('/calendar/subscription', headers=headers).json['url'] == rotated['url']
+
+    # URLs issued before tokens were versioned keep working until the first rotation
+    with app.app_context():
+        legacy = ics._serializer().dumps(1)
+        assert ics.feed_claims(legacy) == (1, 1)
+        assert ics.feed_claims(ics._serializer().dumps('1')) is None
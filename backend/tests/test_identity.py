@@ -0,0 +1,69 @@
+from sqlalchemy import update
+
+from app import db
+from app.identity import TTLCache, user_cache
+from app.models import User
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set('bob', {'id': 1})
+
+    timer.now = 4.9
+    assert cache.get('bob') == {'id': 1}
+    timer.now = 5.0
+    assert cache.get('bob') is None
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+def test_pop_invalidates():
+    cache = TTLCache()
+    cache.set('bob', 1)
+
+    assert cache.pop('bob') == 1
+    assert cache.get('bob') is None
+
+def test_password_hashes_are_not_cached(app, login):
+    client = app.test_client()
+    headers = login(client, 'bob')
+    assert client.get('/get_profile', headers=headers).status_code == 200
+    assert 'password_hash' not in user_cache.get('bob')
+
+    # The hash of a user rebuilt from the cache is loaded when it is needed
+    assert client.put('/change_password', headers=headers,
+                      json={'current_password': 'wrong', 'new_password': 'secret456'}).status_code == 401
+    assert client.put('/change_password', headers=headers,
+                      json={'current_password': 'password123', 'new_password': 'secret456'}).status_code == 200
+    assert client.post('/login', json={'username': 'bob', 'password': 'secret456'}).status_code == 200
+
+def test_changes_made_by_other_workers_are_seen_after_the_ttl(app, login, monkeypatch):
+    timer = FakeTimer()
+    monkeypatch.setattr(user_cache, 'timer', timer)
+    client = app.test_client()
+    headers = login(client, 'bob')
+    assert client.get('/get_profile', headers=headers).status_code == 200
+
+    # Another worker renames bob without clearing this worker's cache
+    with app.app_context():
+        db.session.execute(update(User).where(User.username == 'bob').values(username='robert'))
+        db.session.commit()
+    assert client.get('/get_profile', headers=headers).status_code == 200
+
+    timer.now = app.config['IDENTITY_CACHE_TTL']
+    assert client.get('/get_profile', headers=headers).status_code == 404
@@ -0,0 +1,34 @@
+import io
+import pytest
+from app.ingest import UnsupportedFormat, iter_rows, validate_event
+
+ROW = {
+    'event_name': 'Louvre', 'event_description': 'Museum', 'event_location': 'Louvre',
+    'event_address': 'Rue de Rivoli', 'event_city': 'Paris', 'event_state': 'IDF',
+    'time_of_event': '2024-01-05 10:00:00',
+}
+
+def test_ndjson_rows_report_parse_errors_by_line():
+    body = io.BytesIO(b'{"event_name": "a"}\n\n{broken\n[1]\n')
+    rows = list(iter_rows(body, 'application/x-ndjson'))
+
+    assert rows == [(1, {'event_name': 'a'}, None), (3, None, 'Invalid JSON'), (4, None, 'Expected a JSON object')]
+
+def test_csv_rows_use_the_header():
+    body = io.BytesIO(b'event_name,event_city\nLouvre,Paris\n')
+
+    assert list(iter_rows(body, 'text/csv')) == [(2, {'event_name': 'Louvre', 'event_city': 'Paris'}, None)]
+
+def test_unsupported_format():
+    with pytest.raises(UnsupportedFormat):
+        iter_rows(io.BytesIO(b''), 'text/plain')
+
+def test_validate_event():
+    values = validate_event(ROW, 7)
+    assert values['itinerary_id'] == 7
+    assert values['time_of_event'].hour == 10
+
+    with pytest.raises(ValueError, match='event_city is required'):
+        validate_event({**ROW, 'event_city': ''}, 7)
+    with pytest.raises(ValueError, match='at most 80'):
+        validate_event({**ROW, 'event_name': 'x' * 81}, 7)
@@ -0,0 +1,50 @@
+import datetime
+import gzip
+
+import pytest
+from flask import Flask, jsonify
+
+from app import compression
+from app.jsonprovider import FastJSONProvider, orjson
+
+ENCODERS = ['stdlib'] + (['orjson'] if orjson is not None else [])
+
+
+@pytest.mark.parametrize('encoder', ENCODERS)
+def test_encoders_agree(encoder):
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app, encoder)
+    payload = {'b': datetime.datetime(2024, 1, 5, 18, 29, 52, 151895), 'a': datetime.date(2024, 1, 5)}
+
+    with app.app_context():
+        body = jsonify(payload).get_data()
+
+        counts = app.json.loads(app.json.dumps({12: 1, 7: 2}))
+
+    assert body == b'{"a":"2024-01-05","b":"2024-01-05T18:29:52.151895"}\n'
+    assert counts == {'12': 1, '7': 2}
+
+
+def test_large_responses_are_compressed():
+    app = Flask(__name__)
+    app.config['COMPRESS_MIN_SIZE'] = 100
+    compression.init_app(app)
+
+    @app.route('/big')
+    def big():
+        response = jsonify(['x' * 10] * 100)
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify(['x'])
+
+    client = app.test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == 'W/"abc"'
+    plain = client.get('/big')
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
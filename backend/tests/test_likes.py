@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from app import db, likes
+from app.models import Comments, LikeCounter, Likes, User
+
+
+@pytest.fixture
+def buffered(monkeypatch):
+    """Buffer like counts instead of writing them through, without a flush thread."""
+    monkeypatch.setattr(likes.counters, 'interval', 60)
+    monkeypatch.setattr(likes.counters, '_ensure_thread', lambda: None)
+    monkeypatch.setattr(likes.counters, '_pending', defaultdict(int))
+    return likes.counters
+
+
+def test_like_and_unlike_are_idempotent(app, login, create_itinerary):
+    client = app.test_client()
+    owner = login(client, 'owner')
+    fan = login(client, 'fan')
+    itinerary_id = create_itinerary(client, owner, 'Vienna')
+    url = f'/itineraries/{itinerary_id}/like'
+
+    assert client.post(url, headers=fan).json == {'liked': True, 'changed': True, 'likes': 1}
+    assert client.post(url, headers=fan).json == {'liked': True, 'changed': False, 'likes': 1}
+    assert client.post(url, headers=owner).json['likes'] == 2
+    assert client.delete(url, headers=fan).json == {'liked': False, 'changed': True, 'likes': 1}
+    assert client.delete(url, headers=fan).json == {'liked': False, 'changed': False, 'likes': 1}
+    assert client.post('/itineraries/999/like', headers=fan).status_code == 404
+
+
+def test_only_visible_targets_can_be_liked(app, login, create_itinerary):
+    client = app.test_client()
+    owner, fan, stranger = login(client, 'owner'), login(client, 'fan'), login(client, 'stranger')
+    client.put('/update_profile', json={'is_private': True}, headers=owner)
+    itinerary_id = create_itinerary(client, owner, 'Salzburg')
+    with app.app_context():
+        owner_id = db.session.scalar(select(User.id).where(User.username == 'owner'))
+        db.session.add(Comments(id=7, user_id=owner_id))
+        db.session.commit()
+
+    client.post('/request', json={'username': 'owner'}, headers=fan)
+    client.post('/request', json={'username': 'owner'}, headers=stranger)
+    client.put('/request', json={'username': 'fan', 'action': 'accept'}, headers=owner)
+
+    for url in (f'/itineraries/{itinerary_id}/like', '/comments/7/like'):
+        assert client.post(url, headers=stranger).status_code == 404
+        assert client.post(url, headers=fan).status_code == 200
+        assert client.post(url, headers=owner).json['likes'] == 2
+
+
+def test_counts_are_read_for_many_targets_at_once(app, login, create_itinerary):
+    client = app.test_client()
+    owner = login(client, 'owner')
+    first, second = create_itinerary(client, owner, 'Graz'), create_itinerary(client, owner, 'Linz')
+    for username in ('a', 'b', 'c'):
+        client.post(f'/itineraries/{first}/like', headers=login(client, username))
+    with app.app_context():
+        db.session.add(Comments(id=7, user_id=1))
+        db.session.commit()
+    client.post('/comments/7/like', headers=owner)
+
+    assert client.get(f'/likes?ids={first},{second}', headers=owner).json == {str(first): 3, str(second): 0}
+    assert client.get('/likes?type=comment&ids=7', headers=owner).json == {'7': 1}
+    assert client.get('/likes?ids=x', headers=owner).status_code == 400
+    assert client.get('/likes?type=event&ids=1', headers=owner).status_code == 400
+
+
+def test_buffered_deltas_count_only_once_committed(app, buffered):
+    with app.app_context():
+        assert likes.like(1, Likes.ITINERARY, 5) and likes.like(2, Likes.ITINERARY, 5)
+        assert buffered.pending(Likes.ITINERARY, 5) == 0
+        db.session.commit()
+        assert buffered.pending(Likes.ITINERARY, 5) == 2
+
+        # A rolled back unlike leaves the count alone
+        assert likes.unlike(1, Likes.ITINERARY, 5)
+        db.session.rollback()
+        assert buffered.pending(Likes.ITINERARY, 5) == 2
+        likes.unlike(1, Likes.ITINERARY, 5)
+        db.session.commit()
+        assert likes.like_counts(Likes.ITINERARY, [5]) == {5: 1}
+
+        assert buffered.flush() == 1
+        assert buffered.pending(Likes.ITINERARY, 5) == 0
+        assert db.session.scalar(select(LikeCounter.count)) == 1
+        assert likes.like_counts(Likes.ITINERARY, [5]) == {5: 1}
+
+
+def test_failed_commit_does_not_move_the_count(app, login, create_itinerary, buffered, monkeypatch):
+    client = app.test_client()
+    owner = login(client, 'owner')
+    itinerary_id = create_itinerary(client, owner, 'Salzburg')
+    url = f'/itineraries/{itinerary_id}/like'
+    assert client.post(url, headers=owner).json['likes'] == 1
+
+    def fail():
+        raise OperationalError('COMMIT', {}, Exception('lost connection'))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.session, 'commit', fail)
+        assert client.delete(url, headers=owner).status_code == 500
+    assert buffered.pending(Likes.ITINERARY, itinerary_id) == 1
+    assert client.delete(url, headers=owner).json == {'liked': False, 'changed': True, 'likes': 0}
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from app import messageRoutes, messaging
+from app.messaging import QUEUE_SIZE, REPLAY, Hub, PostgresBackend, notify_payload
+
+
+def test_dispatch_reaches_only_the_recipients_streams():
+    hub = Hub()
+    first, second = hub.subscribe(1), hub.subscribe(1)
+    other = hub.subscribe(2)
+
+    hub.dispatch(1, {'id': 10})
+
+    assert first.get(timeout=0) == {'id': 10}
+    assert second.get(timeout=0) == {'id': 10}
+    assert other.get(timeout=0) is None
+
+def test_slow_streams_are_flagged_instead_of_blocking():
+    hub = Hub()
+    subscription = hub.subscribe(1)
+
+    for message_id in range(QUEUE_SIZE + 1):
+        hub.dispatch(1, {'id': message_id})
+
+    assert subscription.overflowed
+
+def test_closed_streams_are_forgotten():
+    hub = Hub()
+    subscription = hub.subscribe(1)
+    subscription.close()
+
+    hub.dispatch(1, {'id': 10})
+    assert subscription.get(timeout=0) is None
+
+def test_oversized_notifications_are_sent_by_id():
+    small = {'id': 1, 'body': 'hi'}
+    assert json.loads(notify_payload(7, small)) == {'recipient_id': 7, 'message': small}
+    # 5000 characters, but 20000 bytes once encoded
+    assert json.loads(notify_payload(7, {'id': 2, 'body': '\U0001F30D' * 5000})) == {'recipient_id': 7, 'message_id': 2}
+
+    backend = PostgresBackend(Hub())
+    subscription = backend.hub.subscribe(7)
+    backend._dispatch(notify_payload(7, {'id': 2, 'body': '\U0001F30D' * 5000}))
+    assert subscription.overflowed and subscription.get(timeout=0) is REPLAY
+
+
+def read_events(stream, count):
+    """Read SSE frames until `count` message events arrived, skipping the retry and keep-alive frames."""
+    events = []
+    for chunk in stream:
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if chunk.startswith('id: '):
+            fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+            events.append((int(fields['id']), json.loads(fields['data'])['body']))
+            if len(events) == count:
+                return events
+    return events
+
+
+@pytest.fixture
+def settings():
+    return {'MESSAGE_BACKEND': 'memory'}
+
+
+def send(client, headers, body, to='reader'):
+    return client.post('/messages', json={'recipient_username': to, 'body': body}, headers=headers)
+
+
+def test_stream_delivers_new_messages_and_resumes_after_last_event_id(app, login, monkeypatch):
+    monkeypatch.setattr(messageRoutes, 'HEARTBEAT_INTERVAL', 0.01)
+    client = app.test_client()
+    reader = login(client, 'reader')
+    writer = login(client, 'writer')
+    first = send(client, writer, 'before').json['message']['id']
+
+    # A fresh stream starts from now
+    response = client.get('/messages/stream', headers=reader, buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    stream = response.response
+    second = send(client, writer, 'live').json['message']['id']
+    assert read_events(stream, 1) == [(second, 'live')]
+    response.close()
+
+    third = send(client, writer, 'missed').json['message']['id']
+    # Reconnecting replays what came after the last event seen, then goes live
+    response = client.get('/messages/stream', headers={**reader, 'Last-Event-ID': str(first)}, buffered=False)
+    stream = response.response
+    assert read_events(stream, 2) == [(second, 'live'), (third, 'missed')]
+    fourth = send(client, writer, 'again').json['message']['id']
+    assert read_events(stream, 1) == [(fourth, 'again')]
+    response.close()
+
+    token = reader['Authorization'].split()[1]
+    response = client.get(f'/messages/stream?jwt={token}&last_event_id={third}', buffered=False)
+    assert read_events(response.response, 1) == [(fourth, 'again')]
+    response.close()
+
+
+def test_invalid_messages_are_rejected(app, login):
+    client = app.test_client()
+    writer = login(client, 'writer')
+    login(client, 'reader')
+    assert send(client, writer, {'text': 'hi'}).status_code == 400
+    assert send(client, writer, 'x' * 5001).status_code == 400
+    assert send(client, writer, 'hi', to=['reader']).status_code == 400
+    assert send(client, writer, 'hi', to='nobody').status_code == 404
+
+
+def test_publish_failures_do_not_fail_a_saved_message(app, login, monkeypatch):
+    client = app.test_client()
+    sender = login(client, 'sender')
+    inbox = login(client, 'inbox')
+
+    def fail(message):
+        raise RuntimeError('NOTIFY failed')
+
+    monkeypatch.setattr(messaging, 'publish', fail)
+    assert send(client, sender, 'saved', to='inbox').status_code == 201
+    assert [message['body'] for message in client.get('/messages?with=sender', headers=inbox).json['messages']] \
+        == ['saved']
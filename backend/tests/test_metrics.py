@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import event, select
+
+from app import db, metrics, slowlog
+from app.models import User
+
+SCRAPER = {'Authorization': 'Bearer scrape-me'}
+
+
+@pytest.fixture
+def settings():
+    return {'N_PLUS_ONE_THRESHOLD': 3, 'METRICS_TOKEN': 'scrape-me'}
+
+
+@pytest.fixture
+def app(app):
+    @app.route('/test/n-plus-one')
+    def n_plus_one():
+        for user_id in range(5):
+            db.session.scalar(select(User).where(User.id == user_id))
+        return {'ok': True}
+
+    metrics.reset()
+    return app
+
+
+def test_histogram_exposition():
+    histogram = metrics.Histogram('test_seconds', 'Test.', ('endpoint',), (0.1, 1.0))
+    histogram.observe(0.05, 'a"b')
+    histogram.observe(5, 'a"b')
+
+    assert histogram.expose() == [
+        '# HELP test_seconds Test.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{endpoint="a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{endpoint="a\\"b",le="1.0"} 1',
+        'test_seconds_bucket{endpoint="a\\"b",le="+Inf"} 2',
+        'test_seconds_sum{endpoint="a\\"b"} 5.05',
+        'test_seconds_count{endpoint="a\\"b"} 2',
+    ]
+
+
+def test_queries_are_counted_per_endpoint(app):
+    client = app.test_client()
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = client.post('/login', json={'username': 'nobody', 'password': 'password123'})
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    timing = response.headers['Server-Timing']
+    assert 'db;desc="1 queries"' in timing
+    # The slowest statement is named by its slow query log fingerprint
+    assert f'db-slowest;desc="{slowlog.fingerprint(slowlog.normalize(statements[0]))}";dur=' in timing
+    body = client.get('/metrics', headers=SCRAPER).get_data(as_text=True)
+    assert 'nomad_db_queries_per_request_count{endpoint="auth.login_user"} 1' in body
+    assert 'nomad_db_queries_per_request_bucket{endpoint="auth.login_user",le="1"} 1' in body
+    assert 'nomad_request_duration_seconds_count{endpoint="auth.login_user",method="POST"} 1' in body
+
+
+def test_repeated_statements_are_flagged(app, caplog):
+    client = app.test_client()
+    client.get('/test/n-plus-one')
+    client.post('/login', json={'username': 'nobody', 'password': 'password123'})
+
+    body = client.get('/metrics', headers=SCRAPER).get_data(as_text=True)
+    assert 'nomad_n_plus_one_total{endpoint="n_plus_one"} 1' in body
+    assert 'auth.login_user' not in body.split('nomad_n_plus_one_total')[-1]
+    assert 'Possible N+1 in n_plus_one: statement ran 5 times' in caplog.text
+
+
+def test_metrics_require_the_token(app):
+    client = app.test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers=SCRAPER).status_code == 200
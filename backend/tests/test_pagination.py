@@ -0,0 +1,19 @@
+import datetime
+import pytest
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor, parse_limit
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2024, 1, 5, 18, 29, 52, 151895)
+    cursor = encode_cursor(created_at, 42)
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+def test_invalid_cursor():
+    with pytest.raises(InvalidCursor):
+        decode_cursor('not-a-cursor')
+
+def test_parse_limit_is_clamped():
+    assert parse_limit(None) == 50
+    assert parse_limit('0') == 1
+    assert parse_limit('10000', maximum=200) == 200
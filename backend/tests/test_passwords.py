@@ -0,0 +1,70 @@
+import hashlib
+import os
+import threading
+
+import pytest
+
+from sqlalchemy import update
+
+from app import db, passwords
+from app.models import User
+from app.passwords import HashingPool, hash_password, verify_password
+
+def test_pbkdf2_hash_round_trip():
+    encoded = hash_password('password123', 'pbkdf2_sha256', iterations=1000)
+
+    assert encoded.startswith('pbkdf2_sha256$1000$')
+    assert verify_password('password123', encoded)
+    assert not verify_password('password124', encoded)
+
+def test_scrypt_hash_round_trip():
+    encoded = hash_password('password123', 'scrypt', n=2 ** 10, r=8, p=1)
+
+    assert encoded.startswith('scrypt$1024$8$1$')
+    assert verify_password('password123', encoded)
+    assert not verify_password('password124', encoded)
+
+def test_legacy_sha256_hashes_verify_and_need_rehash():
+    legacy = hashlib.sha256(b'password123').hexdigest()
+    pool = HashingPool()
+    pool.configure({'PASSWORD_HASH_ITERATIONS': 1000, 'HASH_POOL_WORKERS': 0})
+
+    assert verify_password('password123', legacy)
+    assert pool.needs_rehash(legacy)
+    assert pool.needs_rehash(hash_password('password123', 'pbkdf2_sha256', iterations=500))
+    assert not pool.needs_rehash(pool.hash('password123'))
+
+@pytest.mark.parametrize('encoded', [
+    'pbkdf2_sha256$1000$c2FsdA',
+    'pbkdf2_sha256$many$c2FsdA$aGFzaA',
+    'scrypt$1024$8$c2FsdA$aGFzaA',
+    'scrypt$0$8$1$c2FsdA$aGFzaA',
+    'pbkdf2_sha256$1000$c2Fsd$aGFzaA',
+])
+def test_malformed_hashes_do_not_verify(encoded):
+    assert not verify_password('password123', encoded)
+    assert HashingPool().needs_rehash(encoded)
+
+def test_login_against_a_malformed_hash_is_refused(app, login):
+    client = app.test_client()
+    login(client, 'bob')
+    with app.app_context():
+        db.session.execute(update(User).values(password_hash='pbkdf2_sha256$x'))
+        db.session.commit()
+
+    response = client.post('/login', json={'username': 'bob', 'password': 'password123'})
+    assert response.status_code == 401
+
+def test_saturated_pool_returns_503(app, monkeypatch):
+    # A pool with one worker whose only slot is taken
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(passwords.pool, 'workers', 1)
+    monkeypatch.setattr(passwords.pool, '_executor', object())
+    monkeypatch.setattr(passwords.pool, '_pid', os.getpid())
+    monkeypatch.setattr(passwords.pool, '_slots', slots)
+
+    response = app.test_client().post('/register', json={
+        'username': 'bob', 'email_address': 'bob@example.com', 'password': 'password123'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
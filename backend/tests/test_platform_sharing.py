@@ -0,0 +1,110 @@
+from sqlalchemy import event, func, select
+
+from app import db, deletion
+from app.models import ItineraryShare, Notification, User
+from app.notifications import queue
+
+
+def add_users(app, count):
+    with app.app_context():
+        db.session.add_all(User(username=f'user{n}', email_address=f'user{n}@example.com', password_hash='x')
+                           for n in range(count))
+        db.session.commit()
+    return [f'user{n}' for n in range(count)]
+
+
+def count_statements(app, call):
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        response = call()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    return response, len(statements)
+
+
+def test_sharing_takes_the_same_queries_for_any_number_of_recipients(app, monkeypatch, login):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Kyoto'}, headers=headers).json['itinerary']
+    usernames = add_users(app, 60)
+    # Queued notifications are written after the request, not by it
+    monkeypatch.setattr(queue, 'interval', 60)
+    monkeypatch.setattr(queue, '_ensure_thread', lambda: None)
+
+    url = f'/itineraries/{itinerary_id}/share/platform'
+    one, few = count_statements(app, lambda: client.post(url, json={'recipients': usernames[:1]}, headers=headers))
+    many, lots = count_statements(app, lambda: client.post(url, json={'recipients': usernames[1:]}, headers=headers))
+    assert one.status_code == many.status_code == 200
+    assert len(many.json['shared']) == 59
+    assert few == lots
+
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(ItineraryShare)) == 60
+        assert queue.flush() == 60
+
+
+def test_shares_are_reported_and_notifications_coalesced(app, login):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    reader = login(client, 'reader')
+    first, second = (client.post('/create-itinerary', json={'itinerary_name': name}, headers=headers).json['itinerary']
+                     for name in ('Oslo', 'Bergen'))
+
+    queue.interval = 60
+    try:
+        response = client.post(f'/itineraries/{first}/share/platform', headers=headers,
+                               json={'recipients': ['reader', 'ghost', 'reader']})
+        assert response.json['shared'] == ['reader'] and response.json['not_found'] == ['ghost']
+        again = client.post(f'/itineraries/{first}/share/platform', headers=headers,
+                            json={'recipient_username': 'reader'})
+        assert again.status_code == 200 and again.json['already_shared'] == ['reader']
+        link = client.post(f'/itineraries/{second}/share/link', headers=headers,
+                           json={'share_type': 'platform', 'recipients': ['reader']})
+        assert link.json['shared'] == ['reader']
+        with app.app_context():
+            assert queue.flush() == 1
+    finally:
+        queue.interval = 0
+
+    inbox = client.get('/notifications', headers=reader).json['notifications']
+    assert len(inbox) == 1
+    assert inbox[0]['kind'] == Notification.ITINERARY_SHARED and inbox[0]['count'] == 2
+    assert [item['itinerary_name'] for item in inbox[0]['data']['items']] == ['Oslo', 'Bergen']
+
+    shared = client.get('/itineraries/shared', headers=reader).json['itineraries']
+    assert [itinerary['itinerary_name'] for itinerary in shared] == ['Bergen', 'Oslo']
+    assert {itinerary['owner'] for itinerary in shared} == {'owner'}
+
+
+def test_sharing_is_limited_to_the_owner_and_known_users(app, login):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    stranger = login(client, 'stranger')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Nice'}, headers=headers).json['itinerary']
+    url = f'/itineraries/{itinerary_id}/share/platform'
+
+    assert client.post(url, json={'recipients': ['owner']}, headers=stranger).status_code == 404
+    assert client.post(url, json={'recipients': []}, headers=headers).status_code == 400
+    assert client.post(url, json={'recipients': 'stranger'}, headers=headers).status_code == 400
+    assert client.post(url, json={'recipients': ['ghost']}, headers=headers).status_code == 404
+    assert client.post(url, json={'recipients': ['owner']}, headers=headers).status_code == 404
+
+
+def test_deleting_the_itinerary_removes_its_shares(app, login):
+    client = app.test_client()
+    headers = login(client, 'owner')
+    reader = login(client, 'reader')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Riga'}, headers=headers).json['itinerary']
+    client.post(f'/itineraries/{itinerary_id}/share/platform', json={'recipients': ['reader']}, headers=headers)
+
+    client.delete('/itineraries/delete', json={'id': itinerary_id}, headers=headers)
+    assert client.get('/itineraries/shared', headers=reader).json['itineraries'] == []
+    client.delete('/delete-account', headers=reader)
+    with app.app_context():
+        deletion.worker.run_pending()
+        assert db.session.scalar(select(func.count()).select_from(ItineraryShare)) == 0
+        assert db.session.scalar(select(func.count()).select_from(Notification)) == 0
@@ -0,0 +1,66 @@
+import pytest
+
+from app import ratelimit
+
+
+@pytest.fixture(params=['memory', 'database'])
+def settings(request):
+    return {'RATE_LIMIT_ENABLED': True, 'RATE_LIMIT_BACKEND': request.param,
+            'RATE_LIMIT_LOGIN_PER_IP': '5/minute', 'RATE_LIMIT_LOGIN_PER_USERNAME': '3/minute'}
+
+
+@pytest.fixture
+def app(app):
+    yield app
+    ratelimit.limiter.enabled = False
+
+
+def test_parse_limit():
+    limit = ratelimit.parse_limit('100/15minutes')
+    assert (limit.count, limit.period, limit.interval) == (100, 900.0, 9.0)
+    assert ratelimit.parse_limit('5/hour').period == 3600
+    with pytest.raises(ValueError):
+        ratelimit.parse_limit('5 per minute')
+
+
+def test_memory_store_refills_and_sweeps_idle_keys(monkeypatch):
+    now = [1000.0]
+    store = ratelimit.MemoryStore(sweep_interval=10)
+    monkeypatch.setattr(store, 'clock', lambda: now[0])
+    limit = ratelimit.Limit(2, 10)
+
+    assert store.hit([('a', limit)]) == 0 and store.hit([('a', limit)]) == 0
+    assert store.hit([('a', limit)]) == pytest.approx(5.0)
+    now[0] += 5
+    assert store.hit([('a', limit), ('b', limit)]) == 0
+    assert len(store) == 2
+
+    now[0] += 20
+    store.hit([('c', limit)])
+    assert len(store) == 1
+
+
+def test_login_is_limited_per_username_then_per_ip(app):
+    client = app.test_client()
+    client.post('/register', json={'username': 'target', 'email_address': 't@example.com', 'password': 'right'})
+
+    statuses = [client.post('/login', json={'username': 'target', 'password': 'wrong'}).status_code
+                for _ in range(4)]
+    assert statuses == [401, 401, 401, 429]
+
+    # The rejected attempt used up one of the IP's attempts but none of the next username's
+    assert client.post('/login', json={'username': 'nobody', 'password': 'x'}).status_code == 404
+    response = client.post('/login', json={'username': 'someone', 'password': 'x'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_other_clients_cannot_lock_an_account_out(app):
+    client = app.test_client()
+    client.post('/register', json={'username': 'target', 'email_address': 't@example.com', 'password': 'right'})
+    attacker = {'REMOTE_ADDR': '203.0.113.9'}
+
+    statuses = [client.post('/login', json={'username': 'target', 'password': 'wrong'},
+                            environ_base=attacker).status_code for _ in range(4)]
+    assert statuses == [401, 401, 401, 429]
+    assert client.post('/login', json={'username': 'target', 'password': 'right'}).status_code == 200
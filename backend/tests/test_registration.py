@@ -1,5 +1,5 @@
 import pytest
-from app.__init__ import create_app, db
+from app import create_app, db
 from flask import json
 
 @pytest.fixture
@@ -0,0 +1,53 @@
+import shutil
+import time
+
+import pytest
+
+from app import db, routing
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+            'SQLALCHEMY_REPLICA_URI': f"sqlite:///{tmp_path / 'replica.db'}"}
+
+
+@pytest.fixture
+def app(app):
+    with app.app_context():
+        db.create_all()
+    routing.recent_writers.clear()
+    return app
+
+
+def test_reads_follow_writes_then_move_to_replica(app, tmp_path, login):
+    client = app.test_client()
+    headers = login(client, 'writer')
+    shutil.copy(tmp_path / 'primary.db', tmp_path / 'replica.db')
+
+    assert client.post('/create-itinerary', json={'itinerary_name': 'fresh'}, headers=headers).status_code == 201
+    # Sticky: the writer reads their own write from the primary
+    assert client.get('/itineraries', headers=headers).status_code == 200
+
+    # The cookie keeps it sticky on a worker that never saw the write
+    routing.recent_writers.clear()
+    assert client.get('/itineraries', headers=headers).status_code == 200
+
+    # Once the sticky window is over, reads go to the replica, which has not seen the itinerary yet
+    with app.app_context():
+        expired = routing._serializer().dumps(time.time() - 1)
+    client.set_cookie(routing.PRIMARY_COOKIE, expired)
+    assert client.get('/itineraries', headers=headers).status_code == 404
+
+    # A forged cookie is ignored
+    client.set_cookie(routing.PRIMARY_COOKIE, 'forged')
+    assert client.get('/itineraries', headers=headers).status_code == 404
+
+
+def test_engine_options_per_dialect():
+    settings = {'DB_POOL_SIZE': 3, 'DB_STATEMENT_TIMEOUT_MS': 500}
+
+    postgres = routing.engine_options('postgresql://localhost/nomad', settings)
+    assert postgres['pool_size'] == 3
+    assert postgres['connect_args'] == {'options': '-c statement_timeout=500'}
+    assert 'pool_size' not in routing.engine_options('sqlite://', settings)
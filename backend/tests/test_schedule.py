@@ -0,0 +1,102 @@
+import datetime
+import itertools
+import json
+import random
+
+from app import db, schedule
+from app.models import Event, Itinerary, User
+
+FIELDS = {'event_description': 'd', 'event_location': 'l', 'event_address': 'a', 'event_city': 'c',
+          'event_state': 's'}
+
+
+def create(client, headers, itinerary_id, name, start, end=None, **extra):
+    return client.post(f'/itineraries/{itinerary_id}/events', headers=headers, json={
+        'event_name': name, 'time_of_event': start, 'ends_at': end, **FIELDS, **extra})
+
+
+def test_overlapping_events_are_rejected_across_itineraries(app, login):
+    client = app.test_client()
+    headers = login(client, 'planner')
+    first = client.post('/create-itinerary', json={'itinerary_name': 'a'}, headers=headers).json['itinerary']
+    second = client.post('/create-itinerary', json={'itinerary_name': 'b'}, headers=headers).json['itinerary']
+
+    assert create(client, headers, first, 'lunch', '2024-05-01 12:00:00', '2024-05-01 13:00:00').status_code == 201
+    response = create(client, headers, second, 'museum', '2024-05-01 12:30:00', '2024-05-01 14:00:00')
+    assert response.status_code == 409
+    assert [event['event_name'] for event in response.json['conflicts']] == ['lunch']
+
+    # Back to back is fine; the same start slot is not, even for an instant
+    assert create(client, headers, second, 'walk', '2024-05-01 13:00:00', '2024-05-01 14:00:00').status_code == 201
+    assert create(client, headers, second, 'call', '2024-05-01 12:00:00').status_code == 409
+    assert create(client, headers, second, 'call', '2024-05-01 12:00:00', allow_conflicts=True).status_code == 201
+
+    assert create(client, headers, second, 'bad', '2024-05-01 12:00:00', '2024-05-01 11:00:00').status_code == 400
+
+    walk = next(event for event in client.get(f'/itineraries?id={second}', headers=headers).json[0]['events']
+                if event['event_name'] == 'walk')
+    response = client.put(f"/events/{walk['id']}", headers=headers, json={'time_of_event': '2024-05-01 12:45:00'})
+    assert response.status_code == 409
+    response = client.put(f"/events/{walk['id']}", headers=headers, json={'event_name': 'stroll'})
+    assert response.status_code == 200 and response.json['event']['event_name'] == 'stroll'
+
+
+def test_overlap_check_uses_the_time_index(app):
+    with app.app_context():
+        start = datetime.datetime(2024, 1, 1)
+        plan = db.session.execute(db.text(
+            'EXPLAIN QUERY PLAN SELECT event.id FROM event JOIN itinerary ON itinerary.id = event.itinerary_id '
+            'WHERE itinerary.user_id = 1 AND event.time_of_event BETWEEN :low AND :high'),
+            {'low': start - schedule.MAX_EVENT_DURATION, 'high': start}).all()
+        assert any('ix_event_itinerary_id_time_of_event' in row[3] and 'time_of_event>' in row[3] for row in plan)
+
+
+def test_sweep_matches_pairwise_comparison(app):
+    rng = random.Random(3)
+    base = datetime.datetime(2024, 1, 1)
+    with app.app_context():
+        user = User(username='busy', email_address='busy@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        itineraries = [Itinerary(user_id=user.id, itinerary_name=f'trip {n}') for n in range(3)]
+        db.session.add_all(itineraries)
+        db.session.flush()
+        events = []
+        for n in range(300):
+            start = base + datetime.timedelta(minutes=15 * rng.randrange(2000))
+            end = start + datetime.timedelta(minutes=15 * rng.randrange(0, 12)) if rng.random() < 0.8 else None
+            events.append(Event(itinerary_id=rng.choice(itineraries).id, event_name=f'e{n}', time_of_event=start,
+                                ends_at=end, **FIELDS))
+        db.session.add_all(events)
+        db.session.commit()
+
+        def overlaps(a, b):
+            a_end, b_end = a.ends_at or a.time_of_event, b.ends_at or b.time_of_event
+            return (a.time_of_event < b_end and b.time_of_event < a_end) or a.time_of_event == b.time_of_event
+
+        expected = {frozenset((a.id, b.id)) for a, b in itertools.combinations(events, 2) if overlaps(a, b)}
+        found = [frozenset((first['id'], second['id'])) for first, second in schedule.sweep_conflicts(user.id)]
+
+        assert expected and len(found) == len(set(found)) and set(found) == expected
+        for event in events[:20]:
+            conflicts = schedule.overlapping_events(user.id, event.time_of_event, event.ends_at,
+                                                    exclude_id=event.id, limit=1000)
+            assert {other.id for other in conflicts} == {
+                other.id for other in events if other.id != event.id and overlaps(event, other)}
+
+
+def test_conflicts_endpoint_streams_pairs(app, login):
+    client = app.test_client()
+    headers = login(client, 'planner')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'a'}, headers=headers).json['itinerary']
+    create(client, headers, itinerary_id, 'one', '2024-05-01 12:00:00', '2024-05-01 13:00:00')
+    create(client, headers, itinerary_id, 'two', '2024-05-01 12:30:00', allow_conflicts=True)
+    create(client, headers, itinerary_id, 'three', '2024-06-01 12:00:00')
+
+    response = client.get('/schedule/conflicts', headers=headers)
+    assert [(pair['first']['event_name'], pair['second']['event_name']) for pair in response.json] == [('one', 'two')]
+
+    response = client.get('/schedule/conflicts?format=ndjson&since=2024-05-20 00:00:00', headers=headers)
+    assert response.get_data(as_text=True) == ''
+    lines = client.get('/schedule/conflicts?format=ndjson', headers=headers).get_data(as_text=True).splitlines()
+    assert json.loads(lines[0])['second']['event_name'] == 'two'
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Itinerary
+from app.search import search_itineraries
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            Itinerary(user_id=1, itinerary_name='Paris weekend'),
+            Itinerary(user_id=1, itinerary_name='Rome 100% food'),
+            Itinerary(user_id=2, itinerary_name='Paris with friends'),
+        ])
+        session.commit()
+        yield session
+
+def names(session, user_id, term):
+    query = search_itineraries(select(Itinerary.itinerary_name), user_id, term, dialect='sqlite')
+    return session.scalars(query).all()
+
+def test_search_is_case_insensitive_and_scoped_to_user(session):
+    assert names(session, 1, 'paris') == ['Paris weekend']
+    assert names(session, 2, 'PARIS') == ['Paris with friends']
+
+def test_search_index_follows_updates(session):
+    itinerary = session.scalars(select(Itinerary).filter_by(itinerary_name='Paris weekend')).one()
+    itinerary.itinerary_name = 'Lisbon weekend'
+    session.commit()
+
+    assert names(session, 1, 'paris') == []
+    assert names(session, 1, 'lisbon') == ['Lisbon weekend']
+
+def test_short_terms_and_wildcards_are_literal(session):
+    assert names(session, 1, '0%') == ['Rome 100% food']
+    assert names(session, 1, '%') == ['Rome 100% food']
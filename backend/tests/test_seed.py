@@ -0,0 +1,46 @@
+import random
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Event, FeedEntry, Followers, Itinerary, User
+from app.seed import follow_edges, sampler
+
+
+def test_samplers_are_deterministic_and_non_negative():
+    for distribution in ('constant', 'uniform', 'poisson', 'pareto'):
+        first, second = sampler(distribution, 5, random.Random(1)), sampler(distribution, 5, random.Random(1))
+        first = [first() for _ in range(20)]
+        assert [second() for _ in range(20)] == first
+        assert all(value >= 0 for value in first)
+
+
+def test_skew_concentrates_followers_on_the_first_users():
+    edges = list(follow_edges(list(range(1, 201)), lambda: 5, 1.5, random.Random(0)))
+    followees = [followee for _, followee in edges]
+
+    assert all(follower != followee for follower, followee in edges)
+    assert len(set(edges)) == len(edges)
+    assert followees.count(1) > followees.count(200) * 10
+
+
+def test_seed_command(app):
+    result = app.test_cli_runner().invoke(args=[
+        'seed', '--users', '50', '--itineraries-per-user', '2', '--events-per-itinerary', '3',
+        '--follows-per-user', '4', '--private-fraction', '0.2', '--batch-size', '40'])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(User)) == 50
+        assert db.session.scalar(select(func.count()).select_from(Itinerary)) > 0
+        assert db.session.scalar(select(func.count()).select_from(Event)) > 0
+        # Stored counts agree with the accepted edges
+        accepted = db.session.scalar(select(func.count()).select_from(Followers)
+                                     .where(Followers.status == Followers.ACCEPTED))
+        assert db.session.scalar(select(func.sum(User.followers_count))) == accepted
+        assert db.session.scalar(select(func.count()).select_from(FeedEntry)) > 0
+
+    # Seeded users can log in and their rows are readable through the API
+    client = app.test_client()
+    token = client.post('/login', json={'username': 'user1', 'password': 'password'}).json['access_token']
+    assert client.get('/get_profile', headers={'Authorization': f'Bearer {token}'}).status_code == 200
@@ -0,0 +1,67 @@
+import datetime
+
+from sqlalchemy import event
+
+from app import db, sharing
+
+
+def test_tokens_are_signed_and_expire(app):
+    with app.test_request_context():
+        future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        token = sharing.share_token(7, future)
+        assert sharing.shared_itinerary_id(token) == 7
+        assert sharing.shared_itinerary_id(token[:-2] + ('A' if token[-2] != 'A' else 'B') + token[-1]) is None
+        assert sharing.shared_itinerary_id(sharing.share_token(7, future - datetime.timedelta(hours=2))) is None
+
+
+def test_shared_link_serves_cached_snapshots(app, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Kyoto'}, headers=headers).json['itinerary']
+    client.post(f'/itineraries/{itinerary_id}/events', headers=headers, json={
+        'event_name': '<Temple>', 'event_description': 'd', 'event_location': 'l', 'event_address': 'a',
+        'event_city': 'Kyoto', 'event_state': 'K', 'time_of_event': '2024-04-01 09:00:00'})
+
+    link = client.post(f'/itineraries/{itinerary_id}/share/link', json={'share_type': 'link', 'expires_in_days': 7},
+                       headers=headers).json['link']
+    path = link.split('localhost', 1)[1]
+
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.json['itinerary_name'] == 'Kyoto' and response.json['owner'] == 'traveller'
+    assert response.json['events'][0]['event_name'] == '<Temple>'
+
+    # Hot links are answered from the snapshot without any SQL
+    queries = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: queries.append(args[2]))
+    page = client.get(path, headers={'Accept': 'text/html'})
+    assert page.mimetype == 'text/html' and '&lt;Temple&gt;' in page.get_data(as_text=True)
+    assert client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert queries == []
+
+    # A change drops the snapshot
+    client.put('/itineraries/update', json={'id': itinerary_id, 'itinerary_name': 'Kyoto in spring'}, headers=headers)
+    assert client.get(path).json['itinerary_name'] == 'Kyoto in spring'
+
+    client.delete('/itineraries/delete', json={'id': itinerary_id}, headers=headers)
+    assert client.get(path).status_code == 404
+    assert client.get('/shared/not-a-token').status_code == 404
+
+
+def test_snapshots_are_revalidated_after_their_ttl(app, monkeypatch, login):
+    client = app.test_client()
+    headers = login(client, 'traveller')
+    itinerary_id = client.post('/create-itinerary', json={'itinerary_name': 'Rome'}, headers=headers).json['itinerary']
+    path = client.post(f'/itineraries/{itinerary_id}/share/link', json={'share_type': 'link'},
+                       headers=headers).json['link'].split('localhost', 1)[1]
+    client.get(path)
+
+    # A write the cache did not see, e.g. from another worker
+    with app.app_context():
+        db.session.execute(db.text('UPDATE itinerary SET itinerary_name = :name, version = version + 1'),
+                           {'name': 'Roma'})
+        db.session.commit()
+    assert client.get(path).json['itinerary_name'] == 'Rome'
+    monkeypatch.setitem(app.config, 'SHARE_SNAPSHOT_TTL', 0)
+    assert client.get(path).json['itinerary_name'] == 'Roma'
@@ -0,0 +1,58 @@
+import pytest
+
+from app import slowlog
+
+
+@pytest.fixture
+def settings(tmp_path):
+    # Every statement counts as slow
+    return {'SLOW_QUERY_THRESHOLD_MS': 1e-6, 'SLOW_QUERY_LOG': str(tmp_path / 'logs' / 'slow.log')}
+
+
+@pytest.fixture
+def app(app):
+    yield app
+    slowlog.recorder.configure({}, None)
+
+
+def test_normalize_replaces_literals_placeholders_and_lists():
+    statement = """SELECT * FROM "user"  WHERE id IN (?, ?, ?) AND name = 'O''Brien'
+        AND age > 30 AND email = %(email)s AND created_at::date = :day"""
+
+    assert slowlog.normalize(statement) == (
+        'SELECT * FROM "user" WHERE id IN (...) AND name = ? AND age > ? AND email = ? AND created_at::date = ?')
+    assert slowlog.fingerprint(slowlog.normalize('SELECT 1 WHERE a IN (?, ?)')) == \
+        slowlog.fingerprint(slowlog.normalize('SELECT 2 WHERE a IN (?, ?, ?, ?)'))
+
+
+def test_parameter_values_are_logged_only_on_request():
+    parameters = ('bob', 3, None, 'x' * 300)
+
+    assert slowlog._parameters(parameters, False) == ['<str>', '<int>', None, '<str>']
+    assert slowlog._parameters([{'name': 'bob'}], True) == {'name': '<str>'}
+    logged = slowlog._parameters(parameters, False, values=True)
+    assert logged[:3] == ['bob', 3, None] and len(logged[3]) == slowlog.MAX_PARAMETER_LENGTH + 3
+
+
+def test_slow_statements_are_logged_with_plan_and_rolled_up(app, tmp_path):
+    client = app.test_client()
+    for _ in range(3):
+        client.post('/login', json={'username': 'nobody', 'password': 'password123'})
+
+    entries = list(slowlog.read_log(str(tmp_path / 'logs' / 'slow.log')))
+    logins = [entry for entry in entries if entry['route'] == 'POST /login (auth.login_user)']
+    assert len(logins) == 3
+    # Parameter values stay out of the log unless asked for
+    assert logins[0]['parameters'][0] == '<str>'
+    assert 'nobody' not in (tmp_path / 'logs' / 'slow.log').read_text()
+    # The plan is captured once per fingerprint
+    assert any('user' in line for line in logins[0]['plan'])
+    assert 'plan' not in logins[1]
+
+    group = next(group for group in slowlog.rollup(entries) if group['fingerprint'] == logins[0]['fingerprint'])
+    assert group['count'] == 3
+    assert group['routes'] == ['auth.login_user']
+
+    result = app.test_cli_runner().invoke(args=['slow-queries', '--sort', 'count'])
+    assert result.exit_code == 0
+    assert logins[0]['fingerprint'] in result.output